@@ -0,0 +1,200 @@
+"""
+End-to-end benchmarks of the filter and inversion preparation stages
+
+Every stage runs alone in a fresh Python process on a dataset of
+`synthetic.py`, so the peak RSS read from `wait4` belongs to that stage
+only. Caches written by earlier runs (`dist_records.idx`, `curves.cache`)
+are removed first, the timings are cold runs.
+
+Examples:
+    ```bash
+    python benchmarks/synthetic.py bench_data --events 500 --stations 200
+    python benchmarks/bench.py bench_data --json results.json
+    # later, after a change
+    python benchmarks/bench.py bench_data --baseline results.json
+    ```
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+REGION = [172.0, 179.0, -42.0, -34.0]
+PERIODS = [20.0, 25.0, 30.0, 40.0, 50.0, 60.0, 80.0, 100.0]
+THRESHOLD = {"snr": 10, "tmisfit": 8, "nsta": 10, "valid_ratio": 0.3, "dist": 3000}
+# stage is slower than the baseline by more than this ratio
+REGRESSION = 1.2
+
+
+def bench_pathfile(data: Path, out: Path) -> int:
+    from tpwt._core import make_pathfile
+
+    make_pathfile(str(data / "events.csv"), str(data / "stations.csv"), str(out / "pf"))
+    return _sizes(data)["events"] * _sizes(data)["stations"]
+
+
+def bench_cor_pred_files(data: Path, out: Path) -> int:
+    from tpwt._core import make_cor_pred_files
+
+    make_cor_pred_files(str(data / "GDM52_dispersion.out"), str(out / "path"))
+    return _sizes(data)["records"]
+
+
+def bench_ph_amp_files(data: Path, out: Path) -> int:
+    _ph_amp_files(data, out)
+    return _sizes(data)["records"] * len(PERIODS)
+
+
+def bench_eqlist(data: Path, out: Path) -> int:
+    from tpwt.config import TPWTRegion
+    from tpwt.inversion.iterate.eqlist import make_eqlist
+
+    region = TPWTRegion(_region_dict(), 0.5)
+    make_eqlist(
+        data / "SAC",
+        pd.read_csv(data / "events.csv"),
+        pd.read_csv(data / "stations.csv"),
+        region,
+        THRESHOLD["nsta"],
+        out / "eqlist",
+    )
+    return _sizes(data)["events"]
+
+
+def bench_gridnode(data: Path, out: Path) -> int:
+    from tpwt.config import TPWTRegion
+    from tpwt.inversion.iterate.grid_nodes import make_gridnode
+
+    region = TPWTRegion(_region_dict(), 0.1)
+    make_gridnode(region, region.dgrids(), out / "inverse_node")
+    return sum(1 for _ in (out / "inverse_node").open()) - 7
+
+
+def bench_grid(data: Path, out: Path) -> tuple:
+    """ph and amp surfaces of one period from the `{event}.ph.csv` files,
+    these are picked first and not timed"""
+    from tpwt.inversion.filter.surface import grid_ph_csv
+
+    ph_csvs = _ph_amp_files(data, out, periods=PERIODS[:1])
+    start = time.perf_counter()
+    for ph_csv in ph_csvs:
+        grid_ph_csv(ph_csv, REGION)
+    return len(ph_csvs), time.perf_counter() - start
+
+
+BENCHES = {
+    "pathfile": (bench_pathfile, "pairs"),
+    "cor_pred_files": (bench_cor_pred_files, "pairs"),
+    "ph_amp_files": (bench_ph_amp_files, "records"),
+    "eqlist": (bench_eqlist, "events"),
+    "gridnode": (bench_gridnode, "nodes"),
+    "grid": (bench_grid, "events"),
+}
+
+
+def run_bench(name: str, data: Path) -> dict:
+    """run one benchmark in a child process, wall time and peak RSS"""
+    out = data / "bench_out" / name
+    shutil.rmtree(out, ignore_errors=True)
+    out.mkdir(parents=True)
+    _clear_caches(data)
+
+    args = [sys.executable, __file__, str(data), "--child", name]
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+    stdout = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"benchmark {name} failed")
+
+    result = json.loads(stdout.strip().splitlines()[-1])
+    return {
+        "bench": name,
+        "seconds": result["seconds"],
+        "items": result["items"],
+        "unit": BENCHES[name][1],
+        "per_second": result["items"] / max(result["seconds"], 1e-9),
+        "cpu_seconds": usage.ru_utime + usage.ru_stime,
+        "max_rss_mb": usage.ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("data", type=Path, help="dataset of synthetic.py")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHES), default=None)
+    parser.add_argument("--json", type=Path, help="save the results")
+    parser.add_argument("--baseline", type=Path, help="compare to saved results")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    data = args.data.resolve()
+    if args.child:
+        _child(args.child, data)
+        return
+
+    results = [run_bench(name, data) for name in args.only or BENCHES]
+    table = pd.DataFrame(results).set_index("bench")
+    if args.baseline:
+        baseline = pd.DataFrame(json.loads(args.baseline.read_text()))
+        table["baseline_s"] = baseline.set_index("bench")["seconds"]
+        table["ratio"] = table["seconds"] / table["baseline_s"]
+    print(table.to_string(float_format="%.3f"))
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    if args.baseline and (table["ratio"] > REGRESSION).any():
+        slow = table.index[table["ratio"] > REGRESSION].to_list()
+        sys.exit(f"slower than the baseline: {', '.join(slow)}")
+
+
+###############################################################################
+
+
+def _child(name: str, data: Path):
+    out = data / "bench_out" / name
+    start = time.perf_counter()
+    result = BENCHES[name][0](data, out)
+    seconds = time.perf_counter() - start
+    # benchmarks with an untimed setup return their own timing
+    items, seconds = result if isinstance(result, tuple) else (result, seconds)
+    print(json.dumps({"items": items, "seconds": seconds}))
+
+
+def _ph_amp_files(data: Path, out: Path, periods=PERIODS) -> list:
+    from tpwt._core import make_ph_amp_files
+
+    make_ph_amp_files(
+        str(data / "events.csv"),
+        str(data / "stations.csv"),
+        str(data / "SAC"),
+        str(out / "ph"),
+        periods,
+        **THRESHOLD,
+        ref_sta=[(REGION[0] + REGION[1]) / 2, (REGION[2] + REGION[3]) / 2],
+    )
+    return sorted((out / "ph").rglob("*.ph.csv"))
+
+
+def _clear_caches(data: Path):
+    (data / "SAC" / "dist_records.idx").unlink(missing_ok=True)
+    for cache in (data / "SAC").glob("*/curves.cache"):
+        cache.unlink()
+
+
+def _region_dict() -> dict:
+    return dict(zip(["west", "east", "south", "north"], REGION, strict=True))
+
+
+def _sizes(data: Path) -> dict:
+    return json.loads((data / "sizes.json").read_text())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Synthetic TPWT dataset of any size
+
+Writes the inputs of every filter stage without real waveforms:
+
+    {out}/events.csv, {out}/stations.csv
+    {out}/GDM52_dispersion.out               predictions of all pairs
+    {out}/SAC/{evt}/{evt}.{sta}.LHZ.sac      header with dist, short noise trace
+    {out}/SAC/{evt}/{evt}.{sta}.LHZ.sac_1_DISP.0
+    {out}/SAC/{evt}/{evt}.{sta}.LHZ.sac_snr.yyj.txt
+    {out}/SAC/{evt}/filelist
+    {out}/sizes.json                         numbers of events, stations, records
+
+Stations are spread over the region, events are teleseismic. Phase
+velocities follow a smooth reference curve with a small perturbation
+per record, so the phase picking keeps most records.
+
+Examples:
+    ```bash
+    python benchmarks/synthetic.py bench_data --events 100 --stations 50
+    ```
+"""
+
+import argparse
+import json
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0
+# same as aftan's tmin, tmax and the spectral SNR grid
+PERIODS = 10.0 * 1.05 ** np.arange(67)
+# fields of the 632-byte SAC header by word index
+SAC_FLOATS = {"delta": 0, "b": 5, "stla": 31, "stlo": 32, "evla": 35, "evlo": 36}
+SAC_DIST, SAC_NVHDR, SAC_NPTS = 50, 76, 79
+
+
+def make_dataset(
+    out_dir,
+    n_events: int = 100,
+    n_stations: int = 50,
+    region=(172.0, 179.0, -42.0, -34.0),
+    coverage: float = 0.8,
+    npts: int = 256,
+    seed: int = 0,
+) -> dict:
+    """write a synthetic dataset
+
+    Parameters:
+        out_dir: output dir
+        n_events: number of events
+        n_stations: number of stations
+        region: [west, east, south, north] of the stations
+        coverage: fraction of the stations recording each event
+        npts: samples of every SAC trace
+        seed: random seed, the same seed gives the same dataset
+
+    Returns:
+        sizes of the dataset, `events`, `stations` and `records`
+    """
+    out_dir = Path(out_dir)
+    sac_dir = out_dir / "SAC"
+    sac_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    stations = _stations(rng, n_stations, region)
+    events = _events(rng, n_events, region)
+    stations.to_csv(out_dir / "stations.csv", index=False)
+    events.to_csv(out_dir / "events.csv", index=False)
+
+    records = 0
+    with (out_dir / "GDM52_dispersion.out").open("w") as pred:
+        for i, evt in enumerate(events.itertuples(), 1):
+            recorded = stations[rng.random(n_stations) < coverage]
+            dist = _distance(evt.latitude, evt.longitude, recorded)
+            _write_event(rng, sac_dir / evt.code, evt, recorded, dist, npts)
+            _write_predictions(pred, i, evt, recorded)
+            records += len(recorded)
+
+    sizes = {"events": n_events, "stations": n_stations, "records": records}
+    (out_dir / "sizes.json").write_text(json.dumps(sizes))
+    return sizes
+
+
+def reference_phv(periods) -> np.ndarray:
+    """smooth Rayleigh-like phase velocity in km/s"""
+    periods = np.asarray(periods, float)
+    return 3.3 + 0.6 * (1 - np.exp(-periods / 60))
+
+
+###############################################################################
+
+
+def _stations(rng, n, region) -> pd.DataFrame:
+    west, east, south, north = region
+    return pd.DataFrame(
+        {
+            "station": [f"S{i:04d}" for i in range(n)],
+            "latitude": rng.uniform(south, north, n).round(4),
+            "longitude": rng.uniform(west, east, n).round(4),
+        }
+    )
+
+
+def _events(rng, n, region) -> pd.DataFrame:
+    """events 30° to 90° from the centre of the region, one hour apart"""
+    west, east, south, north = region
+    lat0, lon0 = np.radians((south + north) / 2), np.radians((west + east) / 2)
+    delta = np.radians(rng.uniform(30, 90, n))
+    azimuth = rng.uniform(0, 2 * np.pi, n)
+    lat = np.arcsin(
+        np.sin(lat0) * np.cos(delta) + np.cos(lat0) * np.sin(delta) * np.cos(azimuth)
+    )
+    lon = lon0 + np.arctan2(
+        np.sin(azimuth) * np.sin(delta) * np.cos(lat0),
+        np.cos(delta) - np.sin(lat0) * np.sin(lat),
+    )
+    lon = (np.degrees(lon) + 180) % 360 - 180
+
+    start = datetime(2016, 1, 1, tzinfo=UTC)
+    times = [start + timedelta(hours=i) for i in range(n)]
+    return pd.DataFrame(
+        {
+            "time": [t.isoformat().replace("+00:00", "Z") for t in times],
+            "latitude": np.degrees(lat).round(4),
+            "longitude": lon.round(4),
+            "depth": rng.uniform(10, 60, n).round(1),
+            "magnitude": rng.uniform(5.5, 7.0, n).round(1),
+            "code": [t.strftime("%Y%m%d%H%M") for t in times],
+        }
+    )
+
+
+def _distance(lat, lon, stations: pd.DataFrame) -> np.ndarray:
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2 = np.radians(stations["latitude"].to_numpy())
+    lon2 = np.radians(stations["longitude"].to_numpy())
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _write_event(rng, event_dir: Path, evt, stations, dist, npts):
+    event_dir.mkdir(exist_ok=True)
+    phv0 = reference_phv(PERIODS)
+    names = []
+    for sta, d in zip(stations.itertuples(), dist, strict=True):
+        name = f"{evt.code}.{sta.station}.LHZ.sac"
+        names.append(name)
+        sac = event_dir / name
+        sac.write_bytes(_sac_bytes(rng, evt, sta, d, npts))
+
+        # a few percent of velocity perturbation, amplitudes decay with period
+        phv = phv0 * (1 + rng.normal(0, 0.01) + rng.normal(0, 0.002, len(PERIODS)))
+        amp = np.exp(-PERIODS / 100) * rng.uniform(0.5, 1.5)
+        gvel = phv * 0.9
+        snr = np.full(len(PERIODS), 20.0)
+        width = PERIODS * 2
+        disp = np.column_stack(
+            [np.arange(len(PERIODS)), PERIODS, PERIODS, gvel, phv, amp, snr, width]
+        )
+        np.savetxt(
+            f"{sac}_1_DISP.0",
+            disp,
+            fmt="%4d %10.4f %10.4f %12.4f %12.4f %15.4f %12.4f %12.4f",
+        )
+
+        snr = rng.uniform(5, 80) * np.exp(-((np.log(PERIODS / 40)) ** 2))
+        snr_cols = np.column_stack(
+            [np.arange(len(PERIODS)), PERIODS, snr, snr, snr, snr]
+        )
+        np.savetxt(f"{sac}_snr.yyj.txt", snr_cols, fmt="%d %.4f %.4f %.4f %.4f %.4f")
+
+    (event_dir / "filelist").write_text("".join(f"{n}\n" for n in names))
+
+
+def _sac_bytes(rng, evt, sta, dist, npts) -> bytes:
+    floats = np.full(70, -12345.0, dtype="<f4")
+    # integer, enumerated and logical words
+    ints = np.full(40, -12345, dtype="<i4")
+    values = {
+        "delta": 1.0,
+        "b": 0.0,
+        "stla": sta.latitude,
+        "stlo": sta.longitude,
+        "evla": evt.latitude,
+        "evlo": evt.longitude,
+    }
+    for key, word in SAC_FLOATS.items():
+        floats[word] = values[key]
+    floats[SAC_DIST] = dist
+    ints[SAC_NVHDR - 70] = 6
+    ints[SAC_NPTS - 70] = npts
+    # the character fields are left blank
+    chars = b" " * 192
+    data = rng.normal(0, 1, npts).astype("<f4")
+    return floats.tobytes() + ints.tobytes() + chars + data.tobytes()
+
+
+def _write_predictions(f, evt_id, evt, stations):
+    """blocks of `GDM52_dispersion.out`, read by `make_cor_pred_files`"""
+    periods = np.arange(10, 251, 5)
+    lines = "\n".join(
+        f"{p:8.3f} {v:8.4f}"
+        for p, v in zip(periods, reference_phv(periods), strict=True)
+    )
+    for sta in stations.itertuples():
+        f.write(
+            f"{evt_id} {sta.Index + 1} {len(periods)} {evt.code} {sta.station} "
+            f"{evt.latitude:.4f} {evt.longitude:.4f} "
+            f"{sta.latitude:.4f} {sta.longitude:.4f}\n{lines}\n"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("out_dir")
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--stations", type=int, default=50)
+    parser.add_argument("--coverage", type=float, default=0.8)
+    parser.add_argument("--npts", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = make_dataset(
+        args.out_dir,
+        args.events,
+        args.stations,
+        coverage=args.coverage,
+        npts=args.npts,
+        seed=args.seed,
+    )
+    print(sizes)
+
+
+if __name__ == "__main__":
+    main()
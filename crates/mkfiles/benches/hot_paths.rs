@@ -0,0 +1,208 @@
+//! Micro-benchmarks of the inner loops of the filter stage
+//!
+//! Inputs are generated with the layouts of the real files, each function
+//! is run at a few sizes. Record a baseline before a change and compare
+//! against it afterwards:
+//!
+//! ```bash
+//! cargo bench -p mkfiles --features bench -- --save-baseline main
+//! # after the change
+//! cargo bench -p mkfiles --features bench -- --baseline main
+//! ```
+
+use criterion::{BatchSize, BenchmarkId, Criterion, Throughput, criterion_group, criterion_main};
+use mkfiles::bench;
+use mkfiles::utils::{points::GeoPoint, records::PhRecord};
+use std::{fmt::Write as _, fs, hint::black_box, path::PathBuf};
+
+/// Stations are spread over this [west, east, south, north]
+const REGION: [f64; 4] = [172.0, 179.0, -42.0, -34.0];
+
+/// Deterministic uniform numbers, the inputs are the same on every run
+struct Lcg(u64);
+
+impl Lcg {
+    fn uniform(&mut self, lo: f64, hi: f64) -> f64 {
+        self.0 = self
+            .0
+            .wrapping_mul(6364136223846793005)
+            .wrapping_add(1442695040888963407);
+        lo + (hi - lo) * ((self.0 >> 11) as f64 / (1u64 << 53) as f64)
+    }
+
+    fn station(&mut self) -> GeoPoint {
+        let lat = self.uniform(REGION[2], REGION[3]);
+        let lon = self.uniform(REGION[0], REGION[1]);
+        GeoPoint::new(lat, lon, None, None::<String>)
+    }
+}
+
+fn scratch_dir(name: &str) -> PathBuf {
+    let dir = std::env::temp_dir().join("mkfiles_bench").join(name);
+    fs::create_dir_all(&dir).unwrap();
+    dir
+}
+
+/// Periods of aftan, 10 s to 250 s by 5%
+fn periods(rows: usize) -> impl Iterator<Item = f64> {
+    (0..rows).map(|i| 10.0 * 1.05f64.powi(i as i32))
+}
+
+fn disp_content(rows: usize, rng: &mut Lcg) -> String {
+    let mut s = String::new();
+    for (i, p) in periods(rows).enumerate() {
+        let phv = 3.3 + 0.6 * (1.0 - (-p / 60.0).exp()) + rng.uniform(-0.02, 0.02);
+        writeln!(
+            s,
+            "{:4} {:10.4} {:10.4} {:12.4} {:12.4} {:15.4} {:12.4} {:12.4}",
+            i,
+            p,
+            p,
+            phv * 0.9,
+            phv,
+            (-p / 100.0).exp(),
+            20.0,
+            p * 2.0
+        )
+        .unwrap();
+    }
+    s
+}
+
+fn snr_content(rows: usize, rng: &mut Lcg) -> String {
+    let mut s = String::new();
+    for (i, p) in periods(rows).enumerate() {
+        let snr = rng.uniform(5.0, 80.0);
+        writeln!(
+            s,
+            "{} {:.4} {:.4} {:.4} {:.4} {:.4}",
+            i, p, snr, snr, snr, snr
+        )
+        .unwrap();
+    }
+    s
+}
+
+/// One block of `GDM52_dispersion.out` with `rows` predictions
+fn pred_block(rows: usize, rng: &mut Lcg) -> String {
+    let sta = rng.station();
+    let mut s = format!(
+        "1 1 {} 201601010000 S0000 10.0000 100.0000 {:.4} {:.4}\n",
+        rows, sta.lat, sta.lon
+    );
+    for i in 0..rows {
+        let p = 10.0 + 240.0 * i as f64 / rows.max(2) as f64;
+        writeln!(s, "{:8.3} {:8.4}", p, 3.3 + 0.6 * (1.0 - (-p / 60.0).exp())).unwrap();
+    }
+    s
+}
+
+/// Records of one event, travel times consistent with a 3.8 km/s wave
+fn event_records(n: usize, rng: &mut Lcg) -> Vec<PhRecord> {
+    let event = GeoPoint::new(10.0, 100.0, None, None::<String>);
+    (0..n)
+        .map(|_| {
+            let sta = rng.station();
+            let phv = 3.8 + rng.uniform(-0.05, 0.05);
+            PhRecord {
+                lon: sta.lon,
+                lat: sta.lat,
+                time: sta.distance_to(&event) / phv + rng.uniform(-1.0, 1.0),
+                phv,
+                amp: rng.uniform(0.5, 1.5),
+            }
+        })
+        .collect()
+}
+
+fn distance_to(c: &mut Criterion) {
+    let mut group = c.benchmark_group("distance_to");
+    let mut rng = Lcg(1);
+    let centre = GeoPoint::new(-38.0, 175.5, None, None::<String>);
+    for n in [1_000, 100_000] {
+        let points: Vec<GeoPoint> = (0..n).map(|_| rng.station()).collect();
+        group.throughput(Throughput::Elements(n as u64));
+        group.bench_with_input(BenchmarkId::from_parameter(n), &points, |b, points| {
+            b.iter(|| {
+                points
+                    .iter()
+                    .map(|p| p.distance_to(black_box(&centre)))
+                    .sum::<f64>()
+            })
+        });
+    }
+    group.finish();
+}
+
+fn parse_files(c: &mut Criterion) {
+    let dir = scratch_dir("parse");
+    let mut rng = Lcg(2);
+    let mut group = c.benchmark_group("parse_files");
+    // 67 rows is one aftan measurement
+    for rows in [67, 1_000] {
+        let disp = dir.join(format!("{}_1_DISP.0", rows));
+        let snr = dir.join(format!("{}_snr.yyj.txt", rows));
+        fs::write(&disp, disp_content(rows, &mut rng)).unwrap();
+        fs::write(&snr, snr_content(rows, &mut rng)).unwrap();
+
+        group.throughput(Throughput::Elements(rows as u64));
+        group.bench_with_input(BenchmarkId::new("disp", rows), &disp, |b, path| {
+            b.iter(|| bench::parse_disp_file(path).unwrap())
+        });
+        group.bench_with_input(BenchmarkId::new("snr", rows), &snr, |b, path| {
+            b.iter(|| bench::parse_snr_file(path).unwrap())
+        });
+    }
+    group.finish();
+}
+
+fn correct_event_ph_records(c: &mut Criterion) {
+    let mut rng = Lcg(3);
+    let ref_point = GeoPoint::new(-38.0, 175.5, None, None::<String>);
+    let mut group = c.benchmark_group("correct_event_ph_records");
+    for n in [50, 200, 1_000] {
+        let records = event_records(n, &mut rng);
+        group.throughput(Throughput::Elements(n as u64));
+        group.bench_with_input(BenchmarkId::from_parameter(n), &records, |b, records| {
+            b.iter_batched(
+                || records.clone(),
+                |records| bench::correct_event_ph_records(records, 40.0, 10, 0.3, 8.0, &ref_point),
+                BatchSize::SmallInput,
+            )
+        });
+    }
+    group.finish();
+}
+
+fn pred_blocks(c: &mut Criterion) {
+    let dir = scratch_dir("pred");
+    let mut rng = Lcg(4);
+    let mut group = c.benchmark_group("pred_blocks");
+    // 49 rows is the 10 s to 250 s GDM52 grid
+    for rows in [49, 500] {
+        let content = pred_block(rows, &mut rng);
+        let lines: Vec<&str> = content.lines().collect();
+        let pair = bench::parse_block(&lines, 0).unwrap();
+        assert_eq!(pair.dispersions(), rows);
+
+        group.throughput(Throughput::Elements(rows as u64));
+        group.bench_with_input(BenchmarkId::new("parse_block", rows), &lines, |b, lines| {
+            b.iter(|| bench::parse_block(black_box(lines), 0).unwrap())
+        });
+        group.bench_with_input(
+            BenchmarkId::new("write_station_pair", rows),
+            &pair,
+            |b, pair| b.iter(|| bench::write_station_pair(&dir, pair).unwrap()),
+        );
+    }
+    group.finish();
+}
+
+criterion_group!(
+    benches,
+    distance_to,
+    parse_files,
+    correct_event_ph_records,
+    pred_blocks
+);
+criterion_main!(benches);
@@ -0,0 +1,169 @@
+mod measure;
+
+pub use measure::{DispRow, FtanParams, ftan};
+
+use crate::pred_store::PredStore;
+use crate::trace;
+use crate::utils::pbar;
+use crate::utils::sac::read_sac;
+
+use anyhow::{Context, Result};
+use indicatif::ParallelProgressIterator;
+use pyo3::{exceptions::PyIOError, prelude::*};
+use rayon::prelude::*;
+use std::{
+    fs::{self, File},
+    io::{BufWriter, Write},
+    path::{Path, PathBuf},
+};
+
+/// Measures the dispersion of every `{event}/*.sac` under `sac_dir`
+///
+/// Replaces `aftani_c_pgl_TPWT`: each waveform is cleaned by a filter
+/// phase-matched to its PH_PRED prediction, then the group and phase
+/// velocities and amplitudes are measured by FTAN. All files run in
+/// parallel and each one gets a `{sac}_1_DISP.0` in the same columns
+/// as the binary writes (idx, cper, obper, gvel, phvel, amp, snr, width).
+///
+/// Parameters:
+///     sac_dir: sac data, one dir per event
+///     path_dir: the dir with the PH_PRED pack or the PH_PRED files
+///     tmin, tmax: period range in s
+///     vmin, vmax: group velocity window in km/s
+///     alpha: width of the Gaussian filters
+#[pyfunction]
+#[pyo3(signature = (sac_dir, path_dir, tmin=10.0, tmax=250.0, vmin=2.5, vmax=5.0, alpha=20.0))]
+pub fn make_disp_files(
+    py: Python<'_>,
+    sac_dir: &str,
+    path_dir: &str,
+    tmin: f64,
+    tmax: f64,
+    vmin: f64,
+    vmax: f64,
+    alpha: f64,
+) -> PyResult<()> {
+    let params = FtanParams::new(tmin, tmax, vmin, vmax, alpha);
+    py.allow_threads(|| write_disp_files(Path::new(sac_dir), Path::new(path_dir), &params))
+        .map_err(|e| PyIOError::new_err(e.to_string()))
+}
+
+fn write_disp_files(sac_dir: &Path, path_dir: &Path, params: &FtanParams) -> Result<()> {
+    let store = PredStore::open_packed(path_dir)?;
+
+    let sac_files: Vec<PathBuf> = fs::read_dir(sac_dir)?
+        .filter_map(|entry| Some(entry.ok()?.path()))
+        .filter(|path| path.is_dir())
+        .flat_map(|dir| fs::read_dir(dir).into_iter().flatten())
+        .filter_map(|entry| Some(entry.ok()?.path()))
+        .filter(|path| path.extension().is_some_and(|ext| ext == "sac"))
+        .collect();
+
+    let pb = pbar(sac_files.len() as u64, "FTAN");
+    sac_files
+        .into_par_iter()
+        .progress_with(pb)
+        .try_for_each(|path| {
+            let _span = trace::span("ftan", path.to_string_lossy());
+            // files without a prediction or unreadable ones get no DISP,
+            // like a failed run of aftani_c_pgl_TPWT
+            let Some(prediction) = load_prediction(store.as_ref(), path_dir, &path) else {
+                return Ok(());
+            };
+            let Ok((header, data)) = read_sac(&path) else {
+                return Ok(());
+            };
+            let rows = ftan(&header, &data, &prediction, params);
+            write_disp_file(&path, &rows)
+        })
+}
+
+/// (period, phase velocity) of the PH_PRED of a `{evt}.{sta}.*.sac`
+pub(crate) fn load_prediction(
+    store: Option<&PredStore>,
+    path_dir: &Path,
+    sac: &Path,
+) -> Option<Vec<(f64, f64)>> {
+    let name = sac.file_name()?.to_str()?;
+    let mut parts = name.split('.');
+    let (evt, sta) = (parts.next()?, parts.next()?);
+
+    let content = match store {
+        Some(store) => store.get(evt, sta)?.to_string(),
+        None => fs::read_to_string(path_dir.join(format!("{}_{}.PH_PRED", evt, sta))).ok()?,
+    };
+    let prediction: Vec<(f64, f64)> = content
+        .lines()
+        .skip(1)
+        .filter_map(|line| {
+            let mut cols = line.split_whitespace();
+            Some((cols.next()?.parse().ok()?, cols.next()?.parse().ok()?))
+        })
+        .collect();
+
+    (!prediction.is_empty()).then_some(prediction)
+}
+
+/// Writes the `{sac}_1_DISP.0` of `rows`, none when no period was measured
+pub(crate) fn write_disp_file(sac: &Path, rows: &[DispRow]) -> Result<()> {
+    if rows.is_empty() {
+        return Ok(());
+    }
+    let mut name = sac.as_os_str().to_owned();
+    name.push("_1_DISP.0");
+    let path = PathBuf::from(name);
+
+    let file = File::create(&path).with_context(|| format!("create error: {}", path.display()))?;
+    let mut writer = BufWriter::new(file);
+    for (i, row) in rows.iter().enumerate() {
+        writeln!(
+            writer,
+            "{:4} {:10.4} {:10.4} {:12.4} {:12.4} {:15.4} {:12.4} {:12.4}",
+            i, row.cper, row.obper, row.gvel, row.phvel, row.amp, row.snr, row.width
+        )?;
+    }
+    writer.flush()?;
+    Ok(())
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn no_disp_file_without_rows() -> Result<()> {
+        let dir = std::env::temp_dir().join(format!("tpwt_ftan_{}", std::process::id()));
+        fs::create_dir_all(&dir)?;
+        let sac = dir.join("E1.S1.LHZ.sac");
+        let disp = dir.join("E1.S1.LHZ.sac_1_DISP.0");
+
+        write_disp_file(&sac, &[])?;
+        assert!(!disp.exists());
+
+        let row = DispRow {
+            cper: 20.0,
+            obper: 20.1,
+            gvel: 3.2,
+            phvel: 3.5,
+            amp: 1.0,
+            snr: 30.0,
+            width: 12.0,
+        };
+        write_disp_file(&sac, &[row, row])?;
+        let content = fs::read_to_string(&disp)?;
+        fs::remove_dir_all(&dir)?;
+
+        let lines: Vec<Vec<&str>> = content
+            .lines()
+            .map(|l| l.split_whitespace().collect())
+            .collect();
+        assert_eq!(lines.len(), 2);
+        assert_eq!(
+            lines[1],
+            [
+                "1", "20.0000", "20.1000", "3.2000", "3.5000", "1.0000", "30.0000", "12.0000"
+            ]
+        );
+        Ok(())
+    }
+}
@@ -0,0 +1,278 @@
+use crate::snr::{SnrParams, signal_window, snr_of};
+use crate::utils::sac::SacHeader;
+use crate::utils::spectrum::Spectrum;
+
+use rustfft::num_complex::Complex;
+use std::f64::consts::PI;
+
+/// Parameters of the FTAN measurement
+#[derive(Debug, Clone)]
+pub struct FtanParams {
+    pub periods: Vec<f64>,
+    pub tmin: f64,
+    pub tmax: f64,
+    pub vmin: f64,
+    pub vmax: f64,
+    pub alpha: f64,
+}
+
+impl FtanParams {
+    pub fn new(tmin: f64, tmax: f64, vmin: f64, vmax: f64, alpha: f64) -> Self {
+        Self {
+            periods: SnrParams::period_grid(tmin, tmax)
+                .into_iter()
+                .filter(|&p| p <= tmax)
+                .collect(),
+            tmin,
+            tmax,
+            vmin,
+            vmax,
+            alpha,
+        }
+    }
+}
+
+/// One line of a `_1_DISP.0` file
+///
+/// `amp` and `snr` are linear ratios, not dB. The units of the snr and
+/// width columns of `aftani_c_pgl_TPWT` could not be checked without its
+/// output, only `obper`, `phvel` and `amp` are read downstream.
+#[derive(Debug, Clone, Copy)]
+pub struct DispRow {
+    /// Centre period of the filter in s
+    pub cper: f64,
+    /// Instantaneous period at the envelope peak in s
+    pub obper: f64,
+    /// Group and phase velocity in km/s
+    pub gvel: f64,
+    pub phvel: f64,
+    /// Envelope peak of the phase-matched trace
+    pub amp: f64,
+    /// Envelope peak of the raw trace over the RMS after the window
+    pub snr: f64,
+    /// Full width of the envelope peak at half maximum in s
+    pub width: f64,
+}
+
+/// Phase-matched FTAN of one waveform
+///
+/// The predicted phase is removed from the spectrum so that the surface
+/// wave collapses into a pulse, which is kept with `tmax` seconds on
+/// either side. The remaining spectrum is narrow-band filtered at each
+/// period: the envelope peak inside the group velocity window gives the
+/// group time and amplitude, the phase at the peak gives the phase
+/// velocity, with the 2π ambiguity resolved by the prediction.
+pub fn ftan(
+    header: &SacHeader,
+    data: &[f32],
+    prediction: &[(f64, f64)],
+    params: &FtanParams,
+) -> Vec<DispRow> {
+    let n = data.len();
+    let (b, dt, dist) = (header.b as f64, header.delta as f64, header.dist as f64);
+    if n < 3 || dt <= 0.0 || dist <= 0.0 {
+        return vec![];
+    }
+    let Some(window) = signal_window(header, n, params.vmin, params.vmax) else {
+        return vec![];
+    };
+
+    let raw = Spectrum::new(data, dt);
+    let mut clean = Spectrum::new(data, dt);
+    let pred = |period: f64| interp_prediction(prediction, period);
+
+    // compress the predicted wave to a pulse at t0, then keep it only
+    let t0 = dist / pred((params.tmin * params.tmax).sqrt());
+    let half = (params.tmax / dt).round() as usize;
+    let phase = |w: f64| w * (dist / pred(2.0 * PI / w) - t0);
+    let i0 = ((t0 - b) / dt).round();
+    if i0 >= 0.0 && (i0 as usize) < n {
+        let i0 = i0 as usize;
+        clean.phase_match(phase, (i0.saturating_sub(half), (i0 + half).min(n)), half);
+    }
+
+    let mut raw_filtered = Vec::new();
+    let mut filtered = Vec::new();
+    params
+        .periods
+        .iter()
+        .filter_map(|&cper| {
+            raw.gaussian_filter(cper, params.alpha, &mut raw_filtered);
+            clean.gaussian_filter(cper, params.alpha, &mut filtered);
+            let snr = snr_of(&raw_filtered[..n], window)?;
+            let mut row = measure_peak(&filtered[..n], window, b, dt, dist, &pred)?;
+            row.cper = cper;
+            row.snr = snr;
+            Some(row)
+        })
+        .collect()
+}
+
+/// Group and phase velocity at the envelope peak inside `window`,
+/// peaks on the edge of the window are rejected
+fn measure_peak(
+    trace: &[Complex<f64>],
+    (start, end): (usize, usize),
+    b: f64,
+    dt: f64,
+    dist: f64,
+    pred: &impl Fn(f64) -> f64,
+) -> Option<DispRow> {
+    let env = |i: usize| trace[i].norm();
+    let i = (start..end).max_by(|&x, &y| env(x).total_cmp(&env(y)))?;
+    if i == start || i + 1 == end {
+        return None;
+    }
+
+    // parabolic refinement of the peak
+    let (y0, y1, y2) = (env(i - 1), env(i), env(i + 1));
+    let curvature = y0 - 2.0 * y1 + y2;
+    let shift = if curvature < 0.0 {
+        0.5 * (y0 - y2) / curvature
+    } else {
+        0.0
+    };
+    let tg = b + (i as f64 + shift) * dt;
+    let amp = y1 - 0.25 * (y0 - y2) * shift;
+
+    // instantaneous frequency and phase at the peak
+    let w = (trace[i + 1] * trace[i - 1].conj()).arg() / (2.0 * dt);
+    if w <= 0.0 {
+        return None;
+    }
+    let phase = trace[i].arg() + w * shift * dt;
+    let obper = 2.0 * PI / w;
+
+    // 2π ambiguity: the cycle count closest to the predicted phase velocity
+    let cycles = ((phase - w * (tg - dist / pred(obper))) / (2.0 * PI)).round();
+    let phase_time = tg - (phase - 2.0 * PI * cycles) / w;
+    if phase_time <= 0.0 {
+        return None;
+    }
+
+    let half_max = 0.5 * y1;
+    let left = (0..i).rev().find(|&j| env(j) < half_max).unwrap_or(0);
+    let right = (i..trace.len())
+        .find(|&j| env(j) < half_max)
+        .unwrap_or(trace.len() - 1);
+
+    Some(DispRow {
+        cper: 0.0,
+        obper,
+        gvel: dist / tg,
+        phvel: dist / phase_time,
+        amp,
+        snr: 0.0,
+        width: (right - left) as f64 * dt,
+    })
+}
+
+/// Linear interpolation of the predicted phase velocity, constant past both ends
+fn interp_prediction(prediction: &[(f64, f64)], period: f64) -> f64 {
+    let (first, last) = (prediction[0], prediction[prediction.len() - 1]);
+    if period <= first.0 {
+        return first.1;
+    }
+    if period >= last.0 {
+        return last.1;
+    }
+    prediction
+        .windows(2)
+        .find(|w| w[1].0 >= period)
+        .map_or(last.1, |w| {
+            let t = (period - w[0].0) / (w[1].0 - w[0].0);
+            w[0].1 + t * (w[1].1 - w[0].1)
+        })
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// Ricker wavelet peaking at `tg`, every frequency arrives at `tg` in phase
+    fn ricker(n: usize, dt: f64, tg: f64, period: f64) -> Vec<f32> {
+        (0..n)
+            .map(|i| {
+                let a = (PI * (i as f64 * dt - tg) / period).powi(2);
+                ((1.0 - 2.0 * a) * (-a).exp()) as f32
+            })
+            .collect()
+    }
+
+    #[test]
+    fn ftan_of_a_non_dispersive_pulse() {
+        let (dist, vel, dt, n) = (1000.0, 3.5, 1.0, 2048);
+        let header = SacHeader::synthetic(dt as f32, 0.0, n, dist as f32);
+        let data = ricker(n, dt, dist / vel, 35.0);
+        let params = FtanParams::new(20.0, 60.0, 2.5, 5.0, 20.0);
+
+        let rows = ftan(&header, &data, &[(10.0, vel), (100.0, vel)], &params);
+        assert_eq!(rows.len(), params.periods.len());
+        for row in rows {
+            assert!((row.gvel - vel).abs() < 0.01, "gvel {row:?}");
+            assert!((row.phvel - vel).abs() < 0.01, "phvel {row:?}");
+            assert!(row.snr > 1.0 && row.amp > 0.0, "{row:?}");
+        }
+    }
+
+    /// Phase velocity of the dispersed wavetrain, rising with period
+    fn phase_velocity(period: f64) -> f64 {
+        3.2 + 0.015 * (period - 20.0)
+    }
+
+    /// Sum of the cosines of every frequency bin, each travelling `dist` at
+    /// `phase_velocity`, weighted by a log-normal spectrum around 35 s
+    fn dispersed(n: usize, dt: f64, dist: f64) -> Vec<f32> {
+        let mut data = vec![0.0f64; n];
+        for k in 1..n / 2 {
+            let f = k as f64 / (n as f64 * dt);
+            let a = (-0.5 * ((1.0 / f / 35.0).ln() / 0.5).powi(2)).exp();
+            let delay = dist / phase_velocity(1.0 / f);
+            for (i, x) in data.iter_mut().enumerate() {
+                *x += a * (2.0 * PI * f * (i as f64 * dt - delay)).cos();
+            }
+        }
+        data.into_iter().map(|x| x as f32).collect()
+    }
+
+    #[test]
+    fn ftan_of_a_dispersed_wavetrain() {
+        let (dist, dt, n) = (2000.0, 1.0, 2048);
+        let header = SacHeader::synthetic(dt as f32, 0.0, n, dist as f32);
+        let data = dispersed(n, dt, dist);
+        // 1% off the truth, the measurement has to follow the data
+        let prediction: Vec<(f64, f64)> = (2..=20)
+            .map(|i| 5.0 * i as f64)
+            .map(|p| (p, 1.01 * phase_velocity(p)))
+            .collect();
+        let params = FtanParams::new(20.0, 60.0, 2.5, 5.0, 20.0);
+
+        let rows = ftan(&header, &data, &prediction, &params);
+        assert_eq!(rows.len(), params.periods.len());
+        for row in rows {
+            let phvel = phase_velocity(row.obper);
+            assert!((row.phvel - phvel).abs() < 0.01, "phvel {phvel} {row:?}");
+            // group velocity 1 / (d(w / c) / dw), below the phase velocity
+            let (w, h) = (2.0 * PI / row.obper, 1e-6);
+            let k = |w: f64| w / phase_velocity(2.0 * PI / w);
+            let gvel = 2.0 * h / (k(w + h) - k(w - h));
+            assert!((row.gvel - gvel).abs() < 0.02, "gvel {gvel} {row:?}");
+        }
+    }
+
+    #[test]
+    fn ftan_of_a_silent_trace() {
+        let header = SacHeader::synthetic(1.0, 0.0, 2048, 1000.0);
+        let params = FtanParams::new(20.0, 60.0, 2.5, 5.0, 20.0);
+        assert!(ftan(&header, &[0.0; 2048], &[(10.0, 3.5)], &params).is_empty());
+    }
+
+    #[test]
+    fn prediction_is_interpolated() {
+        let prediction = [(10.0, 3.0), (20.0, 3.5), (40.0, 4.0)];
+        assert_eq!(interp_prediction(&prediction, 5.0), 3.0);
+        assert_eq!(interp_prediction(&prediction, 15.0), 3.25);
+        assert_eq!(interp_prediction(&prediction, 30.0), 3.75);
+        assert_eq!(interp_prediction(&prediction, 50.0), 4.0);
+    }
+}
@@ -1,10 +1,25 @@
 pub mod utils;
 
+mod ftan;
 mod pathfile;
 mod pred_files;
+mod pred_store;
 mod ph_files;
+mod snr;
+mod trace;
 
+pub use ftan::make_disp_files;
 pub use pathfile::make_pathfile;
 pub use pred_files::make_cor_pred_files;
-pub use ph_files::make_ph_amp_files;
+pub use pred_store::PredStore;
+pub use ph_files::{EventPipeline, make_ph_amp_arrays, make_ph_amp_files};
+pub use snr::make_snr_store;
+pub use trace::{set_trace, take_trace_events};
+
+/// Internal hot functions for the criterion benches in `benches/`
+#[cfg(feature = "bench")]
+pub mod bench {
+    pub use crate::ph_files::bench::*;
+    pub use crate::pred_files::bench::*;
+}
 
@@ -6,8 +6,11 @@ use csv::Reader;
 use pyo3::{exceptions::PyIOError, prelude::*};
 use rayon::prelude::*;
 use serde::Deserialize;
+use std::collections::{HashMap, HashSet};
+use std::fmt::Write as _;
 use std::fs::File;
 use std::io::{BufWriter, Write};
+use walkdir::WalkDir;
 
 #[derive(Debug, Deserialize)]
 struct EventRecord {
@@ -29,42 +32,140 @@ struct StationRecord {
     lon: f64,
 }
 
+/// Bytes of formatted lines held by one chunk of events
+const CHUNK_BYTES: usize = 8 * 1024 * 1024;
+/// Rough size of one formatted event-station pair, used to size chunks
+const LINE_BYTES: usize = 128;
+
+/// Stations with a waveform, by event code
+type Archive = HashMap<String, HashSet<String>>;
+
+/// Writes the pathfile of the event and station catalogs
+///
+/// Every event-station pair is written by default. With `sac_dir` only
+/// the pairs having a `{sac_dir}/{evt}/{evt}.{sta}.*.sac` are kept, the
+/// catalog ids are unchanged.
 #[pyfunction]
-pub fn make_pathfile(evt_csv: &str, sta_csv: &str, outfile: &str) -> PyResult<()> {
+#[pyo3(signature = (evt_csv, sta_csv, outfile, sac_dir=None))]
+pub fn make_pathfile(
+    evt_csv: &str,
+    sta_csv: &str,
+    outfile: &str,
+    sac_dir: Option<&str>,
+) -> PyResult<()> {
     let (events, stations) = rayon::join(|| load_events(evt_csv), || load_stations(sta_csv));
 
     let events = events.map_err(|e| PyErr::new::<PyIOError, _>(e.to_string()))?;
     let stations = stations.map_err(|e| PyErr::new::<PyIOError, _>(e.to_string()))?;
+    let archive = sac_dir.map(scan_archive);
 
-    let results = generate_results(&events, &stations);
-    write_output(outfile, &results).map_err(|e| PyErr::new::<PyIOError, _>(e.to_string()))?;
+    write_output(outfile, &events, &stations, archive.as_ref())
+        .map_err(|e| PyErr::new::<PyIOError, _>(e.to_string()))?;
 
     Ok(())
 }
 
-fn write_output(path: &str, lines: &[String]) -> Result<()> {
+/// Event and station codes from the `{evt}.{sta}.*.sac` names of the archive
+fn scan_archive(sac_dir: &str) -> Archive {
+    let mut archive = Archive::new();
+    for entry in WalkDir::new(sac_dir).min_depth(2).max_depth(2).into_iter().flatten() {
+        let path = entry.path();
+        if path.extension().is_none_or(|ext| ext != "sac") {
+            continue;
+        }
+        let Some(name) = path.file_name().and_then(|n| n.to_str()) else {
+            continue;
+        };
+        let mut parts = name.split('.');
+        if let (Some(evt), Some(sta)) = (parts.next(), parts.next()) {
+            archive
+                .entry(evt.to_string())
+                .or_default()
+                .insert(sta.to_string());
+        }
+    }
+    archive
+}
+
+/// Streams all event-station pairs to `path` in event order
+///
+/// Events are formatted chunk by chunk on the rayon pool while the previous
+/// chunk is being written, so at most two chunks are alive at once whatever
+/// the catalog size.
+fn write_output(
+    path: &str,
+    events: &[GeoPoint],
+    stations: &[GeoPoint],
+    archive: Option<&Archive>,
+) -> Result<()> {
     let file =
         File::create(path).with_context(|| format!("Failed to create output file: {}", path))?;
     let mut writer = BufWriter::new(file);
-    writer.write_all(lines.join("\n").as_bytes())?;
+
+    let events_per_chunk = (CHUNK_BYTES / (LINE_BYTES * stations.len().max(1)))
+        .max(rayon::current_num_threads());
+
+    let mut first = true;
+    let mut pending: Vec<String> = Vec::new();
+    for chunk in events.chunks(events_per_chunk) {
+        let (written, formatted) = rayon::join(
+            || write_blocks(&mut writer, &pending, &mut first),
+            || format_chunk(chunk, stations, archive),
+        );
+        written?;
+        pending = formatted;
+    }
+    write_blocks(&mut writer, &pending, &mut first)?;
+    writer.flush()?;
+
+    Ok(())
+}
+
+/// Writes event blocks separated by a newline, without a trailing one
+fn write_blocks<W: Write>(writer: &mut W, blocks: &[String], first: &mut bool) -> Result<()> {
+    for block in blocks.iter().filter(|b| !b.is_empty()) {
+        if !*first {
+            writer.write_all(b"\n")?;
+        }
+        writer.write_all(block.as_bytes())?;
+        *first = false;
+    }
     Ok(())
 }
 
-fn generate_results(events: &[GeoPoint], stations: &[GeoPoint]) -> Vec<String> {
+/// Formats every event of the chunk into one block of lines,
+/// events without any archived station give an empty block
+fn format_chunk(
+    events: &[GeoPoint],
+    stations: &[GeoPoint],
+    archive: Option<&Archive>,
+) -> Vec<String> {
+    let empty = HashSet::new();
     events
         .par_iter()
-        .flat_map(|event| {
-            stations.par_iter().map(move |station| {
-                // let dist = calculate_distance(event.coordinates, station.coordinates);
-                let dist = event.distance_to(&station);
-                format_line(event, station, dist)
-            })
+        .map(|event| {
+            let archived = archive.map(|a| a.get(event.code()).unwrap_or(&empty));
+            let npairs = archived.map_or(stations.len(), HashSet::len);
+            let mut block = String::with_capacity(npairs * LINE_BYTES);
+            for station in stations {
+                if archived.is_some_and(|sta| !sta.contains(station.code())) {
+                    continue;
+                }
+                if !block.is_empty() {
+                    block.push('\n');
+                }
+                let dist = event.distance_to(station);
+                write_line(&mut block, event, station, dist);
+            }
+            block
         })
         .collect()
 }
 
-fn format_line(event: &GeoPoint, station: &GeoPoint, dist: f64) -> String {
-    format!(
+fn write_line(buf: &mut String, event: &GeoPoint, station: &GeoPoint, dist: f64) {
+    // writing into a String never fails
+    let _ = write!(
+        buf,
         "{itemp:12}\n{eid:5} {sid:4} {ecode:<18} {scode:<8} {elat:9.4} {elon:9.4} {slat:9.4} {slon:9.4} {dist:11.2}",
         itemp = 6,
         eid = event.id(),
@@ -76,7 +177,7 @@ fn format_line(event: &GeoPoint, station: &GeoPoint, dist: f64) -> String {
         slat = station.lat,
         slon = station.lon,
         dist = dist,
-    )
+    );
 }
 
 fn load_events(path: &str) -> Result<Vec<GeoPoint>> {
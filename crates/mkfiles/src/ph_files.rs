@@ -1,22 +1,40 @@
+mod curve_cache;
 mod dist;
 mod ph_correct;
 mod ph_gen;
+mod stream;
 
+pub use stream::EventPipeline;
+
+use crate::trace;
 use crate::utils::pbar;
 use crate::utils::records::{DistRecord, PhRecord};
 
 use anyhow::{Context, Result};
 use csv::Writer;
-use pyo3::{exceptions::PyIOError, prelude::*};
+use numpy::IntoPyArray;
+use pyo3::{exceptions::PyIOError, prelude::*, types::PyDict};
 use rayon::prelude::*;
 use std::{
     collections::HashMap,
     fs::{self, File},
     io::Write,
-    path::Path,
+    path::{Path, PathBuf},
+    sync::Mutex,
+    thread,
 };
 
+/// Picks phase time and amplitude of every event at `periods`
+///
+/// Every SNR/DISP curve is read once for all periods, then at most
+/// `max_periods` periods are corrected and written at a time, the next
+/// one starting as soon as one is done. Smaller values bound the memory
+/// of the corrections in flight, `None` runs all periods at once.
 #[pyfunction]
+#[pyo3(signature = (
+    evt_csv, sta_csv, sac_dir, out_dir, periods, snr, dist, nsta, valid_ratio, tmisfit, ref_sta,
+    max_periods=None,
+))]
 pub fn make_ph_amp_files(
     evt_csv: &str,
     sta_csv: &str,
@@ -29,79 +47,246 @@ pub fn make_ph_amp_files(
     valid_ratio: f64,
     tmisfit: f64,
     ref_sta: [f64; 2],
+    max_periods: Option<usize>,
 ) -> PyResult<()> {
     let dist_records = dist::calc_dist_records(evt_csv, sta_csv, sac_dir)
         .map_err(|e| PyIOError::new_err(e.to_string()))?;
 
-    let pbar = pbar(periods.len() as u64, "Calcing ph and amp");
-    for period in pbar.wrap_iter(periods.into_iter()) {
-        gen_ph_amp_files(
-            &dist_records,
-            sac_dir,
-            period,
-            snr,
-            dist,
-            nsta,
-            valid_ratio,
-            tmisfit,
-            ref_sta,
-            out_dir,
-        )
-        .map_err(|e| PyIOError::new_err(e.to_string()))?;
+    pick_ph_amp(
+        &dist_records,
+        sac_dir,
+        &periods,
+        snr,
+        dist,
+        nsta,
+        valid_ratio,
+        tmisfit,
+        ref_sta,
+        max_periods,
+        |period, records| {
+            let output_path = period_dir(out_dir, period, snr, dist)?;
+            write_ph_files(&records, &output_path)
+        },
+    )
+    .map_err(|e| PyIOError::new_err(e.to_string()))
+}
+
+/// Same as `make_ph_amp_files` but returns the corrected records
+///
+/// Returns `{period: {"events": [...], "event": ..., "lon": ..., "lat": ...,
+/// "time": ..., "phv": ..., "amp": ...}}`. `events` lists the event names
+/// sorted, `event` holds the index into it for every record, and the others
+/// are contiguous NumPy arrays moved from Rust without copying. Records of
+/// one event are adjacent. The `{event}.ph.csv` files are only written when
+/// `out_dir` is given.
+///
+/// With `on_period`, every period is instead passed as `on_period(period,
+/// dict)` as soon as it is corrected, from the correcting threads, and the
+/// returned dict is empty. A worker only takes its next period once the
+/// callback returns, an exception of the callback stops the picking and
+/// is raised again here.
+#[pyfunction]
+#[pyo3(signature = (
+    evt_csv, sta_csv, sac_dir, periods, snr, dist, nsta, valid_ratio, tmisfit, ref_sta,
+    max_periods=None, out_dir=None, on_period=None,
+))]
+pub fn make_ph_amp_arrays<'py>(
+    py: Python<'py>,
+    evt_csv: &str,
+    sta_csv: &str,
+    sac_dir: &str,
+    periods: Vec<f64>,
+    snr: f64,
+    dist: f64,
+    nsta: usize,
+    valid_ratio: f64,
+    tmisfit: f64,
+    ref_sta: [f64; 2],
+    max_periods: Option<usize>,
+    out_dir: Option<&str>,
+    on_period: Option<PyObject>,
+) -> PyResult<Bound<'py, PyDict>> {
+    let columns = py
+        .allow_threads(|| -> Result<Vec<(f64, PhColumns)>> {
+            let dist_records = dist::calc_dist_records(evt_csv, sta_csv, sac_dir)?;
+            let columns = Mutex::new(Vec::with_capacity(periods.len()));
+
+            pick_ph_amp(
+                &dist_records,
+                sac_dir,
+                &periods,
+                snr,
+                dist,
+                nsta,
+                valid_ratio,
+                tmisfit,
+                ref_sta,
+                max_periods,
+                |period, records| {
+                    if let Some(out_dir) = out_dir {
+                        write_ph_files(&records, &period_dir(out_dir, period, snr, dist)?)?;
+                    }
+                    let cols = PhColumns::from_records(records);
+                    match &on_period {
+                        Some(callback) => Python::with_gil(|py| -> Result<()> {
+                            callback.call1(py, (period, cols.into_pydict(py)?))?;
+                            Ok(())
+                        }),
+                        None => {
+                            columns.lock().unwrap().push((period, cols));
+                            Ok(())
+                        }
+                    }
+                },
+            )?;
+
+            let mut columns = columns.into_inner().unwrap();
+            columns.sort_by(|a, b| a.0.total_cmp(&b.0));
+            Ok(columns)
+        })
+        // keep the exception raised by `on_period`
+        .map_err(|e| {
+            e.downcast::<PyErr>()
+                .unwrap_or_else(|e| PyIOError::new_err(e.to_string()))
+        })?;
+
+    let result = PyDict::new(py);
+    for (period, cols) in columns {
+        result.set_item(period, cols.into_pydict(py)?)?;
     }
+    Ok(result)
+}
 
-    Ok(())
+/// Corrected records of one period laid out column by column
+#[derive(Debug, Default)]
+struct PhColumns {
+    events: Vec<String>,
+    event: Vec<u32>,
+    lon: Vec<f64>,
+    lat: Vec<f64>,
+    time: Vec<f64>,
+    phv: Vec<f64>,
+    amp: Vec<f64>,
+}
+
+impl PhColumns {
+    fn from_records(records: HashMap<String, Vec<PhRecord>>) -> Self {
+        let mut grouped: Vec<_> = records.into_iter().collect();
+        grouped.sort_unstable_by(|a, b| a.0.cmp(&b.0));
+
+        let mut cols = Self::default();
+        for (i, (event, data)) in grouped.into_iter().enumerate() {
+            cols.events.push(event);
+            for rec in data {
+                cols.event.push(i as u32);
+                cols.lon.push(rec.lon);
+                cols.lat.push(rec.lat);
+                cols.time.push(rec.time);
+                cols.phv.push(rec.phv);
+                cols.amp.push(rec.amp);
+            }
+        }
+        cols
+    }
+
+    fn into_pydict<'py>(self, py: Python<'py>) -> PyResult<Bound<'py, PyDict>> {
+        let dict = PyDict::new(py);
+        dict.set_item("events", self.events)?;
+        dict.set_item("event", self.event.into_pyarray(py))?;
+        dict.set_item("lon", self.lon.into_pyarray(py))?;
+        dict.set_item("lat", self.lat.into_pyarray(py))?;
+        dict.set_item("time", self.time.into_pyarray(py))?;
+        dict.set_item("phv", self.phv.into_pyarray(py))?;
+        dict.set_item("amp", self.amp.into_pyarray(py))?;
+        Ok(dict)
+    }
 }
 
-fn gen_ph_amp_files(
+/// Runs phase picking for all periods, then correction on a sliding
+/// window of `max_periods` periods, `sink` receives the corrected records
+/// of every period.
+///
+/// The interpolated records of all periods are held until their period
+/// is corrected, a few tens of bytes per record and period, in exchange
+/// for reading every curve only once.
+fn pick_ph_amp<F>(
     dist_records: &[DistRecord],
-    sac_data_dir: &str,
-    period: f64,
-    snr_threshold: f64,
-    dist_threshold: f64,
+    sac_dir: &str,
+    periods: &[f64],
+    snr: f64,
+    dist: f64,
     nsta: usize,
     valid_ratio: f64,
     tmisfit: f64,
     [ref_lon, ref_lat]: [f64; 2],
+    max_periods: Option<usize>,
+    sink: F,
+) -> Result<()>
+where
+    F: Fn(f64, HashMap<String, Vec<PhRecord>>) -> Result<()> + Sync,
+{
+    let span = trace::span("find_phv_amp", format!("{:?}", periods));
+    let ph_records = ph_gen::find_phv_amp(Path::new(sac_dir), dist_records, periods, snr, dist)?;
+    drop(span);
+
+    let pbar = pbar(periods.len() as u64, "Calcing ph and amp");
+    let queue = Mutex::new(periods.iter().copied().zip(ph_records));
+    let workers = max_periods
+        .unwrap_or(periods.len())
+        .clamp(1, periods.len().max(1));
+    let correct = || -> Result<()> {
+        // a worker takes the next period as soon as its last one is written
+        loop {
+            let Some((period, records)) = queue.lock().unwrap().next() else {
+                return Ok(());
+            };
+            let _span = trace::span("correct_ph_records", period.to_string());
+            let corrected_ph_records = ph_correct::correct_ph_records(
+                records,
+                period,
+                nsta,
+                valid_ratio,
+                tmisfit,
+                (ref_lon, ref_lat),
+            );
+            if let Err(e) = sink(period, corrected_ph_records) {
+                // the other workers stop after their current period
+                queue.lock().unwrap().by_ref().for_each(drop);
+                return Err(e);
+            }
+            pbar.inc(1);
+        }
+    };
+    thread::scope(|s| {
+        let handles: Vec<_> = (0..workers).map(|_| s.spawn(correct)).collect();
+        handles
+            .into_iter()
+            .try_for_each(|h| h.join().expect("ph and amp worker panicked"))
+    })?;
+    pbar.finish();
+
+    Ok(())
+}
+
+fn period_dir(
     outdir: &str,
-) -> Result<()> {
+    period: f64,
+    snr_threshold: f64,
+    dist_threshold: f64,
+) -> Result<PathBuf> {
     let output_path = Path::new(outdir).join(format!(
         "{:.0}sec_{:.0}snr_{:.0}dist",
         period, snr_threshold, dist_threshold
     ));
     fs::create_dir_all(&output_path)
         .with_context(|| format!("Create ouput dir error: {}", output_path.display()))?;
-
-    let data_dir = Path::new(sac_data_dir);
-    let ph_records = ph_gen::find_phv_amp(
-        data_dir,
-        dist_records,
-        period,
-        snr_threshold,
-        dist_threshold,
-    )?;
-
-    // let grouped = ph_records.clone().into_iter().into_group_map();
-    // write_ph_files(grouped, &output_path)?;
-
-    let corrected_ph_records = ph_correct::correct_ph_records(
-        ph_records,
-        period,
-        nsta,
-        valid_ratio,
-        tmisfit,
-        (ref_lon, ref_lat),
-    );
-
-    write_ph_files(corrected_ph_records, &output_path)?;
-
-    Ok(())
+    Ok(output_path)
 }
 
-fn write_ph_files(results: HashMap<String, Vec<PhRecord>>, outdir: &Path) -> Result<()> {
+fn write_ph_files(results: &HashMap<String, Vec<PhRecord>>, outdir: &Path) -> Result<()> {
     results
-        .into_par_iter()
-        .try_for_each(|(evt, data)| write_ph_file(&evt, &data, outdir))
+        .par_iter()
+        .try_for_each(|(evt, data)| write_ph_file(evt, data, outdir))
 }
 
 fn write_ph_file(event: &str, data: &[PhRecord], outdir: &Path) -> Result<()> {
@@ -136,3 +321,44 @@ fn write_ph_file_txt(event: &str, data: &[PhRecord], outdir: &Path) -> Result<()
 
     Ok(())
 }
+
+/// Wrappers of the parsing and correction hot paths for `benches/`
+#[cfg(feature = "bench")]
+pub mod bench {
+    use super::{ph_correct, ph_gen};
+    use crate::utils::{points::GeoPoint, records::PhRecord};
+
+    use anyhow::Result;
+    use std::path::Path;
+
+    /// Number of points parsed from a `*_1_DISP.0` file
+    pub fn parse_disp_file(path: &Path) -> Result<usize> {
+        Ok(ph_gen::parse_disp_file(path)?.len())
+    }
+
+    /// Number of points parsed from a `*_snr.yyj.txt` file
+    pub fn parse_snr_file(path: &Path) -> Result<usize> {
+        Ok(ph_gen::parse_snr_file(path)?.len())
+    }
+
+    /// Number of records of one event kept by the correction, 0 if rejected
+    pub fn correct_event_ph_records(
+        records: Vec<PhRecord>,
+        period: f64,
+        nsta: usize,
+        nsta_per: f64,
+        tmisfit: f64,
+        ref_point: &GeoPoint,
+    ) -> usize {
+        ph_correct::correct_event_ph_records(
+            String::new(),
+            records,
+            period,
+            nsta,
+            nsta_per,
+            tmisfit,
+            ref_point,
+        )
+        .map_or(0, |(_, kept)| kept.len())
+    }
+}
@@ -0,0 +1,233 @@
+// —————————————————————————————————————————————————————————————————————————————
+// Binary cache of parsed SNR/DISP curves
+// —————————————————————————————————————————————————————————————————————————————
+
+use super::ph_gen::{DispPoint, SnrPoint, parse_disp_file, parse_snr_file};
+use crate::utils::bytes::ByteReader;
+use crate::utils::tmp_path;
+
+use anyhow::{Context, Result, bail};
+use memmap2::Mmap;
+use std::{
+    collections::HashMap,
+    fs::{self, File},
+    io::{BufWriter, Write},
+    path::{Path, PathBuf},
+    time::UNIX_EPOCH,
+};
+
+const MAGIC: &[u8; 8] = b"TPWTCRV1";
+const CACHE_FILE: &str = "curves.cache";
+
+/// Size and modification time of a source text file
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+struct Fingerprint {
+    mtime: u64,
+    size: u64,
+}
+
+impl Fingerprint {
+    fn of(path: &Path) -> Option<Self> {
+        let meta = fs::metadata(path).ok()?;
+        let mtime = meta
+            .modified()
+            .ok()?
+            .duration_since(UNIX_EPOCH)
+            .ok()?
+            .as_nanos() as u64;
+        Some(Self {
+            mtime,
+            size: meta.len(),
+        })
+    }
+}
+
+/// Parsed SNR and DISP curves of one event-station record
+#[derive(Debug)]
+pub struct Curves {
+    pub snr: Vec<SnrPoint>,
+    pub disp: Vec<DispPoint>,
+}
+
+#[derive(Debug)]
+struct Entry {
+    snr_fp: Fingerprint,
+    disp_fp: Fingerprint,
+    curves: Curves,
+}
+
+/// Curves of all stations under one event directory
+///
+/// Stored in `{event_dir}/curves.cache` as little-endian binary:
+/// a magic tag, the entry count, then per station its name, the
+/// fingerprints of both text files and the curves column by column.
+pub struct CurveCache {
+    path: PathBuf,
+    entries: HashMap<String, Entry>,
+    dirty: bool,
+}
+
+impl CurveCache {
+    /// Loads the cache of `event_dir`, a missing or corrupt file gives an empty cache
+    pub fn open(event_dir: &Path) -> Self {
+        let path = event_dir.join(CACHE_FILE);
+        let entries = load_entries(&path).unwrap_or_default();
+        Self {
+            path,
+            entries,
+            dirty: false,
+        }
+    }
+
+    /// Returns the curves of `station`, the text files are parsed only
+    /// when the cached entry is missing or its fingerprints are stale
+    pub fn get(&mut self, station: &str, snr_path: &Path, disp_path: &Path) -> Option<&Curves> {
+        self.get_with(station, snr_path, disp_path, || parse_snr_file(snr_path))
+    }
+
+    /// Same as [`Self::get`] with the SNR points given by `read_snr`,
+    /// `snr_path` is only used for the fingerprint
+    pub fn get_with(
+        &mut self,
+        station: &str,
+        snr_path: &Path,
+        disp_path: &Path,
+        read_snr: impl FnOnce() -> Result<Vec<SnrPoint>>,
+    ) -> Option<&Curves> {
+        let (Some(snr_fp), Some(disp_fp)) = (Fingerprint::of(snr_path), Fingerprint::of(disp_path))
+        else {
+            self.dirty |= self.entries.remove(station).is_some();
+            return None;
+        };
+
+        let fresh = self
+            .entries
+            .get(station)
+            .is_some_and(|e| e.snr_fp == snr_fp && e.disp_fp == disp_fp);
+        if !fresh {
+            self.dirty = true;
+            match (read_snr(), parse_disp_file(disp_path)) {
+                (Ok(snr), Ok(disp)) => {
+                    let curves = Curves { snr, disp };
+                    self.entries.insert(
+                        station.to_string(),
+                        Entry {
+                            snr_fp,
+                            disp_fp,
+                            curves,
+                        },
+                    );
+                }
+                _ => {
+                    self.entries.remove(station);
+                    return None;
+                }
+            }
+        }
+
+        self.entries.get(station).map(|e| &e.curves)
+    }
+
+    /// Writes the cache back if any entry was rebuilt
+    pub fn save(&self) -> Result<()> {
+        if !self.dirty {
+            return Ok(());
+        }
+
+        let tmp = tmp_path(&self.path);
+        {
+            let file = File::create(&tmp)
+                .with_context(|| format!("create curve cache error: {}", tmp.display()))?;
+            let mut wtr = BufWriter::new(file);
+            wtr.write_all(MAGIC)?;
+            wtr.write_all(&(self.entries.len() as u32).to_le_bytes())?;
+            for (station, entry) in &self.entries {
+                write_entry(&mut wtr, station, entry)?;
+            }
+            wtr.flush()?;
+        }
+        fs::rename(&tmp, &self.path)?;
+
+        Ok(())
+    }
+}
+
+fn write_entry<W: Write>(wtr: &mut W, station: &str, entry: &Entry) -> Result<()> {
+    let Curves { snr, disp } = &entry.curves;
+
+    wtr.write_all(&(station.len() as u16).to_le_bytes())?;
+    wtr.write_all(station.as_bytes())?;
+    for fp in [entry.snr_fp, entry.disp_fp] {
+        wtr.write_all(&fp.mtime.to_le_bytes())?;
+        wtr.write_all(&fp.size.to_le_bytes())?;
+    }
+    wtr.write_all(&(snr.len() as u32).to_le_bytes())?;
+    wtr.write_all(&(disp.len() as u32).to_le_bytes())?;
+
+    let columns: [Box<dyn Iterator<Item = f64> + '_>; 5] = [
+        Box::new(snr.iter().map(|p| p.period)),
+        Box::new(snr.iter().map(|p| p.snr)),
+        Box::new(disp.iter().map(|p| p.period)),
+        Box::new(disp.iter().map(|p| p.phv)),
+        Box::new(disp.iter().map(|p| p.amp)),
+    ];
+    for column in columns {
+        for v in column {
+            wtr.write_all(&v.to_le_bytes())?;
+        }
+    }
+
+    Ok(())
+}
+
+fn load_entries(path: &Path) -> Result<HashMap<String, Entry>> {
+    let file = File::open(path)?;
+    let mmap = unsafe { Mmap::map(&file)? };
+    let mut rdr = ByteReader::new(&mmap);
+
+    if rdr.take(MAGIC.len())? != MAGIC.as_slice() {
+        bail!("bad curve cache: {}", path.display());
+    }
+
+    let count = rdr.u32()? as usize;
+    let mut entries = HashMap::with_capacity(count);
+    for _ in 0..count {
+        let len = rdr.u16()? as usize;
+        let station = std::str::from_utf8(rdr.take(len)?)?.to_string();
+        let snr_fp = Fingerprint {
+            mtime: rdr.u64()?,
+            size: rdr.u64()?,
+        };
+        let disp_fp = Fingerprint {
+            mtime: rdr.u64()?,
+            size: rdr.u64()?,
+        };
+        let n_snr = rdr.u32()? as usize;
+        let n_disp = rdr.u32()? as usize;
+
+        let snr = rdr
+            .f64s(n_snr)?
+            .into_iter()
+            .zip(rdr.f64s(n_snr)?)
+            .map(|(period, snr)| SnrPoint { period, snr })
+            .collect();
+        let (periods, phvs, amps) = (rdr.f64s(n_disp)?, rdr.f64s(n_disp)?, rdr.f64s(n_disp)?);
+        let disp = periods
+            .into_iter()
+            .zip(phvs)
+            .zip(amps)
+            .map(|((period, phv), amp)| DispPoint { period, phv, amp })
+            .collect();
+
+        entries.insert(
+            station,
+            Entry {
+                snr_fp,
+                disp_fp,
+                curves: Curves { snr, disp },
+            },
+        );
+    }
+
+    Ok(entries)
+}
@@ -2,7 +2,10 @@
 // Create dist records
 // —————————————————————————————————————————————————————————————————————————————
 
+use crate::trace;
 use crate::utils::records::DistRecord;
+use crate::utils::sac::SacHeader;
+use crate::utils::tmp_path;
 
 use anyhow::{Context, Result};
 use chrono::{DateTime, Utc};
@@ -10,29 +13,151 @@ use csv::ReaderBuilder;
 use rayon::prelude::*;
 use sacio::Sac;
 use std::{
-    collections::HashSet,
-    fs::File,
-    io::{BufWriter, Write},
-    path::PathBuf,
+    collections::{HashMap, HashSet},
+    fs::{self, File},
+    io::{BufRead, BufReader, BufWriter, Write},
+    path::{Path, PathBuf},
     sync::Arc,
+    time::UNIX_EPOCH,
 };
 use walkdir::WalkDir;
 
+/// Distance index kept in the SAC data dir
+const INDEX_FILE: &str = "dist_records.idx";
+
+/// Path of the SAC file relative to the SAC data dir, one pair can have
+/// several components or locations
+type IndexKey = PathBuf;
+
+/// A distance record with the mtime (ns) of the SAC file it was read from
+#[derive(Debug, Clone)]
+struct IndexEntry {
+    record: DistRecord,
+    mtime: u64,
+}
+
 /// Creates distance records from SAC files
+///
+/// Only the SAC headers are read, and the results are kept in
+/// `{sac_data_dir}/dist_records.idx`. Files whose mtime matches the index
+/// are not opened again on later runs.
 pub fn calc_dist_records(
     event_csv: &str,
     station_csv: &str,
     sac_data_dir: &str,
 ) -> Result<Vec<DistRecord>> {
+    let _span = trace::span("calc_dist_records", sac_data_dir);
     let valid_events = Arc::new(load_valid_events(event_csv)?);
     let valid_stations = Arc::new(load_valid_stations(station_csv)?);
 
-    WalkDir::new(sac_data_dir)
+    let root = Path::new(sac_data_dir);
+    let index_path = root.join(INDEX_FILE);
+    let mut index = load_index(&index_path).unwrap_or_default();
+
+    let entries = WalkDir::new(root)
         .into_iter()
         .par_bridge()
         .filter_map(|entry| parse_sac_entry(entry.ok()?, &valid_events, &valid_stations))
-        .map(|(event, station, path)| create_dist_record(event, station, path))
-        .collect()
+        .map(|(event, station, path)| indexed_dist_record(&index, root, event, station, path))
+        .collect::<Result<Vec<(IndexKey, IndexEntry, bool)>>>()?;
+
+    let mut changed = false;
+    let mut records = Vec::with_capacity(entries.len());
+    for (key, entry, fresh) in entries {
+        changed |= !fresh;
+        records.push(entry.record.clone());
+        if !fresh {
+            index.insert(key, entry);
+        }
+    }
+
+    if changed {
+        // an unwritable index only costs a header scan on the next run
+        let _ = save_index(&index_path, &index);
+    }
+
+    Ok(records)
+}
+
+/// Looks the SAC file up in the index, reads its header when missing or modified.
+/// The flag tells if the indexed entry was reused.
+fn indexed_dist_record(
+    index: &HashMap<IndexKey, IndexEntry>,
+    root: &Path,
+    event: String,
+    station: String,
+    path: PathBuf,
+) -> Result<(IndexKey, IndexEntry, bool)> {
+    let mtime = fs::metadata(&path)
+        .and_then(|m| m.modified())
+        .ok()
+        .and_then(|t| t.duration_since(UNIX_EPOCH).ok())
+        .map_or(0, |d| d.as_nanos() as u64);
+
+    let key = path.strip_prefix(root).unwrap_or(&path).to_path_buf();
+    if let Some(entry) = index.get(&key).filter(|e| mtime != 0 && e.mtime == mtime) {
+        return Ok((key, entry.clone(), true));
+    }
+
+    let record = create_dist_record(event, station, path)?;
+    Ok((key, IndexEntry { record, mtime }, false))
+}
+
+/// Index format: one `event station dist lon lat mtime path` line per SAC
+/// file, the path relative to the SAC data dir comes last as it may hold
+/// spaces
+fn load_index(path: &Path) -> Result<HashMap<IndexKey, IndexEntry>> {
+    let reader = BufReader::new(File::open(path)?);
+
+    let mut index = HashMap::new();
+    for line in reader.lines() {
+        let line = line?;
+        let cols: Vec<&str> = line.splitn(7, ' ').collect();
+        let &[event, station, dist, lon, lat, mtime, path] = cols.as_slice() else {
+            continue;
+        };
+        let record = DistRecord {
+            event: event.to_string(),
+            station: station.to_string(),
+            dist: dist.parse()?,
+            lon: lon.parse()?,
+            lat: lat.parse()?,
+        };
+        let entry = IndexEntry {
+            record,
+            mtime: mtime.parse()?,
+        };
+        index.insert(PathBuf::from(path), entry);
+    }
+
+    Ok(index)
+}
+
+fn save_index(path: &Path, index: &HashMap<IndexKey, IndexEntry>) -> Result<()> {
+    let tmp = tmp_path(path);
+    {
+        let file = File::create(&tmp)
+            .with_context(|| format!("create dist index error: {}", tmp.display()))?;
+        let mut writer = BufWriter::new(file);
+        for (key, IndexEntry { record, mtime }) in index {
+            // `{}` keeps the shortest round-trip form so reloaded values are identical
+            writeln!(
+                writer,
+                "{} {} {} {} {} {} {}",
+                record.event,
+                record.station,
+                record.dist,
+                record.lon,
+                record.lat,
+                mtime,
+                key.display()
+            )?;
+        }
+        writer.flush()?;
+    }
+    fs::rename(&tmp, path)?;
+
+    Ok(())
 }
 
 /// Parses SAC directory entry
@@ -60,21 +185,20 @@ fn parse_sac_entry(
         })
 }
 
-/// Creates distance record from SAC file
+/// Creates distance record from the header of a SAC file
 fn create_dist_record(event: String, station: String, path: PathBuf) -> Result<DistRecord> {
-    let sac = Sac::from_file(&path)
-        .map_err(|_| anyhow::anyhow!("Failed to read SAC file {}", path.display()))?;
+    let header = SacHeader::from_file(&path)?;
     Ok(DistRecord {
         event,
         station,
-        dist: sac.dist_km().into(),
-        lon: sac.station_lon().into(),
-        lat: sac.station_lat().into(),
+        dist: header.dist.into(),
+        lon: header.stlo.into(),
+        lat: header.stla.into(),
     })
 }
 
 /// Load valid event IDs by parsing "time" column in RFC3339 format into "%Y%m%d%H%M"
-fn load_valid_events(event_csv: &str) -> Result<HashSet<String>> {
+pub(super) fn load_valid_events(event_csv: &str) -> Result<HashSet<String>> {
     let mut rdr = ReaderBuilder::new()
         .has_headers(true)
         .from_path(event_csv)?;
@@ -98,7 +222,7 @@ fn load_valid_events(event_csv: &str) -> Result<HashSet<String>> {
 }
 
 /// Load valid station codes from station.csv
-fn load_valid_stations(station_csv: &str) -> Result<HashSet<String>> {
+pub(super) fn load_valid_stations(station_csv: &str) -> Result<HashSet<String>> {
     let mut rdr = ReaderBuilder::new()
         .has_headers(true)
         .from_path(station_csv)?;
@@ -184,3 +308,53 @@ fn make_dist_records(
 
     Ok(results)
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::utils::sac::HEADER_LEN;
+
+    /// Little-endian SAC header with only `dist` (word 50) and `nvhdr` (word 76) set
+    fn write_header(path: &Path, dist: f32) -> Result<()> {
+        let mut buf = vec![0u8; HEADER_LEN];
+        buf[4 * 50..4 * 51].copy_from_slice(&dist.to_le_bytes());
+        buf[4 * 76..4 * 77].copy_from_slice(&6i32.to_le_bytes());
+        fs::write(path, buf)?;
+        Ok(())
+    }
+
+    #[test]
+    fn index_keeps_every_file_of_a_pair() -> Result<()> {
+        let dir = std::env::temp_dir().join(format!("tpwt_dist_{}", std::process::id()));
+        let sac_dir = dir.join("sac");
+        let evt_dir = sac_dir.join("201602171726");
+        fs::create_dir_all(&evt_dir)?;
+        fs::write(dir.join("events.csv"), "time\n2016-02-17T17:26:00Z\n")?;
+        fs::write(dir.join("stations.csv"), "station\nS1\n")?;
+        // two components of one event-station pair
+        write_header(&evt_dir.join("201602171726.S1.LHZ.sac"), 100.0)?;
+        write_header(&evt_dir.join("201602171726.S1.BHZ.sac"), 200.0)?;
+
+        let run = || {
+            calc_dist_records(
+                dir.join("events.csv").to_str().unwrap(),
+                dir.join("stations.csv").to_str().unwrap(),
+                sac_dir.to_str().unwrap(),
+            )
+        };
+        let mut dists: Vec<f64> = run()?.iter().map(|r| r.dist).collect();
+        dists.sort_by(f64::total_cmp);
+        let index = load_index(&sac_dir.join(INDEX_FILE))?;
+        // a second run reads both back from the index
+        let mut again: Vec<f64> = run()?.iter().map(|r| r.dist).collect();
+        again.sort_by(f64::total_cmp);
+        fs::remove_dir_all(&dir)?;
+
+        assert_eq!(dists, [100.0, 200.0]);
+        assert_eq!(again, dists);
+        assert_eq!(index.len(), 2);
+        let key = Path::new("201602171726").join("201602171726.S1.LHZ.sac");
+        assert_eq!(index[&key].record.dist, 100.0);
+        Ok(())
+    }
+}
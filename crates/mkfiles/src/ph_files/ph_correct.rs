@@ -1,5 +1,6 @@
 use crate::utils::points::GeoPoint;
 use crate::utils::records::PhRecord;
+use crate::utils::sphere_index::SphereIndex;
 
 use itertools::Itertools;
 use rayon::prelude::*;
@@ -70,7 +71,7 @@ fn get_dist(lat1: f64, lon1: f64, lat2: f64, lon2: f64) -> f64 {
 // nsta -> min stations
 // min -> ratio
 // max -> misfit
-fn correct_event_ph_records(
+pub(super) fn correct_event_ph_records(
     event_name: String,
     records: Vec<PhRecord>,
     period: f64,
@@ -99,38 +100,29 @@ fn correct_event_ph_records(
 
     nodes.par_sort_unstable_by(|a, b| a.dist_to_ref.partial_cmp(&b.dist_to_ref).unwrap());
 
-    let mut processed: Vec<PhRecord> = Vec::with_capacity(nodes.len());
+    // processed stations are indexed by insertion order, `processed_phv` holds their phv
+    let mut processed = SphereIndex::with_capacity(nodes.len());
+    let mut processed_phv: Vec<f64> = Vec::with_capacity(nodes.len());
     let mut valid_records: Vec<PhRecord> = Vec::with_capacity(nodes.len());
 
     for mut node in nodes {
-        if processed.is_empty() {
-            processed.push(node.ph.clone());
-            valid_records.push(node.ph);
-            continue;
-        }
-
-        let nearest = processed
-            .iter()
-            .min_by(|a, b| {
-                let da = node.geo.distance_to(&a.to_geo_point());
-                let db = node.geo.distance_to(&b.to_geo_point());
-                da.partial_cmp(&db).unwrap_or(std::cmp::Ordering::Equal)
-            })
-            .unwrap();
+        if let Some(nearest) = processed.nearest(&node.geo) {
+            let path_dis = node.ph.phv * node.ph.time;
+            let expected_time = path_dis / processed_phv[nearest];
 
-        let path_dis = node.ph.phv * node.ph.time;
-        let expected_time = path_dis / nearest.phv;
+            let dt =
+                (node.ph.time - expected_time + period * 0.5).rem_euclid(period) - period * 0.5;
 
-        let dt = (node.ph.time - expected_time + period * 0.5).rem_euclid(period) - period * 0.5;
+            if dt.abs() > tmisfit {
+                continue;
+            }
 
-        if dt.abs() > tmisfit {
-            continue;
+            node.ph.time = expected_time + dt;
+            node.ph.phv = path_dis / node.ph.time;
         }
 
-        node.ph.time = expected_time + dt;
-        node.ph.phv = path_dis / node.ph.time;
-
-        processed.push(node.ph.clone());
+        processed.insert(node.geo);
+        processed_phv.push(node.ph.phv);
         valid_records.push(node.ph);
     }
 
@@ -1,6 +1,9 @@
+use super::curve_cache::{CurveCache, Curves};
+use crate::snr::SnrStore;
 use crate::utils::records::{DistRecord, PhRecord};
 
 use anyhow::{Context, Result};
+use itertools::Itertools;
 use rayon::prelude::*;
 use std::{
     fs::File,
@@ -10,42 +13,105 @@ use std::{
 
 /// SNR measurement data point
 #[derive(Debug)]
-struct SnrPoint {
-    period: f64,
-    snr: f64,
+pub(super) struct SnrPoint {
+    pub(super) period: f64,
+    pub(super) snr: f64,
 }
 
 /// Dispersion measurement data point
 #[derive(Debug)]
-struct DispPoint {
-    period: f64,
-    phv: f64,
-    amp: f64,
+pub(super) struct DispPoint {
+    pub(super) period: f64,
+    pub(super) phv: f64,
+    pub(super) amp: f64,
 }
 
 /// Main entry point for phase velocity analysis
+///
+/// Every SNR/DISP file is parsed once and interpolated at all `periods`,
+/// the returned records are grouped in the same order as `periods`.
+/// Parsed curves are kept in a per-event [`CurveCache`], so reruns with
+/// other thresholds skip the text parsing. SNR curves from the native
+/// [`SnrStore`] are used in preference to the `*_snr.yyj.txt` files.
 pub fn find_phv_amp(
     data_dir: &Path,
     dist_records: &[DistRecord],
-    period: f64,
+    periods: &[f64],
     snr_threshold: f64,
     dist_threshold: f64,
-) -> Result<Vec<(String, PhRecord)>> {
-    let ph_records: Vec<(String, PhRecord)> = dist_records
-        .par_iter()
+) -> Result<Vec<Vec<(String, PhRecord)>>> {
+    let events = dist_records
+        .iter()
         .filter(|r| r.dist >= dist_threshold)
-        .filter_map(|rec| process_single_dist_record(rec, period, &data_dir, snr_threshold))
+        .map(|r| (r.event.as_str(), r))
+        .into_group_map();
+
+    let measured: Vec<(&DistRecord, Vec<Option<(f64, f64)>>)> = events
+        .into_par_iter()
+        .flat_map_iter(|(event, records)| {
+            process_event_records(data_dir, event, records, periods, snr_threshold)
+        })
+        .collect();
+
+    Ok(split_periods(&measured, periods.len()))
+}
+
+/// Same as [`find_phv_amp`] for curves already in memory
+///
+/// Each record comes with the SNR and DISP curves of its waveform, so
+/// nothing is read back from the event directory.
+pub fn phv_amp_of_curves(
+    records: &[(DistRecord, Curves)],
+    periods: &[f64],
+    snr_threshold: f64,
+    dist_threshold: f64,
+) -> Vec<Vec<(String, PhRecord)>> {
+    let measured: Vec<(&DistRecord, Vec<Option<(f64, f64)>>)> = records
+        .par_iter()
+        .filter(|(rec, _)| rec.dist >= dist_threshold)
+        .filter_map(|(rec, curves)| {
+            interp_curves(curves, periods, snr_threshold).map(|values| (rec, values))
+        })
         .collect();
 
-    Ok(ph_records)
+    split_periods(&measured, periods.len())
 }
 
-/// Processes SNR data file and interpolates value at target period
-fn process_snr_file(path: &Path, target_period: f64) -> Result<Option<f64>> {
+/// Regroups the interpolated values of every record into one list per period
+fn split_periods(
+    measured: &[(&DistRecord, Vec<Option<(f64, f64)>>)],
+    n_periods: usize,
+) -> Vec<Vec<(String, PhRecord)>> {
+    (0..n_periods)
+        .into_par_iter()
+        .map(|i| {
+            measured
+                .iter()
+                .filter_map(|(rec, values)| {
+                    let (phv, amp) = values[i]?;
+                    // calculate time && collect result
+                    let time = rec.dist / phv;
+                    Some((
+                        rec.event.clone(),
+                        PhRecord {
+                            lon: rec.lon,
+                            lat: rec.lat,
+                            time,
+                            phv,
+                            amp,
+                        },
+                    ))
+                })
+                .collect::<Vec<_>>()
+        })
+        .collect()
+}
+
+/// Parses all valid points of a SNR data file
+pub(super) fn parse_snr_file(path: &Path) -> Result<Vec<SnrPoint>> {
     let file = File::open(path).with_context(|| format!("opening SNR file {}", path.display()))?;
     let reader = BufReader::new(file);
 
-    // 1) collect and parse all valid points
     let mut pts = Vec::new();
     for line in reader.lines() {
         let s = line?;
@@ -62,18 +128,11 @@ fn process_snr_file(path: &Path, target_period: f64) -> Result<Option<f64>> {
         pts.push(SnrPoint { period, snr });
     }
 
-    // 2) sliding-window interpolation
-    Ok(pts.windows(2).find_map(|w| {
-        let [a, b] = [&w[0], &w[1]];
-        (b.period > target_period).then(|| {
-            let t = (target_period - a.period) / (b.period - a.period);
-            a.snr + t * (b.snr - a.snr)
-        })
-    }))
+    Ok(pts)
 }
 
-/// Processes dispersion data file and interpolates values at target period
-fn process_disp_file(path: &Path, target_period: f64) -> Result<Option<(f64, f64)>> {
+/// Parses all valid points of a dispersion data file
+pub(super) fn parse_disp_file(path: &Path) -> Result<Vec<DispPoint>> {
     let file = File::open(path)?;
     let reader = BufReader::new(file);
 
@@ -96,47 +155,101 @@ fn process_disp_file(path: &Path, target_period: f64) -> Result<Option<(f64, f64
         pts.push(DispPoint { period, phv, amp });
     }
 
-    Ok(pts.windows(2).find_map(|w| {
+    Ok(pts)
+}
+
+/// Sliding-window interpolation of SNR at target period
+fn interp_snr(pts: &[SnrPoint], target_period: f64) -> Option<f64> {
+    pts.windows(2).find_map(|w| {
+        let [a, b] = [&w[0], &w[1]];
+        (b.period > target_period).then(|| {
+            let t = (target_period - a.period) / (b.period - a.period);
+            a.snr + t * (b.snr - a.snr)
+        })
+    })
+}
+
+/// Sliding-window interpolation of (phv, amp) at target period
+fn interp_disp(pts: &[DispPoint], target_period: f64) -> Option<(f64, f64)> {
+    pts.windows(2).find_map(|w| {
         let [a, b] = [&w[0], &w[1]];
         (b.period > target_period).then(|| {
             let t = (target_period - a.period) / (b.period - a.period);
             (a.phv + t * (b.phv - a.phv), a.amp + t * (b.amp - a.amp))
         })
-    }))
+    })
 }
 
-fn process_single_dist_record(
-    rec: &DistRecord,
-    period: f64,
+/// Measures all records of one event, reading curves through the event's cache
+fn process_event_records<'a>(
     data_dir: &Path,
+    event: &str,
+    records: Vec<&'a DistRecord>,
+    periods: &[f64],
     snr_threshold: f64,
-) -> Option<(String, PhRecord)> {
-    let snr_path = data_dir
-        .join(&rec.event)
-        .join(format!("{}.{}.LHZ.sac_snr.yyj.txt", rec.event, rec.station));
-    let disp_path = data_dir
-        .join(&rec.event)
-        .join(format!("{}.{}.LHZ.sac_1_DISP.0", rec.event, rec.station));
-
-    // check if SNR pass snr_threshold
-    let snr_value = process_snr_file(&snr_path, period).ok().flatten()?;
-    if snr_value < snr_threshold {
+) -> Vec<(&'a DistRecord, Vec<Option<(f64, f64)>>)> {
+    let event_dir = data_dir.join(event);
+    let mut cache = CurveCache::open(&event_dir);
+    let snr_store = SnrStore::open(&event_dir).ok();
+
+    let measured = records
+        .into_iter()
+        .filter_map(|rec| {
+            let snr_path =
+                event_dir.join(format!("{}.{}.LHZ.sac_snr.yyj.txt", rec.event, rec.station));
+            let disp_path =
+                event_dir.join(format!("{}.{}.LHZ.sac_1_DISP.0", rec.event, rec.station));
+            let stored = snr_store
+                .as_ref()
+                .and_then(|s| Some((s.path(), s.get(&rec.station)?)));
+            let curves = match stored {
+                Some((store_path, (snr_periods, snr))) => {
+                    cache.get_with(&rec.station, store_path, &disp_path, || {
+                        Ok(snr_points(snr_periods, snr))
+                    })?
+                }
+                None => cache.get(&rec.station, &snr_path, &disp_path)?,
+            };
+            interp_curves(curves, periods, snr_threshold).map(|values| (rec, values))
+        })
+        .collect();
+
+    // an unwritable cache only costs a re-parse on the next run
+    let _ = cache.save();
+
+    measured
+}
+
+pub(super) fn snr_points(periods: &[f64], snr: &[f64]) -> Vec<SnrPoint> {
+    periods
+        .iter()
+        .zip(snr)
+        .map(|(&period, &snr)| SnrPoint { period, snr })
+        .collect()
+}
+
+/// Interpolates (phv, amp) of one event-station record at every period,
+/// periods whose SNR is below `snr_threshold` are `None`.
+fn interp_curves(
+    curves: &Curves,
+    periods: &[f64],
+    snr_threshold: f64,
+) -> Option<Vec<Option<(f64, f64)>>> {
+    // check which periods pass snr_threshold
+    let passed: Vec<bool> = periods
+        .iter()
+        .map(|&p| interp_snr(&curves.snr, p).is_some_and(|snr| !(snr < snr_threshold)))
+        .collect();
+    if !passed.iter().any(|&ok| ok) {
         return None;
     }
 
     // DISP interpolation
-    let (phv, amp) = process_disp_file(&disp_path, period).ok().flatten()?;
-
-    // calculate time && collect result
-    let time = rec.dist / phv;
-    Some((
-        rec.event.clone(),
-        PhRecord {
-            lon: rec.lon,
-            lat: rec.lat,
-            time,
-            phv,
-            amp,
-        },
-    ))
+    Some(
+        periods
+            .iter()
+            .zip(passed)
+            .map(|(&p, ok)| if ok { interp_disp(&curves.disp, p) } else { None })
+            .collect(),
+    )
 }
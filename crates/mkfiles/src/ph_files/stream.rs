@@ -0,0 +1,269 @@
+// —————————————————————————————————————————————————————————————————————————————
+// Event by event FTAN, SNR, distance and phase picking
+// —————————————————————————————————————————————————————————————————————————————
+
+use super::curve_cache::Curves;
+use super::dist::{load_valid_events, load_valid_stations};
+use super::ph_gen::{DispPoint, phv_amp_of_curves, snr_points};
+use super::{PhColumns, period_dir, ph_correct, write_ph_files};
+use crate::ftan::{self, FtanParams};
+use crate::pred_store::PredStore;
+use crate::snr::{SnrParams, SnrStore, spectral_snr};
+use crate::trace;
+use crate::utils::records::DistRecord;
+use crate::utils::sac::read_sac;
+
+use anyhow::{Context, Result};
+use pyo3::{exceptions::PyIOError, prelude::*, types::PyDict};
+use rayon::prelude::*;
+use std::{
+    collections::HashSet,
+    fs,
+    path::{Path, PathBuf},
+};
+
+/// SNR curve and, with a prediction, the picking input of one waveform
+struct Measured {
+    station: String,
+    periods: Vec<f64>,
+    snr: Vec<f64>,
+    record: Option<(DistRecord, Curves)>,
+}
+
+/// Runs FTAN, SNR, distance and phase picking of one event at a time
+///
+/// The per-event counterpart of `make_disp_files`, `make_snr_store` and
+/// `make_ph_amp_arrays`. Every waveform is read once for its DISP curve,
+/// its SNR curve and its distance, and the phase records are picked from
+/// the curves in memory. The `_1_DISP.0` files and `snr.store` are still
+/// written, so later runs read the same data. `run` releases the GIL,
+/// several events can be processed from Python threads at once.
+///
+/// Examples:
+/// ```python
+/// from tpwt._core import EventPipeline
+///
+/// pipeline = EventPipeline(
+///     evt_csv, sta_csv, sac_dir, path_dir, [20, 25], 10, 3500, 10, 0.3, 8, ref_sta
+/// )
+/// for event in pipeline.events():
+///     ph_amps = pipeline.run(event)  # same layout as `make_ph_amp_arrays`
+/// ```
+#[pyclass]
+pub struct EventPipeline {
+    sac_dir: PathBuf,
+    path_dir: PathBuf,
+    store: Option<PredStore>,
+    valid_events: HashSet<String>,
+    valid_stations: HashSet<String>,
+    ftan_params: FtanParams,
+    snr_params: SnrParams,
+    periods: Vec<f64>,
+    snr: f64,
+    dist: f64,
+    nsta: usize,
+    valid_ratio: f64,
+    tmisfit: f64,
+    ref_sta: (f64, f64),
+    out_dir: Option<String>,
+}
+
+impl EventPipeline {
+    /// Valid events under `sac_dir`, the ones with most waveforms first
+    pub fn events(&self) -> Result<Vec<String>> {
+        let mut events: Vec<(usize, String)> = fs::read_dir(&self.sac_dir)
+            .with_context(|| format!("read dir error: {}", self.sac_dir.display()))?
+            .filter_map(|entry| {
+                let path = entry.ok()?.path();
+                let event = path.file_name()?.to_str()?.to_string();
+                if !path.is_dir() || !self.valid_events.contains(&event) {
+                    return None;
+                }
+                Some((fs::read_dir(&path).ok()?.count(), event))
+            })
+            .collect();
+        events.sort_unstable_by(|a, b| b.cmp(a));
+
+        Ok(events.into_iter().map(|(_, event)| event).collect())
+    }
+
+    /// Corrected phase records of every period of one event
+    fn process(&self, event: &str) -> Result<Vec<(f64, PhColumns)>> {
+        let _span = trace::span("event_pipeline", event);
+        let event_dir = self.sac_dir.join(event);
+        let sac_files: Vec<(String, PathBuf)> = fs::read_dir(&event_dir)
+            .with_context(|| format!("read dir error: {}", event_dir.display()))?
+            .filter_map(|entry| {
+                let path = entry.ok()?.path();
+                if path.extension()? != "sac" {
+                    return None;
+                }
+                let station = path.file_name()?.to_str()?.split('.').nth(1)?.to_string();
+                Some((station, path))
+            })
+            .collect();
+
+        let measured = sac_files
+            .into_par_iter()
+            .filter_map(|(station, path)| self.measure(event, station, &path).transpose())
+            .collect::<Result<Vec<_>>>()?;
+
+        let mut snr_curves = Vec::with_capacity(measured.len());
+        let mut records = Vec::with_capacity(measured.len());
+        for Measured {
+            station,
+            periods,
+            snr,
+            record,
+        } in measured
+        {
+            snr_curves.push((station, periods, snr));
+            records.extend(record);
+        }
+        if !snr_curves.is_empty() {
+            SnrStore::write(&event_dir, &snr_curves)?;
+        }
+
+        let ph_records = phv_amp_of_curves(&records, &self.periods, self.snr, self.dist);
+        self.periods
+            .par_iter()
+            .zip(ph_records)
+            .map(|(&period, records)| {
+                let corrected = ph_correct::correct_ph_records(
+                    records,
+                    period,
+                    self.nsta,
+                    self.valid_ratio,
+                    self.tmisfit,
+                    self.ref_sta,
+                );
+                if let Some(out_dir) = &self.out_dir {
+                    let output_path = period_dir(out_dir, period, self.snr, self.dist)?;
+                    write_ph_files(&corrected, &output_path)?;
+                }
+                Ok((period, PhColumns::from_records(corrected)))
+            })
+            .collect()
+    }
+
+    /// Reads one waveform and measures its SNR and, when it has a
+    /// prediction, its dispersion. Unreadable files are skipped like in
+    /// the stage by stage functions.
+    fn measure(&self, event: &str, station: String, path: &Path) -> Result<Option<Measured>> {
+        let _span = trace::span("measure", path.to_string_lossy());
+        let Ok((header, data)) = read_sac(path) else {
+            return Ok(None);
+        };
+        let (periods, snr) = spectral_snr(&header, &data, &self.snr_params);
+
+        let rows = match ftan::load_prediction(self.store.as_ref(), &self.path_dir, path) {
+            Some(prediction) => {
+                let rows = ftan::ftan(&header, &data, &prediction, &self.ftan_params);
+                ftan::write_disp_file(path, &rows)?;
+                Some(rows)
+            }
+            None => None,
+        };
+        let record = rows
+            .filter(|_| self.valid_stations.contains(&station))
+            .map(|rows| {
+                let record = DistRecord {
+                    event: event.to_string(),
+                    station: station.clone(),
+                    dist: header.dist.into(),
+                    lon: header.stlo.into(),
+                    lat: header.stla.into(),
+                };
+                let disp = rows
+                    .iter()
+                    .map(|row| DispPoint {
+                        period: row.obper,
+                        phv: row.phvel,
+                        amp: row.amp,
+                    })
+                    .collect();
+                let curves = Curves {
+                    snr: snr_points(&periods, &snr),
+                    disp,
+                };
+                (record, curves)
+            });
+
+        Ok(Some(Measured {
+            station,
+            periods,
+            snr,
+            record,
+        }))
+    }
+}
+
+#[pymethods]
+impl EventPipeline {
+    #[new]
+    #[pyo3(signature = (
+        evt_csv, sta_csv, sac_dir, path_dir, periods, snr, dist, nsta, valid_ratio, tmisfit,
+        ref_sta, out_dir=None, tmin=10.0, tmax=250.0, vmin=2.5, vmax=5.0, alpha=20.0,
+    ))]
+    fn py_new(
+        evt_csv: &str,
+        sta_csv: &str,
+        sac_dir: &str,
+        path_dir: &str,
+        periods: Vec<f64>,
+        snr: f64,
+        dist: f64,
+        nsta: usize,
+        valid_ratio: f64,
+        tmisfit: f64,
+        ref_sta: [f64; 2],
+        out_dir: Option<String>,
+        tmin: f64,
+        tmax: f64,
+        vmin: f64,
+        vmax: f64,
+        alpha: f64,
+    ) -> PyResult<Self> {
+        let io_err = |e: anyhow::Error| PyIOError::new_err(e.to_string());
+        Ok(Self {
+            sac_dir: PathBuf::from(sac_dir),
+            path_dir: PathBuf::from(path_dir),
+            store: PredStore::open_packed(Path::new(path_dir)).map_err(io_err)?,
+            valid_events: load_valid_events(evt_csv).map_err(io_err)?,
+            valid_stations: load_valid_stations(sta_csv).map_err(io_err)?,
+            ftan_params: FtanParams::new(tmin, tmax, vmin, vmax, alpha),
+            snr_params: SnrParams {
+                periods: SnrParams::period_grid(tmin, tmax),
+                vmin,
+                vmax,
+                alpha,
+            },
+            periods,
+            snr,
+            dist,
+            nsta,
+            valid_ratio,
+            tmisfit,
+            ref_sta: (ref_sta[0], ref_sta[1]),
+            out_dir,
+        })
+    }
+
+    #[pyo3(name = "events")]
+    fn py_events(&self) -> PyResult<Vec<String>> {
+        self.events().map_err(|e| PyIOError::new_err(e.to_string()))
+    }
+
+    /// Same dict as `make_ph_amp_arrays`, with the records of `event` only
+    fn run<'py>(&self, py: Python<'py>, event: &str) -> PyResult<Bound<'py, PyDict>> {
+        let columns = py
+            .allow_threads(|| self.process(event))
+            .map_err(|e| PyIOError::new_err(e.to_string()))?;
+
+        let result = PyDict::new(py);
+        for (period, cols) in columns {
+            result.set_item(period, cols.into_pydict(py)?)?;
+        }
+        Ok(result)
+    }
+}
@@ -1,8 +1,9 @@
+use crate::pred_store::PredPackWriter;
 use crate::utils::pbar;
 use crate::utils::points::GeoPoint;
 
 use anyhow::{Context, Result};
-use indicatif::ParallelProgressIterator;
+use indicatif::{ParallelProgressIterator, ProgressBar};
 use memmap2::Mmap;
 use pyo3::{exceptions::PyIOError, prelude::*};
 use rayon::prelude::*;
@@ -14,9 +15,19 @@ use std::{
     sync::Arc,
 };
 
+/// Pairs formatted in parallel before each sequential append to the pack
+const PACK_CHUNK: usize = 4096;
+
+/// Writes the PH_PRED predictions of `dispersion_file` into `out_dir`
+///
+/// With `packed=True` all predictions go into `PH_PRED.pack` and its
+/// index `PH_PRED.idx`, read them back with `PredStore`. Otherwise one
+/// `{evt}_{sta}.PH_PRED` file is written per pair.
 #[pyfunction]
-pub fn make_cor_pred_files(dispersion_file: &str, out_dir: &str) -> PyResult<()> {
-    process_dispersions(dispersion_file, out_dir).map_err(|e| PyIOError::new_err(e.to_string()))
+#[pyo3(signature = (dispersion_file, out_dir, packed=true))]
+pub fn make_cor_pred_files(dispersion_file: &str, out_dir: &str, packed: bool) -> PyResult<()> {
+    process_dispersions(dispersion_file, out_dir, packed)
+        .map_err(|e| PyIOError::new_err(e.to_string()))
 }
 
 #[derive(Debug, Clone)]
@@ -52,7 +63,7 @@ impl EvtStaPair {
 }
 
 // 主要处理流程
-fn process_dispersions(dispersion_file: &str, output_dir: &str) -> Result<()> {
+fn process_dispersions(dispersion_file: &str, output_dir: &str, packed: bool) -> Result<()> {
     let file = File::open(dispersion_file)?;
     let mmap = Arc::new(unsafe { Mmap::map(&file)? });
     let content = std::str::from_utf8(&mmap)?;
@@ -78,6 +89,10 @@ fn process_dispersions(dispersion_file: &str, output_dir: &str) -> Result<()> {
         let output_path = PathBuf::from(output_dir);
         std::fs::create_dir_all(&output_path)?;
 
+        if packed {
+            return write_pack(&output_path, &pairs, &pb);
+        }
+
         pairs
             .into_par_iter()
             .progress_with(pb)
@@ -130,11 +145,30 @@ fn parse_block(lines: &[&str], start_idx: usize) -> Result<EvtStaPair> {
 // 文件写入逻辑
 fn write_station_pair(output_dir: &Path, pair: &EvtStaPair) -> Result<()> {
     let path = output_dir.join(format!("{}.PH_PRED", pair.pair_id()));
-    let mut writer = BufWriter::with_capacity(
-        5 * 1024 * 1024,
-        OpenOptions::new().create(true).write(true).open(&path)?,
-    );
+    let mut writer = BufWriter::new(OpenOptions::new().create(true).write(true).open(&path)?);
+    writer.write_all(format_station_pair(pair).as_bytes())?;
+    Ok(())
+}
 
+/// Appends all pairs to the pack in input order
+fn write_pack(output_dir: &Path, pairs: &[EvtStaPair], pb: &ProgressBar) -> Result<()> {
+    let mut pack = PredPackWriter::create(output_dir)?;
+    for chunk in pairs.chunks(PACK_CHUNK) {
+        let contents = chunk
+            .par_iter()
+            .map(format_station_pair)
+            .collect::<Vec<_>>();
+        for (pair, content) in chunk.iter().zip(&contents) {
+            pack.append(&pair.pair_id(), content)?;
+        }
+        pb.inc(chunk.len() as u64);
+    }
+    pb.finish();
+    pack.finish()
+}
+
+/// Content of one PH_PRED file
+fn format_station_pair(pair: &EvtStaPair) -> String {
     // 预分配格式化字符串
     let header_str = format!(
         "  {} {} {} {} {} {:.6} {:.6} {:.6} {:.6}\n",
@@ -156,11 +190,36 @@ fn write_station_pair(output_dir: &Path, pair: &EvtStaPair) -> Result<()> {
         .collect::<Vec<String>>()
         .join("\n");
 
-    writer.write_all(header_str.as_bytes())?;
-    writer.write_all(data_str.as_bytes())?;
-    Ok(())
+    header_str + &data_str
 }
 
 fn is_block_header(line: &str) -> bool {
     line.split_whitespace().count() >= 9
 }
+
+/// Wrappers of the PH_PRED parsing and writing for `benches/`
+#[cfg(feature = "bench")]
+pub mod bench {
+    use super::EvtStaPair;
+
+    use anyhow::Result;
+    use std::path::Path;
+
+    /// One parsed block of `GDM52_dispersion.out`
+    pub struct Pair(EvtStaPair);
+
+    impl Pair {
+        /// Number of (period, velocity) rows
+        pub fn dispersions(&self) -> usize {
+            self.0.dispersions.len()
+        }
+    }
+
+    pub fn parse_block(lines: &[&str], start_idx: usize) -> Result<Pair> {
+        super::parse_block(lines, start_idx).map(Pair)
+    }
+
+    pub fn write_station_pair(output_dir: &Path, pair: &Pair) -> Result<()> {
+        super::write_station_pair(output_dir, &pair.0)
+    }
+}
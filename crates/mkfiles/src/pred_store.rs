@@ -0,0 +1,155 @@
+use anyhow::{Context, Result};
+use memmap2::Mmap;
+use pyo3::{exceptions::PyIOError, prelude::*};
+use std::{
+    collections::HashMap,
+    fs::{self, File},
+    io::{BufRead, BufReader, BufWriter, Write},
+    path::{Path, PathBuf},
+};
+
+/// Concatenated contents of all PH_PRED files
+pub const PACK_FILE: &str = "PH_PRED.pack";
+/// One `{evt}_{sta} offset len` line per PH_PRED in the pack
+pub const INDEX_FILE: &str = "PH_PRED.idx";
+
+/// Writes PH_PRED contents into one pack file and its index
+pub struct PredPackWriter {
+    dir: PathBuf,
+    pack: BufWriter<File>,
+    index: Vec<(String, u64, u64)>,
+    offset: u64,
+}
+
+impl PredPackWriter {
+    pub fn create(dir: &Path) -> Result<Self> {
+        let path = dir.join(PACK_FILE);
+        let file =
+            File::create(&path).with_context(|| format!("create pack error: {}", path.display()))?;
+        Ok(Self {
+            dir: dir.to_path_buf(),
+            pack: BufWriter::new(file),
+            index: Vec::new(),
+            offset: 0,
+        })
+    }
+
+    /// Appends the content of `{pair_id}.PH_PRED`
+    pub fn append(&mut self, pair_id: &str, content: &str) -> Result<()> {
+        self.pack.write_all(content.as_bytes())?;
+        let len = content.len() as u64;
+        self.index.push((pair_id.to_string(), self.offset, len));
+        self.offset += len;
+        Ok(())
+    }
+
+    pub fn finish(mut self) -> Result<()> {
+        self.pack.flush()?;
+
+        let path = self.dir.join(INDEX_FILE);
+        let file =
+            File::create(&path).with_context(|| format!("create index error: {}", path.display()))?;
+        let mut writer = BufWriter::new(file);
+        for (pair_id, offset, len) in &self.index {
+            writeln!(writer, "{} {} {}", pair_id, offset, len)?;
+        }
+        writer.flush()?;
+        Ok(())
+    }
+}
+
+/// Memory-mapped PH_PRED pack with lookup by (event, station)
+///
+/// Examples:
+/// ```python
+/// from tpwt._core import PredStore
+///
+/// store = PredStore("outputs/path")
+/// text = store.get("201602171726", "KHZ")
+/// # the external aftan still needs a file
+/// pred_file = store.materialize("201602171726", "KHZ", "data/SAC/201602171726")
+/// ```
+#[pyclass]
+pub struct PredStore {
+    mmap: Mmap,
+    index: HashMap<String, (usize, usize)>,
+}
+
+impl PredStore {
+    pub fn open(dir: &Path) -> Result<Self> {
+        let index_path = dir.join(INDEX_FILE);
+        let reader = BufReader::new(
+            File::open(&index_path)
+                .with_context(|| format!("open index error: {}", index_path.display()))?,
+        );
+        let mut index = HashMap::new();
+        for line in reader.lines() {
+            let line = line?;
+            let cols: Vec<&str> = line.split_whitespace().collect();
+            let &[pair_id, offset, len] = cols.as_slice() else {
+                continue;
+            };
+            index.insert(pair_id.to_string(), (offset.parse()?, len.parse()?));
+        }
+
+        let pack_path = dir.join(PACK_FILE);
+        let file = File::open(&pack_path)
+            .with_context(|| format!("open pack error: {}", pack_path.display()))?;
+        let mmap = unsafe { Mmap::map(&file)? };
+
+        Ok(Self { mmap, index })
+    }
+
+    /// Opens the pack of `dir`, `None` when the PH_PRED files are loose
+    pub fn open_packed(dir: &Path) -> Result<Option<Self>> {
+        if !dir.join(INDEX_FILE).exists() {
+            return Ok(None);
+        }
+        Self::open(dir).map(Some)
+    }
+
+    /// Content of `{event}_{station}.PH_PRED`
+    pub fn get(&self, event: &str, station: &str) -> Option<&str> {
+        let &(offset, len) = self.index.get(&format!("{}_{}", event, station))?;
+        let bytes = self.mmap.get(offset..offset + len)?;
+        std::str::from_utf8(bytes).ok()
+    }
+
+    /// Writes `{out_dir}/{event}_{station}.PH_PRED` for programs reading files
+    pub fn materialize(&self, event: &str, station: &str, out_dir: &Path) -> Result<Option<PathBuf>> {
+        let Some(content) = self.get(event, station) else {
+            return Ok(None);
+        };
+        let path = out_dir.join(format!("{}_{}.PH_PRED", event, station));
+        fs::write(&path, content).with_context(|| format!("write error: {}", path.display()))?;
+        Ok(Some(path))
+    }
+}
+
+#[pymethods]
+impl PredStore {
+    #[new]
+    fn py_new(path_dir: &str) -> PyResult<Self> {
+        Self::open(Path::new(path_dir)).map_err(|e| PyIOError::new_err(e.to_string()))
+    }
+
+    #[pyo3(name = "get")]
+    fn py_get(&self, event: &str, station: &str) -> Option<String> {
+        self.get(event, station).map(str::to_string)
+    }
+
+    #[pyo3(name = "materialize")]
+    fn py_materialize(&self, event: &str, station: &str, out_dir: &str) -> PyResult<Option<String>> {
+        self.materialize(event, station, Path::new(out_dir))
+            .map(|path| path.map(|p| p.to_string_lossy().into_owned()))
+            .map_err(|e| PyIOError::new_err(e.to_string()))
+    }
+
+    fn __len__(&self) -> usize {
+        self.index.len()
+    }
+
+    fn __contains__(&self, key: (String, String)) -> bool {
+        self.index.contains_key(&format!("{}_{}", key.0, key.1))
+    }
+}
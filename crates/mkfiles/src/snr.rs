@@ -0,0 +1,95 @@
+mod spectral;
+mod store;
+
+pub use spectral::{SnrParams, signal_window, snr_of, spectral_snr};
+pub use store::SnrStore;
+
+use crate::trace;
+use crate::utils::pbar;
+use crate::utils::sac::read_sac;
+
+use anyhow::Result;
+use indicatif::ParallelProgressIterator;
+use itertools::Itertools;
+use pyo3::{exceptions::PyIOError, prelude::*};
+use rayon::prelude::*;
+use std::{
+    fs,
+    path::{Path, PathBuf},
+};
+
+/// Computes the spectral SNR of every `{event}/*.sac` under `sac_dir`
+///
+/// Replaces `spectral_snr_TPWT`: all files are measured in parallel and
+/// the curves of each event are written to `{event}/snr.store`, which
+/// the phase picking reads in preference to the `*_snr.yyj.txt` files.
+///
+/// Parameters:
+///     sac_dir: sac data, one dir per event
+///     tmin, tmax: period range in s, same as the aftan parameters
+///     vmin, vmax: group velocity window of the signal in km/s
+///     alpha: width of the Gaussian filters
+#[pyfunction]
+#[pyo3(signature = (sac_dir, tmin=10.0, tmax=250.0, vmin=2.5, vmax=5.0, alpha=20.0))]
+pub fn make_snr_store(
+    py: Python<'_>,
+    sac_dir: &str,
+    tmin: f64,
+    tmax: f64,
+    vmin: f64,
+    vmax: f64,
+    alpha: f64,
+) -> PyResult<()> {
+    let params = SnrParams {
+        periods: SnrParams::period_grid(tmin, tmax),
+        vmin,
+        vmax,
+        alpha,
+    };
+    py.allow_threads(|| write_snr_stores(Path::new(sac_dir), &params))
+        .map_err(|e| PyIOError::new_err(e.to_string()))
+}
+
+fn write_snr_stores(sac_dir: &Path, params: &SnrParams) -> Result<()> {
+    let event_dirs: Vec<PathBuf> = fs::read_dir(sac_dir)?
+        .filter_map(|entry| Some(entry.ok()?.path()))
+        .filter(|path| path.is_dir())
+        .collect();
+
+    let sac_files: Vec<(usize, String, PathBuf)> = event_dirs
+        .iter()
+        .enumerate()
+        .flat_map(|(i, dir)| {
+            fs::read_dir(dir)
+                .into_iter()
+                .flatten()
+                .filter_map(move |entry| {
+                    let path = entry.ok()?.path();
+                    if path.extension()? != "sac" {
+                        return None;
+                    }
+                    let station = path.file_name()?.to_str()?.split('.').nth(1)?.to_string();
+                    Some((i, station, path))
+                })
+        })
+        .collect();
+
+    let pb = pbar(sac_files.len() as u64, "Spectral SNR");
+    let measured = sac_files
+        .into_par_iter()
+        .progress_with(pb)
+        // unreadable files get no SNR, like a failed run of spectral_snr_TPWT
+        .filter_map(|(i, station, path)| {
+            let _span = trace::span("spectral_snr", path.to_string_lossy());
+            let (header, data) = read_sac(&path).ok()?;
+            let (periods, snr) = spectral_snr(&header, &data, params);
+            Some((i, (station, periods, snr)))
+        })
+        .collect::<Vec<_>>()
+        .into_iter()
+        .into_group_map();
+
+    measured
+        .into_par_iter()
+        .try_for_each(|(i, curves)| SnrStore::write(&event_dirs[i], &curves))
+}
@@ -0,0 +1,160 @@
+use crate::utils::sac::SacHeader;
+use crate::utils::spectrum::Spectrum;
+
+use rustfft::num_complex::Complex;
+
+/// Ratio between two neighbouring periods of the measuring grid, chosen
+/// here and not taken from `spectral_snr_TPWT`
+const PERIOD_STEP: f64 = 1.05;
+
+/// Parameters of the spectral SNR measurement
+#[derive(Debug, Clone)]
+pub struct SnrParams {
+    pub periods: Vec<f64>,
+    pub vmin: f64,
+    pub vmax: f64,
+    pub alpha: f64,
+}
+
+impl SnrParams {
+    /// Geometric periods from `tmin`, the last one is past `tmax` so that
+    /// the SNR can be interpolated over the whole range
+    pub fn period_grid(tmin: f64, tmax: f64) -> Vec<f64> {
+        let mut periods = vec![tmin];
+        let mut period = tmin;
+        while period <= tmax {
+            period *= PERIOD_STEP;
+            periods.push(period);
+        }
+        periods
+    }
+}
+
+/// SNR of one waveform at every period of `params`
+///
+/// The trace is narrow-band filtered with a Gaussian centred at each
+/// period. The signal is the envelope peak inside the group velocity
+/// window `[dist / vmax, dist / vmin]`, the noise is the RMS of the
+/// filtered trace after that window. Periods without a noise window or
+/// with a silent one are skipped.
+///
+/// This is not the measure of `spectral_snr_TPWT`, whose definition is not
+/// in this tree, and no `*_snr.yyj.txt` of the binary has been compared
+/// with it. The `snr` threshold of the config is applied to this ratio on
+/// the native path and has to be tuned for it.
+pub fn spectral_snr(header: &SacHeader, data: &[f32], params: &SnrParams) -> (Vec<f64>, Vec<f64>) {
+    let dt = header.delta as f64;
+    if data.len() < 2 || dt <= 0.0 {
+        return (vec![], vec![]);
+    }
+    let Some(window) = signal_window(header, data.len(), params.vmin, params.vmax) else {
+        return (vec![], vec![]);
+    };
+
+    let spectrum = Spectrum::new(data, dt);
+    let mut filtered = Vec::new();
+
+    let mut periods = Vec::with_capacity(params.periods.len());
+    let mut snrs = Vec::with_capacity(params.periods.len());
+    for &period in &params.periods {
+        spectrum.gaussian_filter(period, params.alpha, &mut filtered);
+        if let Some(snr) = snr_of(&filtered[..data.len()], window) {
+            periods.push(period);
+            snrs.push(snr);
+        }
+    }
+
+    (periods, snrs)
+}
+
+/// Samples `[start, end)` of the group velocity window `[dist / vmax, dist / vmin]`,
+/// `None` when it leaves no samples for the noise after it
+pub fn signal_window(header: &SacHeader, n: usize, vmin: f64, vmax: f64) -> Option<(usize, usize)> {
+    let (b, dt, dist) = (header.b as f64, header.delta as f64, header.dist as f64);
+    let sample = |t: f64| ((t - b) / dt).round().clamp(0.0, n as f64) as usize;
+    let (start, end) = (sample(dist / vmax), sample(dist / vmin));
+    (start < end && end < n).then_some((start, end))
+}
+
+/// Envelope peak in the signal window over the RMS of the trace after it
+pub fn snr_of(filtered: &[Complex<f64>], (start, end): (usize, usize)) -> Option<f64> {
+    let peak = filtered[start..end]
+        .iter()
+        .map(|c| c.norm())
+        .fold(0.0, f64::max);
+    let noise = &filtered[end..];
+    let rms = (noise.iter().map(|c| c.re * c.re).sum::<f64>() / noise.len() as f64).sqrt();
+    (rms > 0.0).then(|| peak / rms)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn period_grid_covers_tmax() {
+        let periods = SnrParams::period_grid(10.0, 20.0);
+        assert_eq!(periods[0], 10.0);
+        assert!(periods[periods.len() - 2] <= 20.0 && periods[periods.len() - 1] > 20.0);
+        assert!(
+            periods
+                .windows(2)
+                .all(|w| (w[1] / w[0] - PERIOD_STEP).abs() < 1e-12)
+        );
+    }
+
+    #[test]
+    fn signal_window_of_the_group_velocities() {
+        let header = SacHeader::synthetic(0.5, -10.0, 4000, 1000.0);
+        // 200 s to 400 s after a start at -10 s
+        assert_eq!(signal_window(&header, 4000, 2.5, 5.0), Some((420, 820)));
+        // no noise after a window reaching the end
+        assert_eq!(signal_window(&header, 820, 2.5, 5.0), None);
+    }
+
+    #[test]
+    fn snr_is_peak_over_noise_rms() {
+        let trace: Vec<Complex<f64>> = [0.0, 6.0, 0.0, 1.0, -1.0, 1.0, -1.0]
+            .iter()
+            .map(|&x| Complex::new(x, 0.0))
+            .collect();
+        assert_eq!(snr_of(&trace, (0, 3)), Some(6.0));
+        assert_eq!(snr_of(&[Complex::new(0.0, 0.0); 7], (0, 3)), None);
+    }
+
+    #[test]
+    fn spectral_snr_of_a_pulse() {
+        let (n, dt) = (2048, 1.0);
+        let header = SacHeader::synthetic(dt as f32, 0.0, n, 1000.0);
+        // a 30 s wave packet arriving at 3.5 km/s
+        let data: Vec<f32> = (0..n)
+            .map(|i| {
+                let t = i as f64 * dt - 1000.0 / 3.5;
+                ((-(t / 40.0).powi(2)).exp() * (2.0 * std::f64::consts::PI * t / 30.0).cos()) as f32
+            })
+            .collect();
+        let params = SnrParams {
+            periods: SnrParams::period_grid(20.0, 60.0),
+            vmin: 2.5,
+            vmax: 5.0,
+            alpha: 20.0,
+        };
+
+        let (periods, snr) = spectral_snr(&header, &data, &params);
+        assert_eq!(periods, params.periods);
+        assert!(snr.iter().all(|&x| x > 1.0));
+        // the SNR does not depend on the gain
+        let louder: Vec<f32> = data.iter().map(|x| 10.0 * x).collect();
+        let (_, snr10) = spectral_snr(&header, &louder, &params);
+        assert!(
+            snr.iter()
+                .zip(&snr10)
+                .all(|(a, b)| (a / b - 1.0).abs() < 1e-4)
+        );
+
+        assert_eq!(
+            spectral_snr(&header, &[0.0; 2048], &params),
+            (vec![], vec![])
+        );
+    }
+}
@@ -0,0 +1,120 @@
+use crate::utils::bytes::ByteReader;
+use crate::utils::tmp_path;
+
+use anyhow::{Context, Result, bail};
+use memmap2::Mmap;
+use std::{
+    collections::HashMap,
+    fs::{self, File},
+    io::{BufWriter, Write},
+    path::{Path, PathBuf},
+};
+
+const MAGIC: &[u8; 8] = b"TPWTSNR1";
+const STORE_FILE: &str = "snr.store";
+
+/// Spectral SNR curves of all stations under one event directory
+///
+/// Stored in `{event_dir}/snr.store` as little-endian binary: a magic
+/// tag, the station count, then per station its name, the number of
+/// periods, the periods and the SNR values.
+pub struct SnrStore {
+    path: PathBuf,
+    curves: HashMap<String, (Vec<f64>, Vec<f64>)>,
+}
+
+impl SnrStore {
+    pub fn open(event_dir: &Path) -> Result<Self> {
+        let path = event_dir.join(STORE_FILE);
+        let file = File::open(&path)?;
+        let mmap = unsafe { Mmap::map(&file)? };
+        let mut rdr = ByteReader::new(&mmap);
+
+        if rdr.take(MAGIC.len())? != MAGIC.as_slice() {
+            bail!("bad SNR store: {}", path.display());
+        }
+
+        let count = rdr.u32()? as usize;
+        let mut curves = HashMap::with_capacity(count);
+        for _ in 0..count {
+            let len = rdr.u16()? as usize;
+            let station = std::str::from_utf8(rdr.take(len)?)?.to_string();
+            let n = rdr.u32()? as usize;
+            curves.insert(station, (rdr.f64s(n)?, rdr.f64s(n)?));
+        }
+
+        Ok(Self { path, curves })
+    }
+
+    pub fn path(&self) -> &Path {
+        &self.path
+    }
+
+    /// Periods and SNR values of `station`
+    pub fn get(&self, station: &str) -> Option<(&[f64], &[f64])> {
+        self.curves
+            .get(station)
+            .map(|(periods, snr)| (periods.as_slice(), snr.as_slice()))
+    }
+
+    /// Writes the `(station, periods, snr)` curves of one event
+    pub fn write(event_dir: &Path, curves: &[(String, Vec<f64>, Vec<f64>)]) -> Result<()> {
+        let path = event_dir.join(STORE_FILE);
+        let tmp = tmp_path(&path);
+        {
+            let file = File::create(&tmp)
+                .with_context(|| format!("create SNR store error: {}", tmp.display()))?;
+            let mut wtr = BufWriter::new(file);
+            wtr.write_all(MAGIC)?;
+            wtr.write_all(&(curves.len() as u32).to_le_bytes())?;
+            for (station, periods, snr) in curves {
+                wtr.write_all(&(station.len() as u16).to_le_bytes())?;
+                wtr.write_all(station.as_bytes())?;
+                wtr.write_all(&(periods.len() as u32).to_le_bytes())?;
+                for v in periods.iter().chain(snr) {
+                    wtr.write_all(&v.to_le_bytes())?;
+                }
+            }
+            wtr.flush()?;
+        }
+        fs::rename(&tmp, &path)?;
+
+        Ok(())
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn store_round_trip() -> Result<()> {
+        let dir = std::env::temp_dir().join(format!("tpwt_snr_{}", std::process::id()));
+        fs::create_dir_all(&dir)?;
+        let curves = vec![
+            ("S1".to_string(), vec![10.0, 10.5], vec![25.0, 30.5]),
+            ("STA2".to_string(), vec![], vec![]),
+        ];
+        SnrStore::write(&dir, &curves)?;
+
+        let store = SnrStore::open(&dir)?;
+        assert_eq!(store.path(), dir.join(STORE_FILE));
+        assert_eq!(
+            store.get("S1"),
+            Some((&[10.0, 10.5][..], &[25.0, 30.5][..]))
+        );
+        assert_eq!(store.get("STA2"), Some((&[][..], &[][..])));
+        assert_eq!(store.get("S3"), None);
+        let leftovers = fs::read_dir(&dir)?
+            .filter_map(|e| e.ok())
+            .filter(|e| e.path().extension().is_some_and(|ext| ext == "tmp"))
+            .count();
+        assert_eq!(leftovers, 0);
+
+        fs::write(dir.join(STORE_FILE), b"NOTASTORE")?;
+        let bad = SnrStore::open(&dir);
+        fs::remove_dir_all(&dir)?;
+        assert!(bad.is_err());
+        Ok(())
+    }
+}
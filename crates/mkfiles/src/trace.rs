@@ -0,0 +1,101 @@
+use pyo3::prelude::*;
+use std::{
+    sync::{
+        Mutex,
+        atomic::{AtomicBool, AtomicU64, Ordering},
+    },
+    time::{Instant, SystemTime, UNIX_EPOCH},
+};
+
+static ENABLED: AtomicBool = AtomicBool::new(false);
+static EVENTS: Mutex<Vec<TraceEvent>> = Mutex::new(Vec::new());
+static NEXT_TID: AtomicU64 = AtomicU64::new(1);
+
+thread_local! {
+    static TID: u64 = NEXT_TID.fetch_add(1, Ordering::Relaxed);
+}
+
+/// One finished span, times in µs since the Unix epoch
+#[derive(Debug, Clone)]
+pub struct TraceEvent {
+    pub name: &'static str,
+    /// What the span worked on, e.g. the event or the SAC file
+    pub detail: String,
+    pub ts: u64,
+    pub dur: u64,
+    pub tid: u64,
+    /// CPU time of the span's thread in µs
+    pub cpu: u64,
+}
+
+/// Records its wall time and the CPU time of its thread when dropped
+pub struct Span {
+    name: &'static str,
+    detail: String,
+    ts: u64,
+    start: Instant,
+    cpu_start: u64,
+}
+
+impl Drop for Span {
+    fn drop(&mut self) {
+        let event = TraceEvent {
+            name: self.name,
+            detail: std::mem::take(&mut self.detail),
+            ts: self.ts,
+            dur: self.start.elapsed().as_micros() as u64,
+            tid: TID.with(|tid| *tid),
+            cpu: thread_cpu_us().saturating_sub(self.cpu_start),
+        };
+        EVENTS.lock().unwrap().push(event);
+    }
+}
+
+/// Starts a span, `None` while tracing is off so the cost is one load
+///
+/// Examples:
+/// ```ignore
+/// let _span = trace::span("ftan", file_name);
+/// ```
+pub fn span(name: &'static str, detail: impl Into<String>) -> Option<Span> {
+    if !ENABLED.load(Ordering::Relaxed) {
+        return None;
+    }
+    let ts = SystemTime::now()
+        .duration_since(UNIX_EPOCH)
+        .map_or(0, |d| d.as_micros() as u64);
+    Some(Span {
+        name,
+        detail: detail.into(),
+        ts,
+        start: Instant::now(),
+        cpu_start: thread_cpu_us(),
+    })
+}
+
+/// CPU time of the calling thread in µs
+fn thread_cpu_us() -> u64 {
+    let mut ts = libc::timespec {
+        tv_sec: 0,
+        tv_nsec: 0,
+    };
+    if unsafe { libc::clock_gettime(libc::CLOCK_THREAD_CPUTIME_ID, &mut ts) } != 0 {
+        return 0;
+    }
+    ts.tv_sec as u64 * 1_000_000 + ts.tv_nsec as u64 / 1_000
+}
+
+/// Turns the recording of Rust spans on or off, used by `tpwt.trace`
+#[pyfunction]
+pub fn set_trace(enabled: bool) {
+    ENABLED.store(enabled, Ordering::Relaxed);
+}
+
+/// Returns and clears the recorded spans as `(name, detail, ts, dur, tid, cpu)`
+#[pyfunction]
+pub fn take_trace_events() -> Vec<(&'static str, String, u64, u64, u64, u64)> {
+    std::mem::take(&mut *EVENTS.lock().unwrap())
+        .into_iter()
+        .map(|e| (e.name, e.detail, e.ts, e.dur, e.tid, e.cpu))
+        .collect()
+}
@@ -1,7 +1,28 @@
+pub mod bytes;
 pub mod points;
 pub mod records;
+pub mod sac;
+pub mod spectrum;
+pub mod sphere_index;
 
 use indicatif::{ProgressBar, ProgressStyle};
+use std::{
+    path::{Path, PathBuf},
+    sync::atomic::{AtomicU64, Ordering},
+};
+
+/// A sibling of `path` to write into before renaming it over `path`,
+/// unique across processes and threads so concurrent writers never share it
+pub fn tmp_path(path: &Path) -> PathBuf {
+    static COUNTER: AtomicU64 = AtomicU64::new(0);
+    let mut name = path.as_os_str().to_owned();
+    name.push(format!(
+        ".{}.{}.tmp",
+        std::process::id(),
+        COUNTER.fetch_add(1, Ordering::Relaxed)
+    ));
+    PathBuf::from(name)
+}
 
 pub fn pbar(len: u64, msg: &str) -> ProgressBar {
     ProgressBar::new(len).with_style(
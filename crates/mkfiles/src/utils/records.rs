@@ -3,7 +3,7 @@ use crate::utils::points::GeoPoint;
 use serde::{Deserialize, Serialize};
 
 /// Represents distance information between events and stations
-#[derive(Debug, Deserialize)]
+#[derive(Debug, Clone, Deserialize)]
 pub struct DistRecord {
     pub event: String,
     pub station: String,
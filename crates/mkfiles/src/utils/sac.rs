@@ -0,0 +1,140 @@
+// —————————————————————————————————————————————————————————————————————————————
+// Minimal SAC reader
+// —————————————————————————————————————————————————————————————————————————————
+
+use anyhow::{Context, Result, bail};
+use std::{
+    fs::{self, File},
+    io::Read,
+    path::Path,
+};
+
+/// Size of the fixed SAC header in bytes
+pub const HEADER_LEN: usize = 632;
+
+// word offsets in the header
+const F_DELTA: usize = 0;
+const F_B: usize = 5;
+const F_STLA: usize = 31;
+const F_STLO: usize = 32;
+const F_EVLA: usize = 35;
+const F_EVLO: usize = 36;
+const F_DIST: usize = 50;
+const I_NVHDR: usize = 76;
+const I_NPTS: usize = 79;
+
+/// The SAC header fields used by tpwt
+#[derive(Debug, Clone, Copy)]
+pub struct SacHeader {
+    pub delta: f32,
+    pub b: f32,
+    pub npts: usize,
+    pub dist: f32,
+    pub stla: f32,
+    pub stlo: f32,
+    pub evla: f32,
+    pub evlo: f32,
+    little_endian: bool,
+}
+
+impl SacHeader {
+    /// Reads only the first 632 bytes of a SAC file
+    pub fn from_file(path: &Path) -> Result<Self> {
+        let mut buf = [0u8; HEADER_LEN];
+        File::open(path)
+            .and_then(|mut f| f.read_exact(&mut buf))
+            .with_context(|| format!("read SAC header error: {}", path.display()))?;
+        Self::from_bytes(&buf).with_context(|| format!("bad SAC header: {}", path.display()))
+    }
+
+    /// Parses a header, the byte order is detected from `nvhdr`
+    pub fn from_bytes(buf: &[u8]) -> Result<Self> {
+        if buf.len() < HEADER_LEN {
+            bail!("SAC header shorter than {} bytes", HEADER_LEN);
+        }
+
+        let little_endian = match word(buf, I_NVHDR) {
+            w if u32::from_le_bytes(w) == 6 => true,
+            w if u32::from_be_bytes(w) == 6 => false,
+            _ => bail!("unsupported SAC header version"),
+        };
+        let float = |i| {
+            let w = word(buf, i);
+            if little_endian {
+                f32::from_le_bytes(w)
+            } else {
+                f32::from_be_bytes(w)
+            }
+        };
+        let npts = {
+            let w = word(buf, I_NPTS);
+            if little_endian {
+                i32::from_le_bytes(w)
+            } else {
+                i32::from_be_bytes(w)
+            }
+        };
+
+        Ok(Self {
+            delta: float(F_DELTA),
+            b: float(F_B),
+            npts: npts.max(0) as usize,
+            dist: float(F_DIST),
+            stla: float(F_STLA),
+            stlo: float(F_STLO),
+            evla: float(F_EVLA),
+            evlo: float(F_EVLO),
+            little_endian,
+        })
+    }
+
+    pub fn is_little_endian(&self) -> bool {
+        self.little_endian
+    }
+}
+
+#[cfg(test)]
+impl SacHeader {
+    /// Little-endian header of a trace starting at `b`, for the unit tests
+    pub(crate) fn synthetic(delta: f32, b: f32, npts: usize, dist: f32) -> Self {
+        Self {
+            delta,
+            b,
+            npts,
+            dist,
+            stla: 0.0,
+            stlo: 0.0,
+            evla: 0.0,
+            evlo: 0.0,
+            little_endian: true,
+        }
+    }
+}
+
+/// Reads the header and the waveform of an evenly sampled SAC file
+pub fn read_sac(path: &Path) -> Result<(SacHeader, Vec<f32>)> {
+    let buf = fs::read(path).with_context(|| format!("read SAC error: {}", path.display()))?;
+    let header =
+        SacHeader::from_bytes(&buf).with_context(|| format!("bad SAC header: {}", path.display()))?;
+
+    let Some(bytes) = buf.get(HEADER_LEN..HEADER_LEN + 4 * header.npts) else {
+        bail!("truncated SAC data: {}", path.display());
+    };
+    let data = bytes
+        .chunks_exact(4)
+        .map(|c| {
+            let w = [c[0], c[1], c[2], c[3]];
+            if header.little_endian {
+                f32::from_le_bytes(w)
+            } else {
+                f32::from_be_bytes(w)
+            }
+        })
+        .collect();
+
+    Ok((header, data))
+}
+
+fn word(buf: &[u8], i: usize) -> [u8; 4] {
+    [buf[4 * i], buf[4 * i + 1], buf[4 * i + 2], buf[4 * i + 3]]
+}
@@ -0,0 +1,136 @@
+// —————————————————————————————————————————————————————————————————————————————
+// Analytic spectrum of a trace
+// —————————————————————————————————————————————————————————————————————————————
+
+use rustfft::{Fft, FftPlanner, num_complex::Complex};
+use std::{f64::consts::PI, sync::Arc};
+
+const ZERO: Complex<f64> = Complex::new(0.0, 0.0);
+
+/// Spectrum of the analytic signal of a real trace
+///
+/// The trace is demeaned and zero padded to a power of two, positive
+/// frequencies are doubled and negative ones dropped, so every inverse
+/// transform gives a complex trace whose real part is the filtered input.
+pub struct Spectrum {
+    n: usize,
+    dt: f64,
+    values: Vec<Complex<f64>>,
+    fft: Arc<dyn Fft<f64>>,
+    ifft: Arc<dyn Fft<f64>>,
+}
+
+impl Spectrum {
+    pub fn new(data: &[f32], dt: f64) -> Self {
+        let n = data.len();
+        let nfft = n.next_power_of_two();
+        let mut planner = FftPlanner::new();
+        let fft = planner.plan_fft_forward(nfft);
+        let ifft = planner.plan_fft_inverse(nfft);
+
+        let mean = data.iter().map(|&x| x as f64).sum::<f64>() / n.max(1) as f64;
+        let mut values: Vec<Complex<f64>> = data
+            .iter()
+            .map(|&x| Complex::new(x as f64 - mean, 0.0))
+            .chain(std::iter::repeat(ZERO))
+            .take(nfft)
+            .collect();
+        fft.process(&mut values);
+
+        values[0] = ZERO;
+        for (k, v) in values.iter_mut().enumerate().skip(1) {
+            *v = if k <= nfft / 2 { *v * 2.0 } else { ZERO };
+        }
+
+        Self {
+            n,
+            dt,
+            values,
+            fft,
+            ifft,
+        }
+    }
+
+    /// Number of samples of the input trace
+    pub fn len(&self) -> usize {
+        self.n
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.n == 0
+    }
+
+    /// Angular frequency of every bin with a non-zero value
+    fn omegas(&self) -> impl Iterator<Item = (usize, f64)> + use<> {
+        let nfft = self.values.len();
+        let dw = 2.0 * PI / (nfft as f64 * self.dt);
+        (1..=nfft / 2).map(move |k| (k, k as f64 * dw))
+    }
+
+    /// Complex trace filtered by a Gaussian of relative width `alpha`
+    /// centred at `period`, written into `out` (resized to the padded length)
+    pub fn gaussian_filter(&self, period: f64, alpha: f64, out: &mut Vec<Complex<f64>>) {
+        let w0 = 2.0 * PI / period;
+        let scale = 1.0 / self.values.len() as f64;
+
+        out.clear();
+        out.resize(self.values.len(), ZERO);
+        for (k, w) in self.omegas() {
+            let x = (w - w0) / w0;
+            out[k] = self.values[k] * ((-alpha * x * x).exp() * scale);
+        }
+        self.ifft.process(out);
+    }
+
+    /// Keeps only the part of the trace around `window` after removing the
+    /// phase `phase(omega)`, then restores that phase
+    ///
+    /// With the predicted dispersion as `phase` the wave is compressed to
+    /// a pulse, everything out of `window` (in samples, cosine tapered over
+    /// `taper` samples on both sides) is dropped as noise.
+    pub fn phase_match(
+        &mut self,
+        phase: impl Fn(f64) -> f64,
+        window: (usize, usize),
+        taper: usize,
+    ) {
+        let nfft = self.values.len();
+        let shifts: Vec<(usize, Complex<f64>)> = self
+            .omegas()
+            .map(|(k, w)| (k, Complex::from_polar(1.0, phase(w))))
+            .collect();
+
+        for &(k, shift) in &shifts {
+            self.values[k] *= shift;
+        }
+        self.ifft.process(&mut self.values);
+
+        let (start, end) = window;
+        for (i, v) in self.values.iter_mut().enumerate() {
+            *v *= taper_weight(i, start, end, taper) / nfft as f64;
+        }
+
+        self.fft.process(&mut self.values);
+        let kept: Vec<Complex<f64>> = std::iter::once(ZERO)
+            .chain(shifts.iter().map(|&(k, shift)| self.values[k] * shift.conj()))
+            .collect();
+        self.values.fill(ZERO);
+        self.values[..kept.len()].copy_from_slice(&kept);
+    }
+}
+
+/// Weight of sample `i` for a window `[start, end)` with cosine tapers outside
+fn taper_weight(i: usize, start: usize, end: usize, taper: usize) -> f64 {
+    let dist = if i < start {
+        start - i
+    } else if i >= end {
+        i + 1 - end
+    } else {
+        return 1.0;
+    };
+    if dist >= taper {
+        0.0
+    } else {
+        0.5 * (1.0 + (PI * dist as f64 / taper as f64).cos())
+    }
+}
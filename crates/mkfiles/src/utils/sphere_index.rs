@@ -0,0 +1,130 @@
+use crate::utils::points::GeoPoint;
+
+/// Earth radius in km, same as `GeoPoint::distance_to`
+const R: f64 = 6371.0;
+/// Slack on the unit-sphere chord when pruning, absorbs rounding between
+/// haversine distances and chord lengths
+const CHORD_EPS: f64 = 1e-9;
+
+#[derive(Debug, Clone)]
+struct Node {
+    xyz: [f64; 3],
+    geo: GeoPoint,
+    left: Option<usize>,
+    right: Option<usize>,
+}
+
+/// Incremental 3-D k-d tree of unit vectors for nearest GeoPoint queries
+///
+/// The chord length on the unit sphere is only used to prune subtrees,
+/// candidates are ranked by `GeoPoint::distance_to` and ties keep the
+/// earliest inserted point, so results equal a linear `min_by` scan.
+#[derive(Debug, Default)]
+pub struct SphereIndex {
+    nodes: Vec<Node>,
+}
+
+impl SphereIndex {
+    pub fn with_capacity(capacity: usize) -> Self {
+        Self {
+            nodes: Vec::with_capacity(capacity),
+        }
+    }
+
+    pub fn len(&self) -> usize {
+        self.nodes.len()
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.nodes.is_empty()
+    }
+
+    /// Inserts a point and returns its index (the insertion order)
+    pub fn insert(&mut self, geo: GeoPoint) -> usize {
+        let idx = self.nodes.len();
+        let xyz = unit_vector(&geo);
+
+        if !self.nodes.is_empty() {
+            let mut cur = 0;
+            let mut depth = 0;
+            loop {
+                let axis = depth % 3;
+                let node = &mut self.nodes[cur];
+                let child = if xyz[axis] < node.xyz[axis] {
+                    &mut node.left
+                } else {
+                    &mut node.right
+                };
+                match *child {
+                    Some(next) => cur = next,
+                    None => {
+                        *child = Some(idx);
+                        break;
+                    }
+                }
+                depth += 1;
+            }
+        }
+
+        self.nodes.push(Node {
+            xyz,
+            geo,
+            left: None,
+            right: None,
+        });
+        idx
+    }
+
+    /// Index of the nearest inserted point to `query`, `None` when empty
+    pub fn nearest(&self, query: &GeoPoint) -> Option<usize> {
+        if self.nodes.is_empty() {
+            return None;
+        }
+
+        let q = unit_vector(query);
+        let mut best: Option<(f64, usize)> = None;
+        let mut best_chord = f64::INFINITY;
+        // (node, depth, lower bound of chord length to the subtree)
+        let mut stack = vec![(0usize, 0usize, 0.0f64)];
+
+        while let Some((idx, depth, bound)) = stack.pop() {
+            if bound > best_chord + CHORD_EPS {
+                continue;
+            }
+
+            let node = &self.nodes[idx];
+            let dist = query.distance_to(&node.geo);
+            let better = match best {
+                None => true,
+                Some((d, i)) => dist < d || (dist == d && idx < i),
+            };
+            if better {
+                best = Some((dist, idx));
+                best_chord = 2.0 * (dist / (2.0 * R)).sin();
+            }
+
+            let axis = depth % 3;
+            let diff = q[axis] - node.xyz[axis];
+            let (near, far) = if diff < 0.0 {
+                (node.left, node.right)
+            } else {
+                (node.right, node.left)
+            };
+            // far side first so that the near side is popped first
+            if let Some(far) = far {
+                stack.push((far, depth + 1, bound.max(diff.abs())));
+            }
+            if let Some(near) = near {
+                stack.push((near, depth + 1, bound));
+            }
+        }
+
+        best.map(|(_, idx)| idx)
+    }
+}
+
+fn unit_vector(geo: &GeoPoint) -> [f64; 3] {
+    let (lat, lon) = (geo.lat.to_radians(), geo.lon.to_radians());
+    [lat.cos() * lon.cos(), lat.cos() * lon.sin(), lat.sin()]
+}
+
@@ -1,4 +1,7 @@
-use mkfiles::{make_cor_pred_files, make_pathfile, make_ph_amp_files};
+use mkfiles::{
+    EventPipeline, PredStore, make_cor_pred_files, make_disp_files, make_pathfile,
+    make_ph_amp_arrays, make_ph_amp_files, make_snr_store, set_trace, take_trace_events,
+};
 use pyo3::prelude::*;
 
 #[pyfunction]
@@ -15,5 +18,12 @@ fn _core(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(make_pathfile, m)?)?;
     m.add_function(wrap_pyfunction!(make_cor_pred_files, m)?)?;
     m.add_function(wrap_pyfunction!(make_ph_amp_files, m)?)?;
+    m.add_function(wrap_pyfunction!(make_ph_amp_arrays, m)?)?;
+    m.add_function(wrap_pyfunction!(make_disp_files, m)?)?;
+    m.add_function(wrap_pyfunction!(make_snr_store, m)?)?;
+    m.add_function(wrap_pyfunction!(set_trace, m)?)?;
+    m.add_function(wrap_pyfunction!(take_trace_events, m)?)?;
+    m.add_class::<PredStore>()?;
+    m.add_class::<EventPipeline>()?;
     Ok(())
 }
@@ -1,6 +1,6 @@
 from tpwt._core import hello_from_rust
 from tpwt.config import TPWTConfig
-from tpwt.inversion import inverse, tpwt_filter, tpwt_iter
+from tpwt.inversion import inverse, tpwt_filter, tpwt_iter, tpwt_pipeline, tpwt_sweep
 from tpwt.plot import Ploter
 
 
@@ -8,4 +8,12 @@ def main() -> None:
     print(hello_from_rust())
 
 
-__all__ = ["TPWTConfig", "tpwt_filter", "tpwt_iter", "inverse", "Ploter"]
+__all__ = [
+    "TPWTConfig",
+    "tpwt_filter",
+    "tpwt_iter",
+    "tpwt_pipeline",
+    "tpwt_sweep",
+    "inverse",
+    "Ploter",
+]
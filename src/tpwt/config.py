@@ -15,6 +15,7 @@ class TPWTConfig:
     """TPWT config"""
 
     valid_methods = ["TPWT", "OPWT"]
+    valid_solvers = ["dense", "lsmr"]
 
     def __init__(self, config_toml: str, greeting: bool = True) -> None:
         """
@@ -54,6 +55,13 @@ class TPWTConfig:
     def ph_path(self) -> Path:
         return self.outpath / "ph_amp"
 
+    def sec_path(self, period: float) -> Path:
+        """ph and amp files of one period, as named by `collect_ph_amp`"""
+        from tpwt.inversion.filter.ph_amp import period_dir
+
+        threshold = self.params["threshold"]
+        return period_dir(self.ph_path(), period, threshold["snr"], threshold["dist"])
+
     def valid_method(self) -> str:
         # check method
         method = self.flags["method"].upper()
@@ -61,16 +69,29 @@ class TPWTConfig:
             return method
         raise ValueError(f"Unvalid method: {method}, pick one in {self.valid_methods}")
 
-    def tpwt_path(self) -> Path:
+    def valid_solver(self) -> str:
+        # check solver of the velocity updates, dense by default
+        solver = self.flags.get("solver", "dense").lower()
+        if solver in self.valid_solvers:
+            return solver
+        raise ValueError(f"Unvalid solver: {solver}, pick one in {self.valid_solvers}")
+
+    def tpwt_path(self, smooth=None, damping=None) -> Path:
+        """output dir of the thresholds and inverse parameters, `smooth`
+        and `damping` override the ones of `[parameters.inverse]`"""
+        threshold = self.params["threshold"]
+        inverse = self.params["inverse"]
+        smooth = inverse["smooth"] if smooth is None else smooth
+        damping = inverse["damping"] if damping is None else damping
         control = [
-            f"snr{self.params['snr']}",
-            f"tmisfit{self.params['tmisfit']}",
-            f"nsta{self.params['nsta']}",
-            f"valid_ratio{str(self.params['valid_ratio'])[2:]}",
+            f"snr{threshold['snr']}",
+            f"tmisfit{threshold['tmisfit']}",
+            f"nsta{threshold['nsta']}",
+            f"valid_ratio{str(threshold['valid_ratio'])[2:]}",
         ]
         invs = [
-            f"smooth{self.params['smooth']}",
-            f"damp{str(self.params['damp'])[2:]}",
+            f"smooth{smooth}",
+            f"damp{str(damping)[2:]}",
         ]
         return self.outpath / "_".join(control) / "_".join(invs)
 
@@ -1,5 +1,5 @@
 """TPWT Inversion"""
 
-from .inver import inverse, tpwt_filter, tpwt_iter
+from .inver import inverse, tpwt_filter, tpwt_iter, tpwt_pipeline, tpwt_sweep
 
-__all__ = ["inverse", "tpwt_filter", "tpwt_iter"]
+__all__ = ["inverse", "tpwt_filter", "tpwt_iter", "tpwt_pipeline", "tpwt_sweep"]
@@ -1,5 +1,11 @@
-from .aftan_snr import aftan_snr
+from .aftan_snr import aftan_snr, write_filelists
 from .dispersion import calculate_dispersion
-from .ph_amp import collect_ph_amp
+from .ph_amp import collect_ph_amp, stream_ph_amp
 
-__all__ = ["calculate_dispersion", "aftan_snr", "collect_ph_amp"]
+__all__ = [
+    "calculate_dispersion",
+    "aftan_snr",
+    "write_filelists",
+    "collect_ph_amp",
+    "stream_ph_amp",
+]
@@ -1,90 +1,141 @@
 import os
+import shutil
 import subprocess
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 from tqdm import tqdm
 
+from tpwt import trace
 
-def aftan_snr(sac_dir: Path, path_dir: Path, aftani_c_pgl_TPWT, spectral_snr_TPWT):
+# piover4 vmin vmax tmin tmax thresh ffact taperl snr fmatch
+AFTAN_PARAMS = "0 2.5 5.0 10 250 20 1 0.5 0.2 2"
+
+
+def aftan_snr(
+    sac_dir: Path,
+    path_dir: Path,
+    aftani_c_pgl_TPWT=None,
+    spectral_snr_TPWT=None,
+    max_workers=None,
+):
     """
     aftan and SNR in sac/event/
 
+    Every sac file is one aftan job in a pool sized to the machine, the
+    largest files are started first so that no big event is left running
+    alone at the end. Each job runs in its own scratch dir, the outputs
+    are moved next to the sac file.
+
     Parameters:
         sac_dir: sac data
         path_dir: the dir where puts PH_PRED files
-        binpath: bin dir
+        aftani_c_pgl_TPWT: aftan binary, None measures natively with a
+            FTAN phase-matched to the PH_PRED predictions
+        spectral_snr_TPWT: SNR binary, None computes the SNR natively
+            into `{event}/snr.store`
+        max_workers: concurrent jobs, defaults to the CPU count
     """
-    work_dir = Path().cwd()
-    path_dir_obs = work_dir / path_dir
-
-    events = [work_dir / i for i in sac_dir.iterdir() if i.is_dir()]
-
-    with ProcessPoolExecutor(max_workers=4) as executor:
-        futures = {
-            executor.submit(
-                process_aftan_snr_per_event,
-                event,
-                work_dir,
-                path_dir_obs,
-                aftani_c_pgl_TPWT,
-                spectral_snr_TPWT,
-            )
-            for event in events
-        }
-        with tqdm(total=len(events)) as pbar:
-            for future in as_completed(futures):
-                result = future.result()
-                pbar.update(1)
-                pbar.set_postfix(stats=result)
+    path_dir = Path(path_dir).resolve()
+    events = [i.resolve() for i in Path(sac_dir).iterdir() if i.is_dir()]
+    if aftani_c_pgl_TPWT is None:
+        from tpwt._core import make_disp_files
+
+        with trace.span("make_disp_files", cat="core"):
+            make_disp_files(str(sac_dir), str(path_dir))
+        sacs = []
+    else:
+        sacs = sorted(
+            (sac for event in events for sac in event.glob("*.sac")),
+            key=lambda sac: sac.stat().st_size,
+            reverse=True,
+        )
+    store = _pred_store(path_dir) if sacs else None
+
+    # the jobs wait on subprocesses, threads are enough
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = [
+            executor.submit(_aftan, sac, path_dir, store, aftani_c_pgl_TPWT)
+            for sac in sacs
+        ]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="aftan"):
+            future.result()
+
+        write_filelists(sac_dir)
+
+        if spectral_snr_TPWT is not None:
+            futures = [
+                executor.submit(_snr, event, spectral_snr_TPWT) for event in events
+            ]
+            for future in tqdm(as_completed(futures), total=len(futures), desc="snr"):
+                future.result()
+
+    if spectral_snr_TPWT is None:
+        from tpwt._core import make_snr_store
+
+        with trace.span("make_snr_store", cat="core"):
+            make_snr_store(str(sac_dir))
+
+
+def write_filelists(sac_dir: Path):
+    """write `{event}/filelist`, the eqlist of the inversion reads them"""
+    for event in Path(sac_dir).iterdir():
+        if event.is_dir():
+            _write_filelist(event)
 
 
 ###############################################################################
 
 
-def process_aftan_snr_per_event(
-    event_dir: Path, work_dir, path_dir, aftani_c_pgl_TPWT, spectral_snr_TPWT
-) -> str:
-    """
-    batch function for aftan_snr
-    """
-    os.chdir(str(event_dir))
+def _aftan(sac: Path, path_dir: Path, store, aftani_c_pgl_TPWT):
+    """run aftan of one sac file, `{sac}_1_DISP.*` etc. end up next to it"""
+    evt, sta = sac.name.split(".")[:2]
+    with tempfile.TemporaryDirectory(prefix=f".aftan_{sta}_", dir=sac.parent) as tmp:
+        scratch = Path(tmp)
+        (scratch / sac.name).symlink_to(sac)
+
+        ref = path_dir / f"{evt}_{sta}.PH_PRED"
+        # aftani_c_pgl_TPWT reads a file, unpack the prediction into the scratch
+        if store is not None:
+            ref = store.materialize(evt, sta, tmp) or ref
 
-    filelist = "filelist"
-    # aftan -> disp files
-    _aftan(event_dir, path_dir, filelist, aftani_c_pgl_TPWT)
-    # snr -> snr file
-    _snr(filelist, spectral_snr_TPWT)
+        param_dat = scratch / "param.dat"
+        param_dat.write_text(f"{AFTAN_PARAMS} {sac.name}\n")
 
-    os.chdir(str(work_dir))
-    return f"Finish: {event_dir.name}"
+        inputs = set(scratch.iterdir())
+        trace.run(
+            [aftani_c_pgl_TPWT, param_dat.name, str(ref)],
+            detail=sac.name,
+            cwd=scratch,
+            stdout=subprocess.DEVNULL,
+        )
+        for out in scratch.iterdir():
+            if out not in inputs:
+                shutil.move(out, sac.parent / out.name)
 
 
-def _snr(filelist, spectral_snr_TPWT):
-    out_msg = "temp.dat"
-    cmd_string = f"{spectral_snr_TPWT} {filelist} > {out_msg} \n"
-    cmd_string += f"rm {out_msg} \n"
-    subprocess.Popen(["bash"], stdin=subprocess.PIPE).communicate(cmd_string.encode())
+def _write_filelist(event_dir: Path):
+    sacs = sorted(event_dir.glob("*.sac"))
+    (event_dir / "filelist").write_text("".join(f"{sac.name}\n" for sac in sacs))
 
 
-def _aftan(event_dir, path_dir, filelist, aftani_c_pgl_TPWT):
-    saclst = []
-    param_dat = "param.dat"
-    params = "0 2.5 5.0 10 250 20 1 0.5 0.2 2"
+def _snr(event_dir: Path, spectral_snr_TPWT):
+    trace.run(
+        [spectral_snr_TPWT, "filelist"],
+        detail=event_dir.name,
+        cwd=event_dir,
+        stdout=subprocess.DEVNULL,
+    )
+    # a native store of an earlier run would shadow the new text files
+    (event_dir / "snr.store").unlink(missing_ok=True)
 
-    cmd_str = "shell start aftan"
-    for sac in event_dir.glob("*.sac"):
-        sacfn = sac.name
-        parts = sacfn.split(".")
-        ref = path_dir / f"{parts[0]}_{parts[1]}.PH_PRED"
 
-        cmd_str += f'echo "{params} {sacfn}" > {param_dat} \n'
-        cmd_str += f"{aftani_c_pgl_TPWT} {param_dat} {ref} \n"
-        saclst.append(sacfn + "\n")
-    cmd_str += f"rm {param_dat}\n"
+def _pred_store(path_dir: Path):
+    """PH_PRED pack written by `make_cor_pred_files`, None for loose files"""
+    if not (path_dir / "PH_PRED.idx").exists():
+        return None
 
-    subprocess.Popen(["bash"], stdin=subprocess.PIPE).communicate(cmd_str.encode())
+    from tpwt._core import PredStore
 
-    # filelist
-    with open(filelist, "w+") as f:
-        f.writelines(saclst)
+    return PredStore(str(path_dir))
@@ -1,14 +1,32 @@
 import shutil
-import subprocess
 from pathlib import Path
 
+from tpwt import trace
+
 # import numpy as np
 # import pandas as pd
 
 
 def calculate_dispersion(
-    evt_csv: str, sta_csv: str, path_dir: Path, disps: list[str], dispersion_TPWT: str
+    evt_csv: str,
+    sta_csv: str,
+    path_dir: Path,
+    disps: list[str],
+    dispersion_TPWT: str,
+    sac_dir=None,
 ):
+    """
+    predicted phase velocities of all event-station pairs -> PH_PRED
+
+    Parameters:
+        evt_csv: events
+        sta_csv: stations
+        path_dir: the dir where puts PH_PRED files
+        disps: LOVE and RAYL model files
+        dispersion_TPWT: GDM52 binary
+        sac_dir: only predict the pairs having a sac file in it,
+            all catalog pairs when None
+    """
     from tpwt._core import make_cor_pred_files, make_pathfile
 
     pathfile = path_dir / "pathfile"
@@ -17,7 +35,9 @@ def calculate_dispersion(
         return
     path_dir.mkdir(parents=True)
 
-    make_pathfile(evt_csv, sta_csv, str(pathfile))
+    sac_dir = None if sac_dir is None else str(sac_dir)
+    with trace.span("make_pathfile", cat="core"):
+        make_pathfile(evt_csv, sta_csv, str(pathfile), sac_dir)
     # create tempinp using for GDM52_dispersion_TPWT
     tempinp = path_dir / "tempinp"
     create_tempinp(pathfile, tempinp)
@@ -34,9 +54,10 @@ def calculate_dispersion(
     # cmd_string += f"{gen_cor_pred_TPWT} {dispersion_out} {path_dir}\n"
     cmd_string += f"rm {tempinp} *.disp\n"
     cmd_string += "echo shell end"
-    subprocess.Popen(["bash"], stdin=subprocess.PIPE).communicate(cmd_string.encode())
+    trace.run(["bash"], name=Path(dispersion_TPWT).name, input=cmd_string)
 
-    make_cor_pred_files(dispersion_out, str(path_dir))
+    with trace.span("make_cor_pred_files", cat="core"):
+        make_cor_pred_files(dispersion_out, str(path_dir))
     shutil.move(dispersion_out, path_dir)
 
 
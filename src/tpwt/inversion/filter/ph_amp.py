@@ -1,7 +1,15 @@
+import queue
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
-# from pathlib import Path
+from tqdm import tqdm
 
+from tpwt import trace
 
+from .surface import grid_event
 from .tpwt_gmt import gmt_surface
 
 
@@ -18,6 +26,12 @@ def collect_ph_amp(
     tmisfit,
     ref_sta,
     region,
+    max_periods=None,
+    gridder="gmt",
+    max_workers=None,
+    write_csv=True,
+    executor=None,
+    on_period=None,
 ):
     """find phase time and amp
 
@@ -34,14 +48,128 @@ def collect_ph_amp(
         tmisfit: max misfit between corrected and expected time
         ref_sta: reference station coordinates
         region: region for gmt surface
+        max_periods: max number of periods corrected at once, bounds memory
+        gridder: `gmt` uses pygmt.surface, `native` grids events in
+            parallel with a penalized minimum curvature fit that only
+            approximates the splines of gmt surface
+        max_workers: processes for native gridding, default all cpus
+        write_csv: also write `{event}.ph.csv` of the corrected records
+        executor: pool for native gridding shared with other stages,
+            a private one with `max_workers` processes when None
+        on_period: called with the period and its output dir as soon as
+            all events of that period are gridded, while the later periods
+            are still picked
     """
-    from tpwt._core import make_ph_amp_files
+    from tpwt._core import make_ph_amp_arrays
+
+    out_dir = Path(out_dir)
+    own_executor = executor is None and gridder != "gmt"
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    # (period, grid future) of every event, the future is None for a
+    # period without events and the period None for the picking itself
+    finished = queue.SimpleQueue()
+    remaining = Counter()
+    failed = False
+
+    def pick():
+        with trace.span("make_ph_amp_arrays", cat="core", periods=periods):
+            make_ph_amp_arrays(
+                str(evt_csv),
+                str(sta_csv),
+                str(sac_dir),
+                periods,
+                snr,
+                dist,
+                nsta,
+                valid_ratio,
+                tmisfit,
+                ref_sta,
+                max_periods,
+                str(out_dir) if write_csv else None,
+                submit_period,
+            )
+
+    def submit_period(period, cols):
+        # runs on the picking threads as soon as the period is corrected
+        if failed:
+            raise RuntimeError("ph and amp gridding failed, stop picking")
+        events = [
+            event for _, event in _iter_events({period: cols}, out_dir, snr, dist)
+        ]
+        remaining[period] = max(len(events), 1)
+        if not events:
+            finished.put((period, None))
+        for event in events:
+            future = pool.submit(grid, *event, region)
+            future.add_done_callback(lambda f, p=period: finished.put((p, f)))
+
+    try:
+        # the picking holds one thread for its whole run, gmt surface runs
+        # one event at a time on the other
+        with ThreadPoolExecutor(max_workers=2) as threads:
+            if gridder == "gmt":
+                pool, grid = threads, _gmt_grid_event
+            else:
+                pool, grid = executor, grid_event
+
+            picking = threads.submit(pick)
+            picking.add_done_callback(lambda f: finished.put((None, f)))
+
+            try:
+                _drain_grids(finished, remaining, on_period, out_dir, snr, dist)
+            except BaseException:
+                failed = True
+                raise
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def stream_ph_amp(
+    evt_csv,
+    sta_csv,
+    sac_dir,
+    path_dir,
+    out_dir,
+    periods,
+    snr,
+    dist,
+    nsta,
+    valid_ratio,
+    tmisfit,
+    ref_sta,
+    region,
+    gridder="gmt",
+    max_workers=None,
+    max_events=2,
+    write_csv=True,
+    executor=None,
+    on_period=None,
+):
+    """measure, pick and grid ph and amp event by event
 
-    make_ph_amp_files(
+    Each event flows through FTAN, SNR, distance and phase picking in
+    `EventPipeline`, and its grids are submitted as soon as its records
+    are out while the next events are still measured. Replaces
+    `aftan_snr` with native FTAN and SNR followed by `collect_ph_amp`,
+    the PH_PRED predictions must exist already.
+
+    Parameters:
+        path_dir: the dir with the PH_PRED predictions
+        max_events: events measured at once, the waveforms of one event
+            already run on all cpus
+        others: same as `collect_ph_amp`
+    """
+    from tpwt._core import EventPipeline
+
+    out_dir = Path(out_dir)
+    pipeline = EventPipeline(
         str(evt_csv),
         str(sta_csv),
         str(sac_dir),
-        str(out_dir),
+        str(path_dir),
         periods,
         snr,
         dist,
@@ -49,18 +177,118 @@ def collect_ph_amp(
         valid_ratio,
         tmisfit,
         ref_sta,
+        str(out_dir) if write_csv else None,
     )
 
-    for ph_csv in out_dir.glob("*/*ph.csv"):
-        root_name = ph_csv.parent / ph_csv.stem
+    own_executor = executor is None and gridder != "gmt"
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_events) as threads:
+            # gmt surface is a subprocess, it can run on the event threads
+            if gridder == "gmt":
+                pool, grid = threads, _gmt_grid_event
+            else:
+                pool, grid = executor, grid_event
+
+            runs = [
+                threads.submit(_run_event, pipeline, event)
+                for event in pipeline.events()
+            ]
+            grids = {}
+            for run in tqdm(as_completed(runs), total=len(runs), desc="Events"):
+                for period, event in _iter_events(run.result(), out_dir, snr, dist):
+                    grids[pool.submit(grid, *event, region)] = period
+
+            remaining = Counter(grids.values())
+            for period in periods:
+                if remaining[period] == 0:
+                    _period_done(on_period, period, out_dir, snr, dist)
+            for future in tqdm(
+                as_completed(grids), total=len(grids), desc="Gridding ph and amp"
+            ):
+                future.result()
+                period = grids[future]
+                remaining[period] -= 1
+                if remaining[period] == 0:
+                    _period_done(on_period, period, out_dir, snr, dist)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def period_dir(out_dir: Path, period, snr, dist) -> Path:
+    """ph and amp dir of one period, named as the csv dirs of `make_ph_amp_arrays`"""
+    return Path(out_dir) / f"{period:.0f}sec_{snr:.0f}snr_{dist:.0f}dist"
+
+
+###############################################################################
+
+
+def _run_event(pipeline, event):
+    with trace.span("event_pipeline", cat="event", event=event):
+        return pipeline.run(event)
+
+
+def _drain_grids(finished, remaining, on_period, out_dir, snr, dist):
+    """wait for the picking and the grids, `on_period` once a period is done"""
+    with tqdm(desc="Gridding ph and amp") as pbar:
+        picked = False
+        while not picked or any(remaining.values()):
+            period, future = finished.get()
+            if future is not None:
+                future.result()
+            if period is None:
+                picked = True
+                continue
+            if future is not None:
+                pbar.update()
+            remaining[period] -= 1
+            if remaining[period] == 0:
+                _period_done(on_period, period, out_dir, snr, dist)
+
+
+def _period_done(on_period, period, out_dir, snr, dist):
+    if on_period is not None:
+        on_period(period, period_dir(out_dir, period, snr, dist))
+
+
+def _iter_events(ph_amps: dict, out_dir: Path, snr, dist):
+    """split the record arrays of every period into events
+
+    Yields:
+        the period, and the root name of output files, lon, lat, time
+        and amp of one event
+    """
+    for period, cols in ph_amps.items():
+        sec_dir = period_dir(out_dir, period, snr, dist)
+        sec_dir.mkdir(parents=True, exist_ok=True)
+        # records of an event are adjacent in the arrays
+        bounds = np.searchsorted(cols["event"], np.arange(len(cols["events"]) + 1))
+        for i, event in enumerate(cols["events"]):
+            rows = slice(bounds[i], bounds[i + 1])
+            yield (
+                period,
+                (
+                    sec_dir / event,
+                    cols["lon"][rows],
+                    cols["lat"][rows],
+                    cols["time"][rows],
+                    cols["amp"][rows],
+                ),
+            )
+
 
-        df = pd.read_csv(ph_csv)
+@trace.traced("event")
+def _gmt_grid_event(root_name, lon, lat, time, amp, region):
+    df = pd.DataFrame({"lon": lon, "lat": lat, "time": time, "amp": amp})
 
-        ph_file = root_name.with_suffix(".ph.HD")
-        gmt_surface(df[["lon", "lat", "time"]], region, str(ph_file))
+    ph_file = root_name.with_suffix(".ph.HD")
+    gmt_surface(df[["lon", "lat", "time"]], region, str(ph_file))
 
-        amp_file = root_name.with_suffix(".amp.HD")
-        gmt_surface(df[["lon", "lat", "amp"]], region, str(amp_file))
+    amp_file = root_name.with_suffix(".amp.HD")
+    gmt_surface(df[["lon", "lat", "amp"]], region, str(amp_file))
 
 
 # def phase_amplitude_bin(
@@ -0,0 +1,155 @@
+"""
+Minimum curvature gridding without GMT
+"""
+
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+from tpwt import trace
+
+# penalty of the data misfit relative to the curvature of the surface
+DATA_WEIGHT = 1e4
+
+
+def grid_axes(region: list, spacing: float) -> Tuple[np.ndarray, np.ndarray]:
+    """gridline registered nodes of region, same as `gmt surface -I`"""
+    west, east, south, north = region
+    nx = int(round((east - west) / spacing)) + 1
+    ny = int(round((north - south) / spacing)) + 1
+    return west + spacing * np.arange(nx), south + spacing * np.arange(ny)
+
+
+def surface_grid(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    region: list,
+    spacing: float = 0.2,
+    tension: float = 0.0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """grid scattered data with a continuous curvature spline in tension
+
+    The surface minimizes `(1 - T) * curvature + T * slope` over the grid
+    with natural boundaries, like `gmt surface -T`. Data are tied to the
+    grid by bilinear interpolation, so points off the nodes and several
+    points in one cell are fitted in the least-squares sense.
+
+    Parameters:
+        x: longitudes of data
+        y: latitudes of data
+        z: values, 1-D or 2-D with one column per surface sharing x and y
+        region: [west, east, south, north]
+        spacing: grid spacing in degree
+        tension: tension factor between 0 and 1
+
+    Returns:
+        lons, lats and the grid with shape `(len(lats), len(lons))`,
+        or `(len(lats), len(lons), ncols)` for 2-D `z`
+    """
+    lons, lats = grid_axes(region, spacing)
+    nx, ny = len(lons), len(lats)
+
+    x, y, z = np.asarray(x, float), np.asarray(y, float), np.asarray(z, float)
+    inside = (x >= lons[0]) & (x <= lons[-1]) & (y >= lats[0]) & (y <= lats[-1])
+    x, y, z = x[inside], y[inside], z[inside]
+
+    ptp = _bilinear(x, y, lons[0], lats[0], spacing, nx, ny)
+    system = _smoothness(nx, ny, tension) + DATA_WEIGHT * (ptp.T @ ptp)
+    rhs = DATA_WEIGHT * (ptp.T @ z)
+
+    solved = splu(system.tocsc()).solve(np.asarray(rhs))
+    return lons, lats, solved.reshape((ny, nx) + z.shape[1:])
+
+
+def write_xyz(lons: np.ndarray, lats: np.ndarray, grid: np.ndarray, outfile: str):
+    """write a grid in the layout of `gmt grd2xyz`, north row first"""
+    lon_grid, lat_grid = np.meshgrid(lons, lats[::-1])
+    xyz = np.column_stack([lon_grid.ravel(), lat_grid.ravel(), grid[::-1].ravel()])
+    np.savetxt(outfile, xyz, fmt="%.12g", delimiter="\t")
+
+
+def grid_event(
+    root_name: Path, lon, lat, time, amp, region: list, spacing: float = 0.2
+):
+    """grid phase time and amplitude of one event
+
+    Writes `{root_name}.ph.HD` and `{root_name}.amp.HD`, both surfaces
+    share one factorization.
+    """
+    with trace.span(
+        "grid_event", cat="event", event=root_name.name, period=root_name.parent.name
+    ):
+        lons, lats, grids = surface_grid(
+            lon, lat, np.column_stack([time, amp]), region, spacing
+        )
+        write_xyz(lons, lats, grids[..., 0], str(root_name.with_suffix(".ph.HD")))
+        write_xyz(lons, lats, grids[..., 1], str(root_name.with_suffix(".amp.HD")))
+
+
+def grid_ph_csv(ph_csv: Path, region: list, spacing: float = 0.2):
+    """grid phase time and amplitude of one `{event}.ph.csv`"""
+    df = pd.read_csv(ph_csv)
+    root_name = ph_csv.parent / ph_csv.stem
+    grid_event(
+        root_name,
+        df["lon"].values,
+        df["lat"].values,
+        df["time"].values,
+        df["amp"].values,
+        region,
+        spacing,
+    )
+
+
+###############################################################################
+
+
+@lru_cache(maxsize=8)
+def _smoothness(nx: int, ny: int, tension: float) -> sparse.csr_matrix:
+    """normal matrix of the curvature and slope energies on a nx * ny grid"""
+    d1x, d1y = _diff(nx, 1), _diff(ny, 1)
+    d2x, d2y = _diff(nx, 2), _diff(ny, 2)
+    ix, iy = sparse.identity(nx), sparse.identity(ny)
+
+    dxx = sparse.kron(iy, d2x)
+    dyy = sparse.kron(d2y, ix)
+    dxy = sparse.kron(d1y, d1x)
+    curvature = dxx.T @ dxx + dyy.T @ dyy + 2 * dxy.T @ dxy
+
+    dx = sparse.kron(iy, d1x)
+    dy = sparse.kron(d1y, ix)
+    slope = dx.T @ dx + dy.T @ dy
+
+    # tiny ridge keeps the system regular with less than 3 data points
+    ridge = 1e-10 * sparse.identity(nx * ny)
+    return ((1 - tension) * curvature + tension * slope + ridge).tocsr()
+
+
+def _diff(n: int, order: int) -> sparse.csr_matrix:
+    """finite difference of `order` on n nodes, unit spacing"""
+    stencil = {1: [-1.0, 1.0], 2: [1.0, -2.0, 1.0]}[order]
+    return sparse.diags(stencil, range(order + 1), shape=(n - order, n)).tocsr()
+
+
+def _bilinear(x, y, x0, y0, spacing, nx, ny) -> sparse.csr_matrix:
+    """bilinear interpolation from grid nodes to data points"""
+    fx = (x - x0) / spacing
+    fy = (y - y0) / spacing
+    ix = np.clip(np.floor(fx).astype(int), 0, nx - 2)
+    iy = np.clip(np.floor(fy).astype(int), 0, ny - 2)
+    tx, ty = fx - ix, fy - iy
+
+    rows = np.repeat(np.arange(len(x)), 4)
+    cols = np.column_stack(
+        [iy * nx + ix, iy * nx + ix + 1, (iy + 1) * nx + ix, (iy + 1) * nx + ix + 1]
+    ).ravel()
+    vals = np.column_stack(
+        [(1 - tx) * (1 - ty), tx * (1 - ty), (1 - tx) * ty, tx * ty]
+    ).ravel()
+    return sparse.csr_matrix((vals, (rows, cols)), shape=(len(x), nx * ny))
@@ -1,12 +1,26 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import pandas as pd
+from tqdm import tqdm
 
-from tpwt import TPWTConfig
+from tpwt import TPWTConfig, trace
 
-from .filter import aftan_snr, calculate_dispersion, collect_ph_amp
-from .iterate import collect_results, inverse_iter, make_pre_files
+from .filter import (
+    aftan_snr,
+    calculate_dispersion,
+    collect_ph_amp,
+    stream_ph_amp,
+    write_filelists,
+)
+from .iterate import (
+    collect_results,
+    inverse_iter,
+    invert_period,
+    make_pre_files,
+    sweep_regularization,
+)
 
 
 def tpwt_iter(cfg: TPWTConfig):
@@ -34,9 +48,48 @@ def tpwt_iter(cfg: TPWTConfig):
         Not complete!
     """
     method = cfg.valid_method()
-    eqlist, gridnode, stationid = make_pre_files(cfg)
-    inverse_iter(method)
-    collect_results(cfg.tpwt_path())
+    pre_files = make_pre_files(cfg)
+    inverse_iter(cfg, method, pre_files)
+    _collect_results(cfg)
+
+
+def tpwt_sweep(
+    cfg: TPWTConfig,
+    smooths: List[float],
+    dampings: List[float],
+    periods: Optional[List[float]] = None,
+    max_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """tpwt iterate with every smoothing and damping, for L-curves.
+
+    The pre files, ph and amp files and kernels are made once, the
+    inversions run in a process pool, each into its own
+    `cfg.tpwt_path(smooth, damping)`. Needs the ph and amp files of
+    `tpwt_filter`.
+
+    Parameters:
+        config: tpwt config
+        smooths: smoothing lengths in km
+        dampings: dampings in km/s
+        periods: periods to invert, default all periods of cfg
+        max_workers: processes, default all cpus
+
+    Returns:
+        misfit and model norm of every period, smoothing and damping,
+        also written to `lcurve.{period}.csv` next to the tpwt paths
+
+    Examples:
+        ```python
+        import tpwt
+
+        cfg = tpwt.TPWTConfig(config_toml)
+        tpwt.tpwt_sweep(cfg, smooths=[60, 90, 120], dampings=[0.1, 0.2, 0.4])
+        ```
+    """
+    pre_files = make_pre_files(cfg)
+    return sweep_regularization(
+        cfg, pre_files, smooths, dampings, periods, max_workers=max_workers
+    )
 
 
 def tpwt_filter(cfg: TPWTConfig):
@@ -59,22 +112,111 @@ def tpwt_filter(cfg: TPWTConfig):
         tpwt.quanlity_control(cfg)
         ```
     """
-    path_dir = cfg.outpath / "path"
+    _prepare_waveforms(cfg)
+    _collect_ph_amp(cfg)
+
+
+def tpwt_pipeline(cfg: TPWTConfig, max_workers: Optional[int] = None):
+    """tpwt quanlity control and iterate in one pipeline.
+
+    The inversion of a period only needs the ph and amp grids of that
+    period, so it starts as soon as the last event of the period is
+    gridded instead of after all periods. Gridding and inversion share
+    one process pool, the cpus are never split between the stages.
+    With native FTAN and SNR the events are streamed through measuring,
+    picking and gridding one by one, see `stream_ph_amp`.
+
+    Parameters:
+        config: tpwt config
+        max_workers: processes of the shared pool, default
+            `parameters.max_workers` of the config or all cpus
+
+    Examples:
+        ```python
+        import tpwt
+
+        cfg = tpwt.TPWTConfig(config_toml)
+        tpwt.tpwt_pipeline(cfg)
+        ```
+    """
+    method = cfg.valid_method()
+    params = cfg.params
+    streamed = params.get("native_ftan", False) and params.get("native_snr", False)
+    if streamed:
+        _predict_dispersion(cfg)
+        write_filelists(cfg.paths["sac_dir"])
+    else:
+        _prepare_waveforms(cfg)
+    pre_files = make_pre_files(cfg)
+
+    max_workers = max_workers or cfg.params.get("max_workers")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        inversions = []
+
+        def on_period(period, sec_dir):
+            inversions.append(
+                executor.submit(invert_period, cfg, period, method, pre_files, sec_dir)
+            )
+
+        ph_amp = _stream_ph_amp if streamed else _collect_ph_amp
+        ph_amp(cfg, executor=executor, on_period=on_period)
+        # only the inversions still running after the last grid
+        with trace.span("inversion"):
+            for future in tqdm(
+                as_completed(inversions), total=len(inversions), desc="Inversion"
+            ):
+                future.result()
+
+    _collect_results(cfg)
+
+
+def _prepare_waveforms(cfg: TPWTConfig):
+    """predicted dispersion, aftan and SNR of all waveforms"""
+    _predict_dispersion(cfg)
+
+    # aftani_c_pgl_TPWT, None measures the dispersion natively
+    aftani_c_pgl_TPWT = None
+    if not cfg.params.get("native_ftan", False):
+        aftani_c_pgl_TPWT = cfg.binuse("aftani_c_pgl_TPWT")
+    # spectral_snr_TPWT, None computes the SNR natively
+    spectral_snr_TPWT = None
+    if not cfg.params.get("native_snr", False):
+        spectral_snr_TPWT = cfg.binuse("spectral_snr_TPWT")
+    with trace.span("aftan_snr"):
+        aftan_snr(
+            cfg.paths["sac_dir"], _path_dir(cfg), aftani_c_pgl_TPWT, spectral_snr_TPWT
+        )
 
+
+@trace.traced(name="dispersion")
+def _predict_dispersion(cfg: TPWTConfig):
+    """PH_PRED predictions of all event-station pairs"""
     dispersion_TPWT = cfg.binuse("GDM52_dispersion_TPWT")
     calculate_dispersion(
         str(cfg.paths["evt_csv"]),
         str(cfg.paths["sta_csv"]),
-        path_dir,
+        _path_dir(cfg),
         cfg.get_disps(),
         dispersion_TPWT,
+        sac_dir=cfg.paths["sac_dir"] if cfg.params.get("archive_pairs", True) else None,
     )
-    # aftani_c_pgl_TPWT
-    aftani_c_pgl_TPWT = cfg.binuse("aftani_c_pgl_TPWT")
-    # spectral_snr_TPWT
-    spectral_snr_TPWT = cfg.binuse("spectral_snr_TPWT")
-    aftan_snr(cfg.paths["sac_dir"], path_dir, aftani_c_pgl_TPWT, spectral_snr_TPWT)
 
+
+def _collect_results(cfg: TPWTConfig):
+    """velocity tables and grids of all periods"""
+    collect_results(
+        cfg.tpwt_path(),
+        region=cfg.region.to_list(),
+        smooth=cfg.params["inverse"]["smooth"],
+    )
+
+
+def _path_dir(cfg: TPWTConfig):
+    return cfg.outpath / "path"
+
+
+@trace.traced(name="ph_amp")
+def _collect_ph_amp(cfg: TPWTConfig, **kwargs):
     collect_ph_amp(
         cfg.paths["evt_csv"],
         cfg.paths["sta_csv"],
@@ -84,10 +226,32 @@ def tpwt_filter(cfg: TPWTConfig):
         **cfg.params["threshold"],
         region=cfg.region.to_list(),
         ref_sta=cfg.model["ref_sta"],
+        gridder=cfg.params.get("gridder", "gmt"),
+        max_periods=cfg.params.get("max_periods"),
+        write_csv=cfg.params.get("write_ph_csv", True),
+        **kwargs,
     )
 
 
-def inverse(config_toml: str):
+@trace.traced(name="ph_amp")
+def _stream_ph_amp(cfg: TPWTConfig, **kwargs):
+    stream_ph_amp(
+        cfg.paths["evt_csv"],
+        cfg.paths["sta_csv"],
+        cfg.paths["sac_dir"],
+        _path_dir(cfg),
+        cfg.ph_path(),
+        cfg.periods(),
+        **cfg.params["threshold"],
+        region=cfg.region.to_list(),
+        ref_sta=cfg.model["ref_sta"],
+        gridder=cfg.params.get("gridder", "gmt"),
+        write_csv=cfg.params.get("write_ph_csv", True),
+        **kwargs,
+    )
+
+
+def inverse(config_toml: str, pipelined: Optional[bool] = None):
     """tpwt inverse
 
     tpwt inverse, contains two steps:
@@ -96,6 +260,13 @@ def inverse(config_toml: str):
 
     Parameters:
         config_toml: tpwt config file in toml format
+        pipelined: start the inversion of each period as soon as its
+            grids are done, see `tpwt_pipeline`, default
+            `parameters.pipelined` of the config or false
+
+    With `parameters.trace = true` the stages, periods, events and
+    binaries are traced into `{output_dir}/trace.json` (Chrome trace
+    format) and `{output_dir}/trace_summary.csv`, see `tpwt.trace`.
 
     Examples:
         ```python
@@ -107,5 +278,22 @@ def inverse(config_toml: str):
         Not complete!
     """
     cfg = TPWTConfig(config_toml)
-    tpwt_filter(cfg)
-    tpwt_iter(cfg)
+    trace_dir = cfg.outpath / "trace"
+    if cfg.params.get("trace", False):
+        trace.enable(trace_dir)
+
+    if pipelined is None:
+        pipelined = cfg.params.get("pipelined", False)
+    with trace.span("inverse"):
+        if pipelined:
+            tpwt_pipeline(cfg)
+        else:
+            tpwt_filter(cfg)
+            tpwt_iter(cfg)
+
+    if trace.enabled():
+        trace.disable()
+        trace.export_chrome(trace_dir, cfg.outpath / "trace.json")
+        table = trace.summary(trace_dir)
+        table.to_csv(cfg.outpath / "trace_summary.csv")
+        print(table.to_string())
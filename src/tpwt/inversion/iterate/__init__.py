@@ -1,5 +1,23 @@
-from .iterate import inverse_iter
+from .engine import TPWTResult, invert_tpwt, load_events, read_nodes
+from .grid import grid_results, grid_velocities
+from .iterate import inverse_iter, invert_period
 from .pre_files import make_pre_files
-from .result import collect_results
+from .result import collect_results, write_result
+from .sensitivity import sensitivity_kernel
+from .sweep import sweep_regularization
 
-__all__ = ["make_pre_files", "inverse_iter", "collect_results"]
+__all__ = [
+    "make_pre_files",
+    "inverse_iter",
+    "invert_period",
+    "collect_results",
+    "grid_results",
+    "grid_velocities",
+    "invert_tpwt",
+    "load_events",
+    "read_nodes",
+    "TPWTResult",
+    "write_result",
+    "sensitivity_kernel",
+    "sweep_regularization",
+]
@@ -3,99 +3,34 @@ import shutil
 import subprocess
 
 from rose import pather
-import tpwt
+
+from .sensitivity import sensitivity_kernel, write_sensitivity
 
 
 def sensitivity_TPWT(
-    per, vel, smooth, wave_type="rayleigh", *, out_dir=None, bin_from="./"
+    per, vel, smooth, wave_type="rayleigh", *, out_dir=None, cache_dir=None
 ):
     """
-    sensitivity
-    """
-    # create sac
-    sac_file = f"{per}.sac"
-    tpwt.lib.sac_sens_new_period(sac_file, per)
-    # createsac_TPWT = get_binuse('createsac_TPWT', bin_from)
-
-    # cmd_list = [
-    #     f'{createsac_TPWT} <<!',
-    #     f'{per}',
-    #     f'{sac_file}',
-    #     '!',
-    # ]
-    # cmd_string = '\n'.join(cmd_list)
-    # subprocess.Popen(
-    #     ['bash'],
-    #     stdin = subprocess.PIPE
-    # ).communicate(cmd_string.encode())
-
-    # sac
-    sac_cut = f"{per}.cut800t1000"
-    os.putenv("SAC_DISPLAY_COPYRIGHT", "0")
-    s_list = [
-        "wild echo off",
-        "cut 750 1050",
-        f"r {sac_file}",
-        "taper w 0.1666667",
-        f"w {sac_cut}",
-        "cuterr fillz",
-        "cut 0 2000",
-        f"r {sac_cut}",
-        "cuterr u",
-        f"w {sac_cut}",
-        "fft",
-        "wsp",
-        "q\n",
-    ]
-    s = "\n".join(s_list)
-    subprocess.Popen(["sac"], stdin=subprocess.PIPE).communicate(s.encode())
+    sensitivity, written to `sens{per}s{smooth}km.dat`
 
-    # getdatafromsac_GZ
-    input = f"{sac_cut}.am"
-    # output = input + '.dat'
-    # getdatafromsac = get_binuse('getdatafromsac_GZ', bin_from)
-
-    # cmd_list = [
-    #     f'{getdatafromsac} <<!',
-    #     f'{input}',
-    #     f'{output}',
-    #     '!',
-    # ]
-    # cmd_string = '\n'.join(cmd_list)
-    # subprocess.Popen(
-    #     ['bash'],
-    #     stdin = subprocess.PIPE
-    # ).communicate(cmd_string.encode())
+    The kernels are made natively by `sensitivity_kernel` and reused
+    from its cache, no `{per}.sac` or sac session is run. They are a new
+    model, not a reproduction of the `sensitivity` binary's kernels.
+    """
+    if wave_type != "rayleigh":
+        raise ValueError(f"Only rayleigh kernels are supported, got {wave_type}")
 
-    # # sensitivity_wavetype
-    # sen_input = output
+    kernel = sensitivity_kernel(per, vel, smooth, cache_dir=cache_dir)
     sen_output = f"sens{per}s{smooth}km.dat"
-    tpwt.lib.sac_sens(input, vel, smooth, sen_output)
-    # sensitivity = get_binuse(f'sensitivity_{wave_type}', bin_from)
-
-    # cmd_list = [
-    #     f'{sensitivity} <<!',
-    #     f'{vel}',
-    #     f'{sen_input}',
-    #     f'{sen_output}',
-    #     f'{smooth}',
-    #     '!',
-    #     f'rm {per}.*',
-    # ]
-    # cmd_string = '\n'.join(cmd_list)
-    # subprocess.Popen(
-    #     ['bash'],
-    #     stdin = subprocess.PIPE
-    # ).communicate(cmd_string.encode())
-
     if out_dir:
         # check if des_dir exists
-        if os.path.exists(out_dir):
-            shutil.move(sen_output, out_dir)
-        else:
+        if not os.path.exists(out_dir):
             err_description = f"Output dir {out_dir} is not found."
             err_description += "Please check the target directory."
             raise Exception(err_description)
+        sen_output = os.path.join(out_dir, sen_output)
+    write_sensitivity(kernel, sen_output)
+    return kernel
 
 
 ###############################################################################
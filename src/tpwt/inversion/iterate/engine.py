@@ -0,0 +1,561 @@
+"""
+Two-plane-wave tomography of one period
+
+Native replacement of the `simannerr*.kern` programs (Forsyth & Li, 2005;
+Yang & Forsyth, 2006). The incoming field of every event is the sum of
+two plane waves, each with an amplitude, a phase and a direction off the
+mean propagation of the event. Phase velocities are parameterized at the
+inversion nodes of `make_gridnode`: the velocity at any point is the
+Gaussian-weighted average of the nodes within `smooth` km, and the
+kernels of `sensitivity_kernel` map it to the phase and amplitude at
+every station.
+
+The wave parameters of each event start from a grid search over the
+directions, for which the amplitudes and phases are linear. Velocities
+and wave parameters are then updated together by damped Gauss-Newton
+steps. The wave parameters are eliminated event by event, in parallel,
+so only the system of the nodes is solved. As a wrong pair of directions
+is a local minimum, they are searched again with the updated velocities
+after each step, for as long as that changes any event.
+
+Examples:
+    ```python
+    from tpwt.inversion.iterate.engine import invert_tpwt, load_events, read_nodes
+
+    nodes = read_nodes("outputs/inverse_node")
+    events = load_events("outputs/ph_amp/25sec_10snr_3500dist")
+    result = invert_tpwt(events, nodes, 25, 3.32, smooth=90, damping=0.2)
+    ```
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import linalg, sparse
+from scipy.sparse.linalg import lsmr
+
+from .sensitivity import Kernel, sensitivity_kernel
+
+EARTH_RADIUS_KM = 6371.0
+# grid search of the wave directions off the mean propagation, degrees
+THETA_MAX = 30.0
+THETA_STEP = 2.0
+# the velocity effect on the searched directions is interpolated from these
+THETA_COARSE = 6.0
+# a priori standard deviations of amplitude, phase (rad) and direction (rad)
+SIGMA_WAVE = (1.0, np.pi, np.radians(5.0))
+# solvers of the Gauss-Newton steps
+SOLVERS = ["dense", "lsmr"]
+# velocity sensitivities below this part of the largest one are dropped by lsmr
+SPARSE_DROP = 1e-6
+# LSMR iterations per column of the system
+LSMR_ITERATIONS = 20
+# a Gauss-Newton step raising the misfit is halved up to this many times
+MAX_HALVINGS = 4
+
+
+class EventData(NamedTuple):
+    """phase times (s) and amplitudes of one event at its stations"""
+
+    name: str
+    lon: np.ndarray
+    lat: np.ndarray
+    time: np.ndarray
+    amp: np.ndarray
+    station: Optional[np.ndarray] = None
+
+
+class TPWTResult(NamedTuple):
+    """velocities of one period
+
+    `covar` is the a posteriori covariance of the node velocities in
+    (km/s)². `waves` holds the amplitude, phase (rad) and direction off
+    the mean propagation (deg) of every plane wave with the rms misfit
+    of each event, `residuals` the phase time (s) and ln-amplitude
+    residuals of its stations.
+    """
+
+    period: float
+    vel0: float
+    nodes: np.ndarray
+    vel: np.ndarray
+    covar: np.ndarray
+    waves: pd.DataFrame
+    residuals: Dict[str, pd.DataFrame]
+    misfits: List[float]
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(np.diag(self.covar))
+
+    def average(self, region=None):
+        """mean velocity and its standard deviation over the nodes in
+        `region` [west, east, south, north], default all nodes"""
+        lat, lon = self.nodes.T
+        mask = np.ones(len(lat), bool)
+        if region is not None:
+            west, east, south, north = region
+            mask = (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)
+        w = mask / mask.sum()
+        return float(w @ self.vel), float(np.sqrt(w @ self.covar @ w))
+
+
+def invert_tpwt(
+    events: List[EventData],
+    nodes: np.ndarray,
+    period: float,
+    vel: float,
+    smooth: float,
+    damping: float,
+    *,
+    waves: int = 2,
+    n_iter: int = 10,
+    tol: float = 1e-3,
+    solver: str = "dense",
+    max_workers: Optional[int] = None,
+    cache_dir=None,
+) -> TPWTResult:
+    """invert the phase velocities of one period
+
+    Parameters:
+        events: phase and amplitude data, see `load_events`
+        nodes: (lat, lon) of the inversion nodes, see `read_nodes`
+        period: period in s
+        vel: starting and reference phase velocity in km/s
+        smooth: Gaussian averaging length of the nodes in km
+        damping: a priori standard deviation of node velocities in km/s
+        waves: plane waves per event, 2 for TPWT and 1 for OPWT
+        n_iter: maximum Gauss-Newton iterations
+        tol: stop when the rms misfit improves less than this ratio
+        solver: `dense` solves the normal equations of the nodes, `lsmr`
+            the sparse least-squares system of all parameters, faster
+            for thousands of nodes. Their steps agree to about 1e-6, `lsmr`
+            drops sensitivities below `SPARSE_DROP` and stops at the
+            tolerance of `scipy.sparse.linalg.lsmr`.
+        max_workers: threads working on events
+        cache_dir: disk cache of the sensitivity kernels
+
+    Returns:
+        velocities, covariance, wave parameters and residuals
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"Unvalid solver: {solver}, pick one in {SOLVERS}")
+    kernel = sensitivity_kernel(period, vel, smooth, cache_dir=cache_dir)
+    model = _Model(nodes, smooth, kernel, 2 * np.pi / period, vel)
+    sigma_v = damping / vel
+    delta = np.zeros(len(nodes))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fits = list(executor.map(lambda e: _EventFit(e, model, waves), events))
+        misfits = [_rms(fit.residual(model, delta) for fit in fits)]
+        searching = waves > 1
+
+        def normal_equations(delta, sigma):
+            normal = partial(_EventFit.normal, model=model, delta=delta, sigma=sigma)
+            systems = list(executor.map(normal, fits))
+            nvv = sum(s.nvv for s in systems) + np.eye(len(delta)) / sigma_v**2
+            return systems, nvv
+
+        for _ in range(n_iter):
+            if solver == "lsmr":
+                linear = partial(
+                    _EventFit.linear, model=model, delta=delta, sigma=misfits[-1]
+                )
+                step, wave_steps = _lsmr_step(
+                    list(executor.map(linear, fits)), fits, delta, sigma_v
+                )
+            else:
+                systems, nvv = normal_equations(delta, misfits[-1])
+                bv = sum(s.bv for s in systems) - delta / sigma_v**2
+                step = linalg.solve(nvv, bv, assume_a="pos")
+                wave_steps = [s.wave_step(step) for s in systems]
+
+            # halve the step until the misfit drops
+            for scale in 0.5 ** np.arange(MAX_HALVINGS + 1):
+                trial = delta + scale * step
+                trial_residual = partial(_trial_residual, model, trial, scale)
+                misfit = _rms(executor.map(trial_residual, fits, wave_steps))
+                if misfit < misfits[-1]:
+                    break
+            else:
+                break
+
+            delta = trial
+            for fit, wave_step in zip(fits, wave_steps, strict=True):
+                fit.params = fit.params + scale * wave_step
+            misfits.append(misfit)
+            # a wrong pair of directions is a local minimum of the steps
+            if searching:
+                # every event is re-searched before any parameter is read again
+                research = partial(_EventFit.research, model=model, delta=delta)
+                searching = any(list(executor.map(research, fits)))
+                if searching:
+                    misfit = _rms(f.residual(model, delta) for f in fits)
+                    misfits[-1] = misfit
+            if misfits[-2] - misfit < tol * misfits[-2]:
+                break
+
+        _, nvv = normal_equations(delta, misfits[-1])
+
+    covar = linalg.inv(nvv) * vel**2
+    return TPWTResult(
+        period=period,
+        vel0=vel,
+        nodes=np.asarray(nodes),
+        vel=vel * (1 + delta),
+        covar=(covar + covar.T) / 2,
+        waves=pd.DataFrame([fit.summary(model, delta) for fit in fits]),
+        residuals={fit.name: fit.residual_table(model, delta) for fit in fits},
+        misfits=misfits,
+    )
+
+
+def read_nodes(gridnode) -> np.ndarray:
+    """(lat, lon) of the nodes in a `make_gridnode` file"""
+    with open(gridnode) as f:
+        f.readline()
+        n = int(f.readline())
+        return np.loadtxt(f, usecols=(0, 1), max_rows=n, ndmin=2)
+
+
+def read_eqlist(eqlist) -> Dict[str, List[str]]:
+    """stations of every event in an eqlist of `make_eqlist`"""
+    events: Dict[str, List[str]] = {}
+    for line in Path(eqlist).read_text().splitlines()[1:]:
+        cols = line.split()
+        # `    {nsta} {i}` starts the block of an event
+        if len(cols) != 1:
+            continue
+        sac = Path(cols[0])
+        events.setdefault(sac.parent.name, []).append(sac.name.split(".")[1])
+    return events
+
+
+def load_events(sec_dir, events=None, sta_df=None) -> List[EventData]:
+    """`{event}.ph.csv` files of one period
+
+    Parameters:
+        sec_dir: ph and amp dir of the period
+        events: only these events, e.g. the keys of `read_eqlist`
+        sta_df: stations csv, names the records by their coordinates
+    """
+    names = {}
+    if sta_df is not None:
+        coords = zip(
+            sta_df["longitude"].round(4), sta_df["latitude"].round(4), strict=True
+        )
+        names = dict(zip(coords, sta_df["station"], strict=True))
+
+    files = sorted(Path(sec_dir).glob("*.ph.csv"))
+    data = []
+    for file in files:
+        name = file.name.removesuffix(".ph.csv")
+        if events is not None and name not in events:
+            continue
+        df = pd.read_csv(file)
+        station = None
+        if names:
+            coords = zip(df["lon"].round(4), df["lat"].round(4), strict=True)
+            station = np.array([names.get(c, "") for c in coords])
+        data.append(
+            EventData(
+                name,
+                *(df[c].to_numpy(float) for c in ("lon", "lat", "time", "amp")),
+                station=station,
+            )
+        )
+    return data
+
+
+###############################################################################
+
+
+class _Model:
+    """projection, integration grid and node weights shared by all events"""
+
+    def __init__(self, nodes, smooth, kernel: Kernel, omega, vel):
+        nodes = np.asarray(nodes, float)
+        self.lat0, self.lon0 = nodes.mean(axis=0)
+        self.nodes_xy = self.project(nodes[:, 1], nodes[:, 0])
+        self.kernel = kernel
+        self.omega = omega
+        self.k0 = omega / vel
+
+        # the smoothed kernels vary over `smooth`, a third of it is enough
+        self.h = max(smooth / 3, kernel.spacing)
+        lo, hi = self.nodes_xy.min(axis=0), self.nodes_xy.max(axis=0)
+        gx, gy = (
+            np.arange(a, b + self.h / 2, self.h) for a, b in zip(lo, hi, strict=True)
+        )
+        self.points = np.column_stack([g.ravel() for g in np.meshgrid(gx, gy)])
+
+        # velocity at a point is the Gaussian-weighted average of the nodes
+        d2 = ((self.points[:, None, :] - self.nodes_xy[None, :, :]) ** 2).sum(-1)
+        weights = np.exp(-d2 / smooth**2)
+        self.weights = weights / weights.sum(axis=1, keepdims=True)
+
+    def project(self, lon, lat) -> np.ndarray:
+        """x east and y north in km around the centre of the nodes"""
+        x = np.radians(np.asarray(lon) - self.lon0) * np.cos(np.radians(self.lat0))
+        y = np.radians(np.asarray(lat) - self.lat0)
+        return EARTH_RADIUS_KM * np.column_stack([x, y])
+
+    def sensitivity(self, xy, azimuth):
+        """phase and amplitude sensitivity of every station to the node
+        perturbations dc/c, for a wave travelling towards `azimuth`"""
+        along = np.array([np.sin(azimuth), np.cos(azimuth)])
+        across = np.array([np.cos(azimuth), -np.sin(azimuth)])
+        rel = self.points[None, :, :] - xy[:, None, :]
+        phase, amp = self.kernel.sample((rel @ along).ravel(), (rel @ across).ravel())
+        shape = (len(xy), len(self.points))
+        area = self.h**2
+        return (
+            (phase.reshape(shape) * area) @ self.weights,
+            (amp.reshape(shape) * area) @ self.weights,
+        )
+
+
+class _System(NamedTuple):
+    """normal equations of one event with its wave parameters eliminated"""
+
+    nvv: np.ndarray
+    bv: np.ndarray
+    nvw: np.ndarray
+    nww_inv: np.ndarray
+    bw: np.ndarray
+    residual: np.ndarray
+
+    def wave_step(self, step):
+        """update of the wave parameters, shaped as `_EventFit.params`"""
+        return (self.nww_inv @ (self.bw - self.nvw.T @ step)).reshape(-1, 3)
+
+
+class _EventFit:
+    """observed field and plane-wave parameters of one event"""
+
+    def __init__(self, event: EventData, model: _Model, waves: int):
+        self.name = event.name
+        self.lon, self.lat = event.lon, event.lat
+        self.station = event.station
+        self.xy = model.project(event.lon, event.lat)
+        phase = model.omega * (event.time - np.median(event.time))
+        self.obs = event.amp / event.amp.mean() * np.exp(-1j * phase)
+        self.azimuth = _mean_azimuth(self.xy, event.time)
+        self.waves = waves
+        # rows of (amplitude, phase, direction)
+        self.params = _search_waves(self.obs, self._basis(model), self.waves)
+        self.prior = self.params.copy()
+        self.prior_inv = np.tile(1 / np.square(SIGMA_WAVE), len(self.params))
+
+    def research(self, model: _Model, delta) -> bool:
+        """search the directions again with the node perturbations, keep
+        the result when it fits better than the current parameters"""
+        params = _search_waves(self.obs, self._basis(model, delta), self.waves)
+        current = self.residual(model, delta)
+        if _rms([self.residual(model, delta, params)]) >= _rms([current]):
+            return False
+        self.params, self.prior = params, params.copy()
+        return True
+
+    def _basis(self, model: _Model, delta=None) -> np.ndarray:
+        """unit plane waves of the searched directions at the stations"""
+        thetas = _thetas(THETA_STEP)
+        along = np.stack(
+            [np.sin(self.azimuth + thetas), np.cos(self.azimuth + thetas)], axis=1
+        )
+        psi = model.k0 * (along @ self.xy.T)
+        if delta is None or not delta.any():
+            return np.exp(-1j * psi)
+
+        # the kernels turn slowly with the direction, interpolate them
+        coarse = _thetas(THETA_COARSE)
+        pert = np.array(
+            [
+                [g @ delta for g in model.sensitivity(self.xy, self.azimuth + t)]
+                for t in coarse
+            ]
+        )
+        pos = np.clip(
+            (thetas - coarse[0]) / np.radians(THETA_COARSE), 0, len(coarse) - 1
+        )
+        lo = np.minimum(pos.astype(int), len(coarse) - 2)
+        frac = (pos - lo)[:, None, None]
+        gphase, gamp = np.moveaxis((1 - frac) * pert[lo] + frac * pert[lo + 1], 1, 0)
+        return np.exp(gamp - 1j * (psi + gphase))
+
+    def predict(self, model: _Model, delta, params=None, jacobian=False):
+        """predicted field, with the complex derivatives to the wave
+        parameters and to the node perturbations when `jacobian`"""
+        pred = np.zeros(len(self.xy), complex)
+        dwave, dvel = [], 0
+        for amp, phi, theta in self.params if params is None else params:
+            azimuth = self.azimuth + theta
+            along = np.array([np.sin(azimuth), np.cos(azimuth)])
+            gphase, gamp = model.sensitivity(self.xy, azimuth)
+            psi = phi + model.k0 * (self.xy @ along) + gphase @ delta
+            wave = np.exp(gamp @ delta - 1j * psi)
+            pred += amp * wave
+            if jacobian:
+                dalong = np.array([np.cos(azimuth), -np.sin(azimuth)])
+                dpsi = model.k0 * (self.xy @ dalong)
+                dwave += [wave, -1j * amp * wave, -1j * amp * wave * dpsi]
+                dvel = dvel + (amp * wave)[:, None] * (gamp - 1j * gphase)
+        if not jacobian:
+            return pred
+        return pred, np.column_stack(dwave), dvel
+
+    def residual(self, model: _Model, delta, params=None) -> np.ndarray:
+        return _real(self.obs - self.predict(model, delta, params))
+
+    def linear(self, model: _Model, delta, sigma):
+        """jacobians to the wave parameters and to the nodes and the
+        residual, weighted by 1 / `sigma`"""
+        pred, dwave, dvel = self.predict(model, delta, jacobian=True)
+        return (
+            _real(dwave) / sigma,
+            _real(dvel) / sigma,
+            _real(self.obs - pred) / sigma,
+        )
+
+    def normal(self, model: _Model, delta, sigma) -> _System:
+        jw, jv, r = self.linear(model, delta, sigma)
+
+        nww = jw.T @ jw + np.diag(self.prior_inv)
+        bw = jw.T @ r - self.prior_inv * (self.params - self.prior).ravel()
+        nvw = jv.T @ jw
+        nww_inv = linalg.inv(nww)
+        schur = nvw @ nww_inv
+        return _System(
+            nvv=jv.T @ jv - schur @ nvw.T,
+            bv=jv.T @ r - schur @ bw,
+            nvw=nvw,
+            nww_inv=nww_inv,
+            bw=bw,
+            residual=r * sigma,
+        )
+
+    def summary(self, model: _Model, delta) -> dict:
+        row = {"event": self.name, "nsta": len(self.xy)}
+        for i, (amp, phi, theta) in enumerate(self.params, 1):
+            row[f"amp{i}"] = amp
+            row[f"phase{i}"] = phi
+            row[f"theta{i}"] = np.degrees(theta)
+        row["misfit"] = _rms([self.residual(model, delta)])
+        return row
+
+    def residual_table(self, model: _Model, delta) -> pd.DataFrame:
+        pred = self.predict(model, delta)
+        station = {} if self.station is None else {"station": self.station}
+        return pd.DataFrame(
+            station
+            | {
+                "lon": self.lon,
+                "lat": self.lat,
+                # observed minus predicted phase time and ln amplitude
+                "time": np.angle(pred * self.obs.conj()) / model.omega,
+                "amp": np.log(np.abs(self.obs) / np.abs(pred)),
+            }
+        )
+
+
+def _lsmr_step(linear, fits, delta, sigma_v):
+    """Gauss-Newton step of the nodes and of every wave by LSMR
+
+    The rows are the weighted residuals of each event, the a priori
+    bounds of its waves and the damping of the nodes. Wave columns only
+    meet the rows of their event, so the matrix is block sparse.
+    """
+    n = len(delta)
+    jv_blocks, jw_blocks, rhs = [], [], []
+    for (jw, jv, r), fit in zip(linear, fits, strict=True):
+        jv = np.where(np.abs(jv) >= SPARSE_DROP * np.abs(jv).max(), jv, 0)
+        prior = np.sqrt(fit.prior_inv)
+        jv_blocks += [sparse.csr_array(jv), sparse.csr_array((len(prior), n))]
+        jw_blocks.append(np.vstack([jw, np.diag(prior)]))
+        rhs += [r, -prior * (fit.params - fit.prior).ravel()]
+
+    nw = sum(b.shape[1] for b in jw_blocks)
+    design = sparse.vstack(
+        [
+            sparse.hstack([sparse.vstack(jv_blocks), sparse.block_diag(jw_blocks)]),
+            sparse.hstack([sparse.eye_array(n) / sigma_v, sparse.csr_array((n, nw))]),
+        ],
+        format="csc",
+    )
+    rhs.append(-delta / sigma_v)
+
+    # unit columns, the wave parameters differ by orders of magnitude
+    scale = 1 / np.sqrt(design.multiply(design).sum(axis=0))
+    design = design @ sparse.diags_array(scale)
+    # the system gets ill-conditioned as the misfit drops, allow many iterations
+    x = lsmr(
+        design,
+        np.concatenate(rhs),
+        atol=1e-10,
+        btol=1e-10,
+        maxiter=LSMR_ITERATIONS * design.shape[1],
+    )[0]
+    x *= scale
+
+    splits = np.cumsum([b.shape[1] for b in jw_blocks])[:-1]
+    wave_steps = [w.reshape(-1, 3) for w in np.split(x[n:], splits)]
+    return x[:n], wave_steps
+
+
+def _thetas(step) -> np.ndarray:
+    return np.radians(np.arange(-THETA_MAX, THETA_MAX + step / 2, step))
+
+
+def _search_waves(obs, basis, waves) -> np.ndarray:
+    """best directions of `_thetas(THETA_STEP)`, given the waves of unit
+    amplitude along them, the complex amplitudes being linear"""
+    thetas = _thetas(THETA_STEP)
+    norm = (np.abs(basis) ** 2).sum(axis=1)
+    q = basis.conj() @ obs
+    power = np.vdot(obs, obs).real
+
+    if waves == 1:
+        best = np.argmax(np.abs(q) ** 2 / norm)
+        coefs, picked = [q[best] / norm[best]], [best]
+    else:
+        # solve [[na, g], [g*, nb]] c = [qa, qb] for every pair of directions
+        a, b = np.triu_indices(len(thetas), k=2)
+        g = (basis.conj() @ basis.T)[a, b]
+        det = norm[a] * norm[b] - np.abs(g) ** 2
+        ca = (norm[b] * q[a] - g * q[b]) / det
+        cb = (norm[a] * q[b] - g.conj() * q[a]) / det
+        misfit = power - (q[a].conj() * ca + q[b].conj() * cb).real
+        best = np.argmin(misfit)
+        coefs, picked = [ca[best], cb[best]], [a[best], b[best]]
+
+    # stronger wave first, c = amp * exp(-i phase)
+    params = [
+        (abs(c), -np.angle(c), thetas[i]) for c, i in zip(coefs, picked, strict=True)
+    ]
+    return np.array(sorted(params, key=lambda p: -p[0]))
+
+
+def _mean_azimuth(xy, time) -> float:
+    """propagation azimuth of the plane wave fitting the phase times"""
+    design = np.column_stack([np.ones(len(xy)), xy])
+    _, sx, sy = np.linalg.lstsq(design, time, rcond=None)[0]
+    return float(np.arctan2(sx, sy))
+
+
+def _real(z) -> np.ndarray:
+    return np.concatenate([z.real, z.imag])
+
+
+def _trial_residual(model, delta, scale, fit, wave_step) -> np.ndarray:
+    """residual of `fit` with a `scale` of its wave parameter step"""
+    return fit.residual(model, delta, fit.params + scale * wave_step)
+
+
+def _rms(residuals) -> float:
+    residuals = [np.asarray(r) for r in residuals]
+    total = sum(float(r @ r) for r in residuals)
+    return float(np.sqrt(total / max(sum(len(r) for r in residuals), 1)))
@@ -17,6 +17,29 @@ def make_eqlist(sac_dir: Path, evt_df, sta_df, region, nsta, eqlist):
     return eqlist
 
 
+def update_eqlist(eqlist: Path, stations: Dict[str, List[str]], outfile: Path):
+    """eqlist of only the given stations of the given events
+
+    Parameters:
+        eqlist: eqlist of `make_eqlist`
+        stations: kept station names of every kept event
+        outfile: the updated eqlist, e.g. `eqlistper{per}.update`
+    """
+    sac_dir, sacs = Path(), {}
+    for line in Path(eqlist).read_text().splitlines()[1:]:
+        cols = line.split()
+        # `    {nsta} {i}` starts the block of an event
+        if len(cols) != 1:
+            continue
+        # `{sac_dir}/{evt}/{evt}.{sta}.LHZ.sac`
+        sac = Path(cols[0])
+        sac_dir, evt = sac.parent.parent, sac.parent.name
+        if sac.name.split(".")[1] in stations.get(evt, ()):
+            sacs.setdefault(evt, []).append(sac.name)
+    _write_eqlists(sac_dir, sacs, Path(outfile))
+    return outfile
+
+
 ###############################################################################
 
 
@@ -48,11 +71,13 @@ def _write_eqlists(sac_dir: Path, temppers: Dict[str, List[str]], eqlist: Path):
         # first line
         f.write(f"{len(temppers)}\n")
         contents = (
-            f"    {len(files)} {i}\n" + "\n".join(f"{sac_dir / evt / f}" for f in files)
+            "\n".join(
+                [f"    {len(files)} {i}"] + [str(sac_dir / evt / f) for f in files]
+            )
             for i, (evt, files) in enumerate(sorted(temppers.items()), 1)
         )
         # contents
-        f.write("\n".join("\n".join([header] + paths) for header, *paths in contents))
+        f.write("\n".join(contents))
 
 
 def _find_events(evt_df: pd.DataFrame, sac_dir: Path) -> list:
@@ -61,7 +86,9 @@ def _find_events(evt_df: pd.DataFrame, sac_dir: Path) -> list:
     that are in both file_name and dir_name.
     """
     sac_events = {d.name for d in sac_dir.iterdir() if d.is_dir()}
-    return evt_df[evt_df["time"]].is_in(sac_events)["time"].to_list()
+    # event dirs are named by the origin time, same as `make_pathfile`
+    codes = pd.to_datetime(evt_df["time"], utc=True).dt.strftime("%Y%m%d%H%M")
+    return [code for code in codes if code in sac_events]
 
 
 def _find_stations(sta_df: pd.DataFrame, region):
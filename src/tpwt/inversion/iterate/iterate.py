@@ -1,10 +1,138 @@
-def inverse_iter(method):
-    iter1()
-    iter2()
+import pandas as pd
 
+from tpwt import trace
 
-def iter1():
-    raise NotImplementedError
+from .engine import TPWTResult, invert_tpwt, load_events, read_eqlist, read_nodes
+from .eqlist import update_eqlist
+from .reject import apply_rejection, kept_stations, reject_bad_data
+from .result import write_result
 
+# plane waves per event of every method
+METHOD_WAVES = {"TPWT": 2, "OPWT": 1}
 
-def iter2(): ...
+
+@trace.traced()
+def inverse_iter(cfg, method, pre_files, periods=None):
+    """invert every period one after another
+
+    Parameters:
+        cfg: tpwt config
+        method: inversion method
+        pre_files: eqlist, gridnode and stationid from `make_pre_files`
+        periods: periods to invert, default all periods of cfg
+    """
+    for period in periods or cfg.periods():
+        invert_period(cfg, period, method, pre_files)
+
+
+def invert_period(cfg, period, method, pre_files, sec_dir=None):
+    """invert one period, independent of all other periods
+
+    The first iteration starts from the reference velocity of the period
+    and is kept in `per{period}/iter1`. Bad records and events are then
+    rejected on its residuals, see `reject_bad_data`. The second one
+    starts from the average velocity of the first, with kernels of that
+    velocity, and is written to `per{period}`.
+
+    Parameters:
+        cfg: tpwt config
+        period: the period
+        method: inversion method
+        pre_files: eqlist, gridnode and stationid from `make_pre_files`
+        sec_dir: ph and amp grids of the period, default `cfg.sec_path`
+
+    Returns:
+        the period
+    """
+    inverse = cfg.params["inverse"]
+    with trace.span("invert_period", cat="period", period=period):
+        events, nodes, vel = period_inputs(cfg, period, pre_files, sec_dir)
+        invert_twice(
+            events,
+            nodes,
+            period,
+            vel,
+            inverse["smooth"],
+            inverse["damping"],
+            cfg.region.to_list(),
+            cfg.tpwt_path() / f"per{period:g}",
+            cuts=rejection_cuts(cfg),
+            eqlist=pre_files[0],
+            **engine_options(cfg, method),
+        )
+    return period
+
+
+def period_inputs(cfg, period, pre_files, sec_dir=None):
+    """events, nodes and reference velocity of one period"""
+    eqlist, gridnode, _ = pre_files
+    nodes = read_nodes(gridnode)
+    sta_df = pd.read_csv(cfg.paths["sta_csv"])
+    sec_dir = sec_dir or cfg.sec_path(period)
+    events = load_events(sec_dir, read_eqlist(eqlist), sta_df)
+    return events, nodes, dict(cfg.model["phvs"])[period]
+
+
+def engine_options(cfg, method) -> dict:
+    """`invert_tpwt` options of the config, the same for every period"""
+    return {
+        "waves": METHOD_WAVES[method],
+        "solver": cfg.valid_solver(),
+        "cache_dir": cfg.outpath / "sens",
+    }
+
+
+def rejection_cuts(cfg) -> dict:
+    """`reject_bad_data` cuts of the config, `tcut` and `stacut` default
+    to the tmisfit and nsta thresholds"""
+    params = cfg.params
+    threshold = params["threshold"]
+    return {
+        "ampcut": params["ampcut"],
+        "tcut": params.get("tcut", threshold["tmisfit"]),
+        "stacut": params.get("stacut", threshold["nsta"]),
+        "tevtrmscut": params.get("tevtrmscut"),
+        "ampevtrmscut": params.get("ampevtrmscut"),
+    }
+
+
+def invert_twice(
+    events,
+    nodes,
+    period,
+    vel,
+    smooth,
+    damping,
+    region,
+    out_dir,
+    *,
+    cuts=None,
+    eqlist=None,
+    **options,
+) -> TPWTResult:
+    """first iteration from `vel` into `out_dir/iter1`, second from its
+    average over `region` into `out_dir`
+
+    With `cuts`, the second iteration only has the records and events
+    kept by `reject_bad_data`, the reasons are written to
+    `rejected.{period}.csv` and, with `eqlist`, the kept stations to
+    `eqlistper{period}.update`.
+
+    Returns:
+        result of the second iteration
+    """
+    result = invert_tpwt(events, nodes, period, vel, smooth, damping, **options)
+    write_result(result, out_dir / "iter1", smooth, damping, region)
+
+    if cuts is not None:
+        masks, table = reject_bad_data(result.residuals, **cuts)
+        table.to_csv(out_dir / f"rejected.{period:g}.csv", index=False)
+        if eqlist is not None:
+            stations = kept_stations(result.residuals, masks)
+            update_eqlist(eqlist, stations, out_dir / f"eqlistper{period:g}.update")
+        events = apply_rejection(events, masks)
+
+    avgvel, _ = result.average(region)
+    result = invert_tpwt(events, nodes, period, avgvel, smooth, damping, **options)
+    write_result(result, out_dir, smooth, damping, region)
+    return result
@@ -3,19 +3,18 @@ from typing import Tuple
 
 import pandas as pd
 
-from tpwt import TPWTConfig
+from tpwt import TPWTConfig, trace
 
 from .eqlist import make_eqlist
 from .grid_nodes import make_gridnode
 
 
+@trace.traced()
 def make_pre_files(cfg: TPWTConfig) -> Tuple[Path, Path, Path]:
     # make inversion grid nodes file
     gridnode = cfg.outpath / "inverse_node"
     dgrids = cfg.region.dgrids()
-    make_gridnode(
-        region=cfg.region.to_list(expand=0.5), dgrids=dgrids, outfile=gridnode
-    )
+    make_gridnode(region=cfg.region, dgrids=dgrids, outfile=gridnode)
 
     # read station df
     sta_df = pd.read_csv(cfg.paths["sta_csv"])
@@ -34,8 +33,8 @@ def make_pre_files(cfg: TPWTConfig) -> Tuple[Path, Path, Path]:
         cfg.paths["sac_dir"],
         evt_df,
         sta_df,
-        cfg.region.to_list(),
-        cfg.params["nsta"],
+        cfg.region,
+        cfg.params["threshold"]["nsta"],
         eqlist,
     )
     return eqlist, gridnode, stationid
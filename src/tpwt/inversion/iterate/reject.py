@@ -0,0 +1,116 @@
+"""
+Bad record and event rejection between the two iterations
+
+Native replacement of `find_bad_kern100` / `find_bad_kern300`, working on
+the residuals of the first iteration held in memory:
+
+    - records with |time residual| > `tcut` s or |amplitude residual| >
+      `ampcut` are dropped, amplitude residuals being obs / pred - 1
+    - events with an rms time residual > `tevtrmscut` s or an rms
+      amplitude residual > `ampevtrmscut` are dropped, both optional
+    - events left with fewer than `stacut` records are dropped
+
+Time residuals come from phase residuals, within half a period.
+
+Examples:
+    ```python
+    from tpwt.inversion.iterate.reject import apply_rejection, reject_bad_data
+
+    masks, table = reject_bad_data(result.residuals, ampcut=2, tcut=8, stacut=10)
+    events = apply_rejection(events, masks)
+    ```
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .engine import EventData
+
+
+def reject_bad_data(
+    residuals: Dict[str, pd.DataFrame],
+    *,
+    ampcut: float,
+    tcut: float,
+    stacut: int,
+    tevtrmscut: Optional[float] = None,
+    ampevtrmscut: Optional[float] = None,
+) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+    """records and events to keep
+
+    Parameters:
+        residuals: residual tables of every event, `TPWTResult.residuals`
+        ampcut: max |amplitude residual| of a record
+        tcut: max |time residual| of a record in s
+        stacut: min records of an event
+        tevtrmscut: max rms time residual of an event in s
+        ampevtrmscut: max rms amplitude residual of an event
+
+    Returns:
+        boolean mask of the kept records of every kept event, and a table
+        of every event with its residuals, record counts and the reason
+        it was rejected, empty if kept
+    """
+    if not residuals:
+        return {}, pd.DataFrame(columns=["event", "nsta", "kept", "reason"])
+
+    df = pd.concat(residuals, names=["event", "record"]).reset_index("event")
+    df["amp"] = np.expm1(df["amp"])
+    df["bad_time"] = df["time"].abs() > tcut
+    df["bad_amp"] = df["amp"].abs() > ampcut
+    df["keep"] = ~(df["bad_time"] | df["bad_amp"])
+
+    table = df.groupby("event", sort=False).agg(
+        nsta=("keep", "size"),
+        kept=("keep", "sum"),
+        bad_time=("bad_time", "sum"),
+        bad_amp=("bad_amp", "sum"),
+        time_rms=("time", _rms),
+        amp_rms=("amp", _rms),
+    )
+
+    reasons = [(table["kept"] < stacut, f"fewer than {stacut} stations")]
+    if tevtrmscut is not None:
+        reasons.append((table["time_rms"] > tevtrmscut, f"time rms > {tevtrmscut}"))
+    if ampevtrmscut is not None:
+        reasons.append((table["amp_rms"] > ampevtrmscut, f"amp rms > {ampevtrmscut}"))
+    table["reason"] = [
+        "; ".join(text for (bad, text) in reasons if bad.iloc[i])
+        for i in range(len(table))
+    ]
+
+    good = table.index[table["reason"] == ""]
+    keep = df.groupby("event", sort=False)["keep"]
+    masks = {evt: mask.to_numpy() for evt, mask in keep if evt in good}
+    return masks, table.reset_index()
+
+
+def apply_rejection(
+    events: List[EventData], masks: Dict[str, np.ndarray]
+) -> List[EventData]:
+    """kept events with their kept records"""
+    return [
+        EventData(
+            evt.name,
+            *(getattr(evt, c)[mask] for c in ("lon", "lat", "time", "amp")),
+            station=None if evt.station is None else evt.station[mask],
+        )
+        for evt in events
+        if (mask := masks.get(evt.name)) is not None
+    ]
+
+
+def kept_stations(residuals, masks) -> Dict[str, List[str]]:
+    """names of the kept stations of every kept event, for `update_eqlist`"""
+    return {
+        evt: residuals[evt]["station"][mask].to_list() for evt, mask in masks.items()
+    }
+
+
+###############################################################################
+
+
+def _rms(x) -> float:
+    return float(np.sqrt(np.mean(np.square(x))))
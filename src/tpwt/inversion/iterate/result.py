@@ -1,4 +1,100 @@
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
 
-def collect_results(tpwt_path: Path): ...
+from tpwt import trace
+
+from .engine import TPWTResult
+from .grid import GRID_SPACING, grid_velocities
+
+
+def write_result(result: TPWTResult, out_dir: Path, smooth, damping, region=None):
+    """write `velarea.{per}.1.{smooth}.{damp}` and `covar.{...}` of one period
+
+    The first line of velarea is `period avgvel avgstd` over `region`,
+    then `lat lon vel std` of every node. covar is the number of nodes
+    then the covariance matrix in (km/s)².
+
+    Parameters:
+        result: inversion of the period
+        out_dir: output dir
+        smooth: smoothing length of the inversion
+        damping: damping of the inversion
+        region: [west, east, south, north] of the average, default all nodes
+
+    Returns:
+        path of the velarea file
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    suffix = f"{result.period:g}.1.{smooth:g}.{str(damping)[2:]}"
+
+    avgvel, avgstd = result.average(region)
+    velarea = out_dir / f"velarea.{suffix}"
+    with velarea.open("w") as f:
+        f.write(f"{result.period:g} {avgvel:.4f} {avgstd:.4f}\n")
+        rows = np.column_stack([result.nodes, result.vel, result.std])
+        np.savetxt(f, rows, fmt="%8.2f %8.2f %8.4f %8.4f")
+
+    with (out_dir / f"covar.{suffix}").open("w") as f:
+        f.write(f"{len(result.vel)}\n")
+        np.savetxt(f, result.covar, fmt="%.6e")
+    return velarea
+
+
+@trace.traced()
+def collect_results(
+    tpwt_path: Path, region=None, smooth=None, spacing: float = GRID_SPACING
+) -> pd.DataFrame:
+    """gather the final velarea of every period into `phase_velocities.csv`
+    and their averages into `average_velocities.csv`
+
+    With `region` and `smooth`, the velocities and standard deviations of
+    all periods are also gridded into `phase_velocities.nc`, see
+    `grid_velocities`.
+
+    Parameters:
+        tpwt_path: `TPWTConfig.tpwt_path()`
+        region: [west, east, south, north] of the grid
+        smooth: smoothing length of the inversion in km
+        spacing: grid spacing in degrees
+
+    Returns:
+        period, lat, lon, vel and std of all nodes
+    """
+    tpwt_path = Path(tpwt_path)
+    tables, averages, covars = [], [], []
+    # per{period}/velarea.*, not the ones of iter1
+    for velarea in sorted(tpwt_path.glob("per*/velarea.*")):
+        with velarea.open() as f:
+            period, avgvel, avgstd = map(float, f.readline().split())
+        df = pd.read_csv(
+            velarea, sep=r"\s+", skiprows=1, names=["lat", "lon", "vel", "std"]
+        )
+        df.insert(0, "period", period)
+        tables.append(df)
+        averages.append({"period": period, "vel": avgvel, "std": avgstd})
+        if region is not None and smooth is not None:
+            covar = velarea.with_name(velarea.name.replace("velarea", "covar", 1))
+            covars.append(np.loadtxt(covar, skiprows=1, ndmin=2))
+
+    if not tables:
+        raise FileNotFoundError(f"No velarea in {tpwt_path}/per*")
+    if covars:
+        ds = grid_velocities(
+            [df["period"].iloc[0] for df in tables],
+            tables[0][["lat", "lon"]].to_numpy(),
+            [df["vel"].to_numpy() for df in tables],
+            covars,
+            region,
+            smooth,
+            spacing,
+        )
+        ds.sortby("period").to_netcdf(tpwt_path / "phase_velocities.nc")
+
+    vel_df = pd.concat(tables).sort_values(["period", "lat", "lon"])
+    vel_df.to_csv(tpwt_path / "phase_velocities.csv", index=False)
+    avg_df = pd.DataFrame(averages).sort_values("period")
+    avg_df.to_csv(tpwt_path / "average_velocities.csv", index=False)
+    return vel_df
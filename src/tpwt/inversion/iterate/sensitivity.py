@@ -0,0 +1,221 @@
+"""
+Finite-frequency sensitivity kernels of a plane Rayleigh wave
+
+A synthetic waveform is cut, tapered and transformed in NumPy, and the
+2-D Born kernels of phase and amplitude (Yang & Forsyth, 2006) are
+averaged over its power spectrum and smoothed with a Gaussian of length
+`smooth`.
+
+This is a new kernel model, not a validated drop-in for the `createsac`
++ `sac` + `sensitivity` chain it replaces: `createsac` and `sac_sens` are
+not in this tree, so the waveform below only follows the sac commands
+that were run on it, its pulse time and band are assumed, and the
+`sens*.dat` layout of `write_sensitivity` is not the one `sensitivity`
+wrote. Inversions with these kernels are not comparable number for
+number with those of the binaries.
+
+Kernels are cached in memory and, with `cache_dir`, on disk, keyed by
+(period, velocity rounded to `vel_tol`, smooth). The second iteration of
+a period and parameter sweeps reuse them instead of regenerating.
+
+Examples:
+    ```python
+    from tpwt.inversion.iterate.sensitivity import sensitivity_kernel
+
+    kernel = sensitivity_kernel(25, 3.32, 90, cache_dir="outputs/sens")
+    phase, amp = kernel.sample(x, y)
+    ```
+"""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+from scipy import ndimage, signal
+
+# half width of the kernel grid in km, wider than any array
+EXTENT_KM = 1500.0
+# kernel grid spacing per wavelength
+SAMPLES_PER_WAVELENGTH = 10
+# synthetic waveform: 1 sps, pulse at 900 s, 10 mHz band, assumed as the
+# `createsac` source is not available
+SAC_DELTA = 1.0
+SAC_PULSE = 900.0
+SAC_BAND = 0.01
+# sac: cut 750 1050, taper w 0.1666667, cuterr fillz, cut 0 2000
+SAC_CUT = (750.0, 1050.0)
+SAC_TAPER = 1 / 6
+SAC_LENGTH = 2000.0
+# spectral lines weaker than this part of the peak power are skipped
+MIN_POWER = 1e-3
+
+
+class Kernel(NamedTuple):
+    """phase and amplitude kernels of a wave travelling along +x
+
+    The receiver is at the origin, `x` is along the propagation and `y`
+    across it, both in km. `phase` and `amp` are the phase delay (rad)
+    and ln-amplitude change per km² of a relative velocity perturbation
+    dc/c, on the (y, x) grid.
+    """
+
+    period: float
+    vel: float
+    smooth: float
+    x: np.ndarray
+    y: np.ndarray
+    phase: np.ndarray
+    amp: np.ndarray
+
+    @property
+    def spacing(self) -> float:
+        return float(self.x[1] - self.x[0])
+
+    def sample(self, x, y):
+        """bilinear phase and amplitude kernels at (x, y), 0 outside the grid"""
+        coords = np.stack(
+            [
+                (np.asarray(y) - self.y[0]) / self.spacing,
+                (np.asarray(x) - self.x[0]) / self.spacing,
+            ]
+        )
+        return tuple(
+            ndimage.map_coordinates(k, coords, order=1, mode="constant", cval=0.0)
+            for k in (self.phase, self.amp)
+        )
+
+
+def sensitivity_kernel(
+    period: float,
+    vel: float,
+    smooth: float,
+    *,
+    vel_tol: float = 0.005,
+    cache_dir=None,
+) -> Kernel:
+    """sensitivity kernels of one period, cached
+
+    Parameters:
+        period: period in s
+        vel: reference phase velocity in km/s, rounded to `vel_tol`
+        smooth: Gaussian smoothing length in km
+        vel_tol: velocities closer than this share a kernel
+        cache_dir: also keep the kernels in this dir as `.npz`
+
+    Returns:
+        the kernels, their arrays are read-only as they are shared
+    """
+    vel = round(round(vel / vel_tol) * vel_tol, 6)
+    if cache_dir is not None:
+        cache_dir = str(Path(cache_dir).resolve())
+    return _cached_kernel(float(period), vel, float(smooth), cache_dir)
+
+
+def clear_kernel_cache():
+    """drop the kernels kept in memory, the disk cache is kept"""
+    _cached_kernel.cache_clear()
+
+
+def waveform_spectrum(period: float):
+    """frequencies and amplitude spectrum of the cut and tapered synthetic
+    waveform of `period`, what `sac` wrote with `fft` and `wsp`"""
+    npts = int(SAC_LENGTH / SAC_DELTA) + 1
+    trace = np.zeros(npts)
+    trace[int(SAC_PULSE / SAC_DELTA)] = 1.0
+    f0 = 1 / period
+    band = [max(f0 - SAC_BAND / 2, 1e-4), f0 + SAC_BAND / 2]
+    sos = signal.butter(4, band, btype="bandpass", fs=1 / SAC_DELTA, output="sos")
+    trace = signal.sosfiltfilt(sos, trace)
+
+    # cut and taper, then fill the rest of 0-2000 s with zeros
+    start, stop = (int(t / SAC_DELTA) for t in SAC_CUT)
+    window = trace[start : stop + 1] * _hanning_taper(stop - start + 1, SAC_TAPER)
+    cut = np.zeros(npts)
+    cut[start : stop + 1] = window
+
+    freqs = np.fft.rfftfreq(npts, SAC_DELTA)
+    return freqs, np.abs(np.fft.rfft(cut)) * SAC_DELTA
+
+
+def write_sensitivity(kernel: Kernel, outfile):
+    """write the kernels as `x y phase amp` rows, x varying fastest
+
+    The layout is this module's own, not that of the `sensitivity` binary.
+    """
+    xx, yy = np.meshgrid(kernel.x, kernel.y)
+    rows = np.column_stack(
+        [xx.ravel(), yy.ravel(), kernel.phase.ravel(), kernel.amp.ravel()]
+    )
+    with open(outfile, "w") as f:
+        f.write(f"{len(kernel.x)} {len(kernel.y)} {kernel.spacing:.4f}\n")
+        np.savetxt(f, rows, fmt="%10.3f %10.3f %14.6e %14.6e")
+
+
+###############################################################################
+
+
+@lru_cache(maxsize=64)
+def _cached_kernel(period, vel, smooth, cache_dir) -> Kernel:
+    path = None
+    if cache_dir is not None:
+        path = Path(cache_dir) / f"sens{period:g}s{smooth:g}km_v{vel:.4f}.npz"
+        if path.exists():
+            with np.load(path) as npz:
+                arrays = {k: npz[k] for k in ("x", "y", "phase", "amp")}
+            return _frozen(Kernel(period, vel, smooth, **arrays))
+
+    kernel = _make_kernel(period, vel, smooth)
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # other processes may read the same kernel, never show a partial file
+        tmp = path.with_suffix(f".{os.getpid()}.tmp.npz")
+        np.savez(tmp, x=kernel.x, y=kernel.y, phase=kernel.phase, amp=kernel.amp)
+        tmp.replace(path)
+    return _frozen(kernel)
+
+
+def _make_kernel(period, vel, smooth) -> Kernel:
+    dx = vel * period / SAMPLES_PER_WAVELENGTH
+    n = int(np.ceil(EXTENT_KM / dx))
+    axis = np.arange(-n, n + 1) * dx
+    x, y = np.meshgrid(axis, axis)
+    # distance from the scatterer to the receiver, off the singularity
+    dist = np.maximum(np.hypot(x, y), dx / 2)
+
+    freqs, spectrum = waveform_spectrum(period)
+    power = spectrum**2
+    keep = (power >= MIN_POWER * power.max()) & (freqs > 0)
+    weights = power[keep] / power[keep].sum()
+
+    phase = np.zeros_like(x)
+    amp = np.zeros_like(x)
+    for freq, weight in zip(freqs[keep], weights, strict=True):
+        k = 2 * np.pi * freq / vel
+        # detour of the wave scattered at (x, y) relative to the direct plane wave
+        arg = k * (dist + x) + np.pi / 4
+        scale = weight * -2 * k**2 / np.sqrt(8 * np.pi * k * dist)
+        phase += scale * np.sin(arg)
+        amp += scale * np.cos(arg)
+
+    # exp(-r²/smooth²) is a Gaussian of sigma smooth/√2
+    sigma = smooth / dx / np.sqrt(2)
+    phase = ndimage.gaussian_filter(phase, sigma, mode="constant")
+    amp = ndimage.gaussian_filter(amp, sigma, mode="constant")
+    return Kernel(period, vel, smooth, axis, axis.copy(), phase, amp)
+
+
+def _hanning_taper(npts: int, width: float) -> np.ndarray:
+    taper = np.ones(npts)
+    m = max(int(round(width * npts)), 1)
+    ramp = 0.5 * (1 - np.cos(np.pi * np.arange(m) / m))
+    taper[:m] = ramp
+    taper[-m:] = ramp[::-1]
+    return taper
+
+
+def _frozen(kernel: Kernel) -> Kernel:
+    for arr in (kernel.x, kernel.y, kernel.phase, kernel.amp):
+        arr.flags.writeable = False
+    return kernel
@@ -0,0 +1,138 @@
+"""
+Damping and smoothing sweep
+
+Every (smooth, damping) of a period is inverted as by `invert_period`,
+into its own `TPWTConfig.tpwt_path(smooth, damping)`. Node files,
+eqlists and the `{event}.ph.csv` files are read once per period and
+handed once to every worker of the process pool, and the kernels of the
+reference velocity are made once per smoothing before the inversions
+fan out; the kernels of the second iteration are shared through the
+disk cache.
+
+The misfit and model norm of each inversion are written to
+`{tpwt_path().parent}/lcurve.{period}.csv` for L-curve selection.
+
+Examples:
+    ```python
+    import tpwt
+
+    cfg = tpwt.TPWTConfig(config_toml)
+    table = tpwt.tpwt_sweep(cfg, smooths=[60, 90, 120], dampings=[0.1, 0.2, 0.4])
+    ```
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from tpwt import trace
+
+from .iterate import engine_options, invert_twice, period_inputs, rejection_cuts
+from .sensitivity import sensitivity_kernel
+
+
+@trace.traced()
+def sweep_regularization(
+    cfg,
+    pre_files,
+    smooths: List[float],
+    dampings: List[float],
+    periods: Optional[List[float]] = None,
+    method: Optional[str] = None,
+    max_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """invert every period with every smoothing and damping
+
+    Parameters:
+        cfg: tpwt config
+        pre_files: eqlist, gridnode and stationid from `make_pre_files`
+        smooths: smoothing lengths in km
+        dampings: dampings in km/s
+        periods: periods to invert, default all periods of cfg
+        method: inversion method, default the one of cfg
+        max_workers: processes, default all cpus
+
+    Returns:
+        period, smooth, damping, misfit, norm (rms of dc/c from the
+        average), avgvel and avgstd of every inversion
+    """
+    method = method or cfg.valid_method()
+    region = cfg.region.to_list()
+    # one inversion per process, no threads inside
+    options = dict(engine_options(cfg, method), max_workers=1)
+    options.update(cuts=rejection_cuts(cfg), eqlist=pre_files[0])
+
+    inputs = {}
+    for period in periods or cfg.periods():
+        inputs[period] = period_inputs(cfg, period, pre_files)
+        _, _, vel = inputs[period]
+        for smooth in smooths:
+            sensitivity_kernel(period, vel, smooth, cache_dir=options["cache_dir"])
+
+    rows = []
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_share,
+        initargs=(inputs, region, options),
+    ) as executor:
+        futures = {
+            executor.submit(
+                _sweep_one,
+                period,
+                smooth,
+                damping,
+                cfg.tpwt_path(smooth, damping) / f"per{period:g}",
+            ): (period, smooth, damping)
+            for period in inputs
+            for smooth in smooths
+            for damping in dampings
+        }
+        for future in as_completed(futures):
+            period, smooth, damping = futures[future]
+            rows.append(
+                {"period": period, "smooth": smooth, "damping": damping}
+                | future.result()
+            )
+
+    table = pd.DataFrame(rows).sort_values(["period", "smooth", "damping"])
+    table = table.reset_index(drop=True)
+    for period, df in table.groupby("period"):
+        df.to_csv(cfg.tpwt_path().parent / f"lcurve.{period:g}.csv", index=False)
+    return table
+
+
+###############################################################################
+
+
+# inputs of every period, region and options of a worker, see `_share`
+_SHARED = {}
+
+
+def _share(inputs, region, options):
+    _SHARED.update(inputs=inputs, region=region, options=options)
+
+
+def _sweep_one(period, smooth, damping, out_dir):
+    events, nodes, vel = _SHARED["inputs"][period]
+    region = _SHARED["region"]
+    result = invert_twice(
+        events,
+        nodes,
+        period,
+        vel,
+        smooth,
+        damping,
+        region,
+        out_dir,
+        **_SHARED["options"],
+    )
+    avgvel, avgstd = result.average(region)
+    delta = result.vel / result.vel0 - 1
+    return {
+        "misfit": result.misfits[-1],
+        "norm": float(np.sqrt(np.mean(delta**2))),
+        "avgvel": avgvel,
+        "avgstd": avgstd,
+    }
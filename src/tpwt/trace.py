@@ -0,0 +1,244 @@
+"""
+Wall time, CPU time and peak RSS of the pipeline stages
+
+The RSS is the high-water mark of the whole process (`ru_maxrss`), or
+of the child for binaries. It never drops, so a span also shows the peak
+of every span of its process before it.
+Spans recorded in Rust carry the CPU time of their own thread.
+
+Tracing is off until `enable` is called. Every process then appends its
+spans to `{trace_dir}/{pid}.jsonl` as Chrome trace events, so the spans
+of pool workers are kept without sending them back. The directory is
+passed on to workers and subprocesses through `TPWT_TRACE_DIR`.
+
+Examples:
+    ```python
+    from tpwt import trace
+
+    trace.enable("outputs/trace")
+    with trace.span("ph_amp", cat="stage"):
+        ...
+    trace.export_chrome("outputs/trace", "outputs/trace.json")
+    print(trace.summary("outputs/trace"))
+    ```
+"""
+
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+
+import pandas as pd
+
+ENV = "TPWT_TRACE_DIR"
+
+_lock = threading.Lock()
+_sink = None
+_sink_pid = None
+
+
+def enable(trace_dir):
+    """record spans of this process and of its workers into `trace_dir`,
+    the spans of an earlier trace in it are removed"""
+    trace_dir = Path(trace_dir).resolve()
+    trace_dir.mkdir(parents=True, exist_ok=True)
+    for old in trace_dir.glob("*.jsonl"):
+        old.unlink()
+    os.environ[ENV] = str(trace_dir)
+    _set_core_trace(True)
+
+
+def disable():
+    _drain_core()
+    _set_core_trace(False)
+    os.environ.pop(ENV, None)
+
+
+def enabled() -> bool:
+    return ENV in os.environ
+
+
+@contextmanager
+def span(name: str, cat: str = "stage", **args):
+    """record the wall time, CPU time and process peak RSS of the block
+
+    The CPU time is the one of the whole process, it includes the Rust
+    threads but also other Python threads running at the same time.
+    `process_max_rss_kb` is the peak RSS of the process so far, not of
+    the block.
+    `args` are shown with the span, the block can add more to the
+    yielded dict.
+    """
+    if not enabled():
+        yield args
+        return
+
+    ts, cpu = time.time_ns() // 1000, time.process_time()
+    try:
+        yield args
+    finally:
+        dur = time.time_ns() // 1000 - ts
+        args.setdefault("cpu_ms", round((time.process_time() - cpu) * 1e3, 3))
+        args.setdefault("process_max_rss_kb", _max_rss(resource.RUSAGE_SELF))
+        _drain_core()
+        _write(_event(name, cat, ts, dur, threading.get_native_id(), args))
+
+
+def traced(cat: str = "stage", name=None):
+    """decorator version of `span`, named after the function by default"""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__.lstrip("_"), cat):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def run(args: list, name=None, detail=None, input=None, **kwargs) -> int:
+    """run an external binary as a `binary` span
+
+    The CPU time and peak RSS are the ones of the child, read from
+    `wait4`. `detail` tells what the run worked on, `input` is written
+    to its stdin and `kwargs` go to `subprocess.Popen`.
+
+    Returns:
+        the exit code
+    """
+    name = name or Path(args[0]).name
+    extra = {} if detail is None else {"detail": detail}
+    with span(name, cat="binary", **extra) as info:
+        stdin = subprocess.PIPE if input is not None else None
+        proc = subprocess.Popen(args, stdin=stdin, **kwargs)
+        if input is not None:
+            proc.stdin.write(input.encode())
+            proc.stdin.close()
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        info["cpu_ms"] = round((usage.ru_utime + usage.ru_stime) * 1e3, 3)
+        info["process_max_rss_kb"] = usage.ru_maxrss
+        info["returncode"] = proc.returncode
+    return proc.returncode
+
+
+def load(trace_dir) -> list:
+    """all recorded events, sorted by start time"""
+    events = [
+        json.loads(line)
+        for path in sorted(Path(trace_dir).glob("*.jsonl"))
+        for line in path.read_text().splitlines()
+        if line
+    ]
+    return sorted(events, key=lambda e: e["ts"])
+
+
+def export_chrome(trace_dir, outfile):
+    """write the events as Chrome trace JSON for Perfetto or chrome://tracing"""
+    trace = {"traceEvents": load(trace_dir), "displayTimeUnit": "ms"}
+    Path(outfile).write_text(json.dumps(trace))
+
+
+def summary(trace_dir) -> pd.DataFrame:
+    """count, wall time, CPU time and process peak RSS of every (cat, name)
+
+    The slowest span of each group is listed in `slowest`, which points
+    at the straggling event, period or file.
+    """
+    columns = ["cat", "name", "wall_s", "cpu_s", "process_max_rss_mb", "detail"]
+    df = pd.DataFrame(
+        [
+            (
+                e["cat"],
+                e["name"],
+                e["dur"] / 1e6,
+                e["args"].get("cpu_ms", float("nan")) / 1e3,
+                e["args"].get("process_max_rss_kb", float("nan")) / 1024,
+                _detail(e["args"]),
+            )
+            for e in load(trace_dir)
+        ],
+        columns=columns,
+    )
+    slowest = df.loc[df.groupby(["cat", "name"])["wall_s"].idxmax()]
+    table = df.groupby(["cat", "name"]).agg(
+        count=("wall_s", "size"),
+        wall_total_s=("wall_s", "sum"),
+        wall_mean_s=("wall_s", "mean"),
+        wall_max_s=("wall_s", "max"),
+        cpu_total_s=("cpu_s", "sum"),
+        process_max_rss_mb=("process_max_rss_mb", "max"),
+    )
+    table["slowest"] = slowest.set_index(["cat", "name"])["detail"]
+    return table.sort_values("wall_total_s", ascending=False)
+
+
+###############################################################################
+
+
+def _event(name, cat, ts, dur, tid, args) -> dict:
+    return {
+        "name": name,
+        "cat": cat,
+        "ph": "X",
+        "ts": ts,
+        "dur": dur,
+        "pid": os.getpid(),
+        "tid": tid,
+        "args": args,
+    }
+
+
+def _write(*events):
+    global _sink, _sink_pid
+
+    with _lock:
+        # a forked worker must not share the file object of its parent
+        if _sink is None or _sink_pid != os.getpid():
+            path = Path(os.environ[ENV]) / f"{os.getpid()}.jsonl"
+            _sink, _sink_pid = path.open("a", buffering=1), os.getpid()
+        for event in events:
+            _sink.write(json.dumps(event, default=str) + "\n")
+
+
+def _detail(args: dict) -> str:
+    keys = ("event", "period", "file", "detail")
+    return ", ".join(str(args[k]) for k in keys if k in args)
+
+
+def _max_rss(who) -> int:
+    # high-water mark of the process, kB on Linux
+    return resource.getrusage(who).ru_maxrss
+
+
+def _set_core_trace(on: bool):
+    from tpwt._core import set_trace
+
+    set_trace(on)
+
+
+def _drain_core():
+    """move the spans recorded inside `_core` into the trace"""
+    from tpwt._core import take_trace_events
+
+    events = [
+        _event(name, "rust", ts, dur, tid, _core_args(detail, cpu))
+        for name, detail, ts, dur, tid, cpu in take_trace_events()
+    ]
+    if events and enabled():
+        _write(*events)
+
+
+def _core_args(detail: str, cpu: int) -> dict:
+    # the CPU time of the span's own thread
+    args = {"cpu_ms": cpu / 1e3}
+    if detail:
+        args["detail"] = detail
+    return args
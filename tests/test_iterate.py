@@ -0,0 +1,284 @@
+import time
+
+import numpy as np
+import pytest
+
+from tpwt.inversion.iterate.sensitivity import sensitivity_kernel, waveform_spectrum
+
+
+def test_sensitivity_kernel_ray_limit(tmp_path):
+    period, vel, length = 50, 3.53, 600
+    kernel = sensitivity_kernel(period, vel, 90, cache_dir=tmp_path)
+    # a uniform perturbation upstream delays the phase by -k L, as a ray
+    upstream = (kernel.x >= -length) & (kernel.x <= 0)
+    delay = kernel.phase[:, upstream].sum() * kernel.spacing**2
+
+    freqs, spectrum = waveform_spectrum(period)
+    freq = (freqs * spectrum**2).sum() / (spectrum**2).sum()
+    assert np.isclose(delay, -2 * np.pi * freq / vel * length, rtol=0.1)
+
+    # a close velocity shares the cached kernel
+    assert sensitivity_kernel(period, vel + 0.001, 90, cache_dir=tmp_path) is kernel
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+
+
+def _two_wave_events(n_events, period=25.0, vel=3.5, seed=0):
+    """nodes and events of two plane waves 16° apart at the velocity `vel`"""
+    from tpwt.inversion.iterate.engine import EventData
+
+    rng = np.random.default_rng(seed)
+    lat, lon = np.meshgrid(np.arange(-40, -35.9, 1.0), np.arange(173, 177.1, 1.0))
+    nodes = np.column_stack([lat.ravel(), lon.ravel()])
+    slat, slon = rng.uniform(-39, -37, 30), rng.uniform(174, 176, 30)
+    # km east and north of the centre of the nodes
+    xy = np.radians(
+        np.column_stack([(slon - 175) * np.cos(np.radians(-38)), slat + 38])
+    )
+    xy *= 6371.0
+
+    k0 = 2 * np.pi / period / vel
+    events = []
+    azimuths = np.radians(20 + 360 * np.arange(n_events) / n_events)
+    for i, azimuth in enumerate(azimuths):
+        field = 0
+        for amp, phase, theta in [(1.0, 0.3, 0.0), (0.3, 1.5, np.radians(16))]:
+            along = np.array([np.sin(azimuth + theta), np.cos(azimuth + theta)])
+            field = field + amp * np.exp(-1j * (phase + k0 * xy @ along))
+        time = k0 * xy @ np.array([np.sin(azimuth), np.cos(azimuth)])
+        time = (time - np.angle(field * np.exp(1j * time))) * period / (2 * np.pi)
+        events.append(EventData(f"e{i}", slon, slat, 1000 + time, np.abs(field)))
+    return nodes, events
+
+
+@pytest.mark.parametrize("solver", ["dense", "lsmr"])
+def test_invert_tpwt_two_waves(solver):
+    from tpwt.inversion.iterate.engine import invert_tpwt
+
+    period, vel = 25.0, 3.5
+    nodes, events = _two_wave_events(4, period, vel)
+    # the true waves travel at the reference velocity
+    result = invert_tpwt(
+        events, nodes, period, vel, smooth=80, damping=0.2, solver=solver
+    )
+    assert result.misfits[-1] < 1e-3
+    assert np.allclose(result.vel, vel, atol=0.01)
+    # directions are off the fitted mean azimuth, their separation is exact
+    separation = result.waves["theta2"] - result.waves["theta1"]
+    assert np.allclose(separation, 16, atol=0.1)
+
+
+def test_invert_tpwt_researches_every_event(monkeypatch):
+    from tpwt.inversion.iterate import engine
+
+    nodes, events = _two_wave_events(12, vel=3.4)
+    calls = []
+
+    def research(fit, model, delta):
+        # slow enough for the later events to still be queued
+        time.sleep(0.02)
+        calls.append(fit.name)
+        # several events change, the pass must still reach all of them
+        return fit.name in {"e0", "e5", "e7"}
+
+    monkeypatch.setattr(engine._EventFit, "research", research)
+    result = engine.invert_tpwt(
+        events, nodes, 25.0, 3.5, smooth=80, damping=0.2, n_iter=2, max_workers=4
+    )
+    passes = len(result.misfits) - 1
+    assert passes >= 1
+    assert sorted(calls) == sorted([e.name for e in events] * passes)
+
+
+def test_make_eqlist_finds_events_by_origin_time(tmp_path):
+    from types import SimpleNamespace
+
+    import pandas as pd
+
+    from tpwt.inversion.iterate.eqlist import make_eqlist
+
+    sac_dir = tmp_path / "sac"
+    sacs = {"201602171726": ["S1", "S2", "S3"], "201603010000": ["S1"]}
+    for evt, stas in sacs.items():
+        (sac_dir / evt).mkdir(parents=True)
+        filelist = "\n".join(f"{evt}.{sta}.LHZ.sac" for sta in stas)
+        (sac_dir / evt / "filelist").write_text(filelist)
+    # waveforms of an event missing from the catalog
+    (sac_dir / "201701010000").mkdir()
+    # seconds are dropped from the dir names
+    evt_df = pd.DataFrame(
+        {
+            "time": [
+                "2016-02-17T17:26:30Z",
+                "2016-03-01T00:00:00Z",
+                "2016-05-01T00:00:00Z",
+            ]
+        }
+    )
+    sta_df = pd.DataFrame(
+        {
+            "station": ["S1", "S2", "S3"],
+            "longitude": [173.0, 174.0, 190.0],
+            "latitude": [-40.0, -40.0, -40.0],
+        }
+    )
+    region = SimpleNamespace(west=172, east=179, south=-42, north=-34)
+
+    eqlist = make_eqlist(sac_dir, evt_df, sta_df, region, 2, tmp_path / "eqlist")
+    # S3 is out of the region, 201603010000 keeps fewer than 2 stations
+    assert eqlist.read_text().splitlines() == [
+        "1",
+        "    2 1",
+        str(sac_dir / "201602171726" / "201602171726.S1.LHZ.sac"),
+        str(sac_dir / "201602171726" / "201602171726.S2.LHZ.sac"),
+    ]
+
+
+def test_reject_bad_data():
+    import pandas as pd
+
+    from tpwt.inversion.iterate.reject import reject_bad_data
+
+    n = 12
+    good = pd.DataFrame(
+        {"station": [f"S{i}" for i in range(n)], "time": 0.1, "amp": 0.01}
+    )
+    bad = good.assign(time=[20.0] * 3 + [0.1] * (n - 3))
+    noisy = good.assign(amp=np.log(2.5))
+    masks, table = reject_bad_data(
+        {"good": good, "bad": bad, "noisy": noisy},
+        ampcut=2,
+        tcut=8,
+        stacut=10,
+        ampevtrmscut=1.0,
+    )
+    assert list(masks) == ["good"] and masks["good"].all()
+    reasons = table.set_index("event")["reason"]
+    assert reasons["bad"] == "fewer than 10 stations"
+    assert reasons["noisy"] == "amp rms > 1.0"
+
+
+def test_sweep_regularization(tmp_path):
+    from types import SimpleNamespace
+
+    import pandas as pd
+
+    from tpwt.inversion.iterate.sweep import sweep_regularization
+
+    nodes, events = _two_wave_events(6, vel=3.4)
+    rng = np.random.default_rng(1)
+    gridnode = tmp_path / "inverse_node"
+    gridnode.write_text(f"0\n{len(nodes)}\n")
+    with gridnode.open("a") as f:
+        np.savetxt(f, nodes, fmt="%8.2f")
+    stations = [f"S{j}" for j in range(len(events[0].lon))]
+    pd.DataFrame(
+        {"station": stations, "latitude": events[0].lat, "longitude": events[0].lon}
+    ).to_csv(tmp_path / "sta.csv", index=False)
+    sec = tmp_path / "ph"
+    sec.mkdir()
+    lines = [f"{len(events)}"]
+    for i, evt in enumerate(events):
+        # noise for the loose damping to fit
+        time = evt.time + rng.normal(0, 0.5, len(evt.time))
+        pd.DataFrame(
+            {"lon": evt.lon, "lat": evt.lat, "time": time, "phv": 3.4, "amp": evt.amp}
+        ).to_csv(sec / f"{evt.name}.ph.csv", index=False)
+        lines.append(f"    {len(stations)} {i + 1}")
+        lines += [f"/sac/{evt.name}/{evt.name}.{sta}.LHZ.sac" for sta in stations]
+    (tmp_path / "eqlist").write_text("\n".join(lines))
+
+    def tpwt_path(smooth=80, damping=0.2):
+        return tmp_path / "tpwt" / f"smooth{smooth}_damp{str(damping)[2:]}"
+
+    cfg = SimpleNamespace(
+        params={
+            "inverse": {"smooth": 80, "damping": 0.2},
+            "threshold": {"tmisfit": 8, "nsta": 10},
+            "ampcut": 2,
+        },
+        region=SimpleNamespace(to_list=lambda: [173, 177, -40, -36]),
+        model={"phvs": [[25.0, 3.5]]},
+        paths={"sta_csv": tmp_path / "sta.csv"},
+        outpath=tmp_path,
+        tpwt_path=tpwt_path,
+        sec_path=lambda period: sec,
+        valid_method=lambda: "TPWT",
+        valid_solver=lambda: "dense",
+        periods=lambda: [25.0],
+    )
+    pre_files = (tmp_path / "eqlist", gridnode, None)
+    sweep_regularization(cfg, pre_files, [60, 90], [0.02, 0.5], max_workers=2)
+
+    lcurve = pd.read_csv(tmp_path / "tpwt" / "lcurve.25.csv")
+    columns = ["period", "smooth", "damping", "misfit", "norm", "avgvel", "avgstd"]
+    assert list(lcurve.columns) == columns
+    assert len(lcurve) == 4
+    for _, df in lcurve.groupby("smooth"):
+        tight, loose = df.sort_values("damping").itertuples()
+        # a larger a priori deviation fits better with a rougher model
+        assert loose.misfit < tight.misfit and loose.norm > tight.norm
+    for smooth in (60, 90):
+        for damping in (0.02, 0.5):
+            assert list(tpwt_path(smooth, damping).glob("per25/velarea.*"))
+
+
+def test_grid_velocities():
+    from tpwt.inversion.iterate.grid import _weights, grid_velocities
+
+    nodes = np.array([[0.0, -1.0], [0.0, 1.0], [3.0, 0.0]])
+    covar = np.array([[0.04, 0.01, 0.0], [0.01, 0.09, 0.02], [0.0, 0.02, 0.16]])
+    region = [-1, 1, -1, 1]
+    ds = grid_velocities(
+        [25, 30], nodes, [np.full(3, 3.5), np.full(3, 3.8)], [covar, covar], region, 90
+    )
+    # a constant field stays constant
+    assert np.allclose(ds.vel.sel(period=25), 3.5)
+    assert np.allclose(ds.vel.sel(period=30), 3.8)
+
+    # half of each of the two close nodes it is equidistant to
+    std = ds["std"].sel(period=25, lat=0, lon=0)
+    assert np.isclose(std, np.sqrt(0.25 * (0.04 + 0.09 + 2 * 0.01)), rtol=1e-3)
+    glon, glat = np.meshgrid(ds.lon, ds.lat)
+    w = _weights(glat.ravel(), glon.ravel(), nodes, 90)
+    expected = np.sqrt(np.diag(w @ covar @ w.T)).reshape(glat.shape)
+    assert np.allclose(ds["std"].sel(period=30), expected)
+
+
+def test_collect_results_grid(tmp_path):
+    import pandas as pd
+    import xarray as xr
+
+    from tpwt.inversion.iterate.engine import TPWTResult
+    from tpwt.inversion.iterate.grid import grid_velocities
+    from tpwt.inversion.iterate.result import collect_results, write_result
+
+    lat, lon = np.meshgrid(np.arange(-40, -37.9, 1.0), np.arange(174, 176.1, 1.0))
+    nodes = np.column_stack([lat.ravel(), lon.ravel()])
+    rng = np.random.default_rng(0)
+    results = []
+    for period in (25.0, 30.0):
+        a = rng.normal(0, 0.05, (len(nodes), len(nodes)))
+        result = TPWTResult(
+            period, 3.5, nodes, rng.uniform(3.4, 3.6, len(nodes)), a @ a.T, *[None] * 3
+        )
+        write_result(result, tmp_path / f"per{period:g}", 80, 0.2)
+        results.append(result)
+
+    region = [174, 176, -40, -38]
+    vel_df = collect_results(tmp_path, region=region, smooth=80, spacing=0.5)
+    assert len(vel_df) == 2 * len(nodes)
+    assert list(pd.read_csv(tmp_path / "average_velocities.csv")["period"]) == [25, 30]
+
+    ds = xr.load_dataset(tmp_path / "phase_velocities.nc")
+    expected = grid_velocities(
+        [r.period for r in results],
+        nodes,
+        [r.vel for r in results],
+        [r.covar for r in results],
+        region,
+        80,
+        0.5,
+    )
+    # velarea and covar are written to 4 decimals and 6 digits
+    assert np.allclose(ds.vel, expected.vel, atol=1e-4)
+    assert np.allclose(ds["std"], expected["std"], rtol=1e-4)